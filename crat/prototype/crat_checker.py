@@ -25,6 +25,9 @@
 import sys
 import getopt
 import datetime
+import gzip
+import lzma
+import bz2
 
 def usage(name):
     print("Usage: %s [-v] [-L] -i FILE.cnf -p FILE.crat [-w W1:W2:...:Wn] [-o FILE.crat]" % name)
@@ -33,6 +36,7 @@ def usage(name):
     print("   -w WEIGHTS   Provide colon-separated set of input weights.")
     print("                Each should be between 0 and 100 (will be scaled by 1/100)")
     print("   -o FILE.crat Produce CRAT output file with all hints present")
+    print(" Files with suffix .gz, .xz, or .bz2 are (de)compressed on the fly")
 
 
 ######################################################################################
@@ -60,6 +64,18 @@ def trim(s):
         s = s[:-1]
     return s
 
+# Map from compression suffix to module providing open()
+compressionModules = { 'gz' : gzip, 'xz' : lzma, 'bz2' : bz2 }
+
+# Open file for reading or writing.
+# Files with suffix .gz, .xz, or .bz2 are (de)compressed as they are streamed
+def openFile(fname, mode = 'r'):
+    fields = fname.split('.')
+    if len(fields) > 1 and fields[-1] in compressionModules:
+        cmode = mode if 'b' in mode else mode + 't'
+        return compressionModules[fields[-1]].open(fname, cmode)
+    return open(fname, mode)
+
 
 # Clean up clause.
 # Remove duplicates
@@ -221,7 +237,7 @@ class CnfReader():
         self.failed = False
         self.errorMessage = ""
         try:
-            self.file = open(fname, 'r')
+            self.file = openFile(fname, 'r')
         except Exception:
             self.fail("Could not open file '%s'" % fname)
             return
@@ -305,7 +321,7 @@ class Writer:
         if isNull:
             return
         try:
-            self.outfile = open(fname, 'w')
+            self.outfile = openFile(fname, 'w')
         except:
             print("Couldn't open file '%s'. Aborting" % fname)
             sys.exit(1)
@@ -886,7 +902,7 @@ class Prover:
             self.failProof("Problem with CNF file")
             return
         try:
-            pfile = open(fname)
+            pfile = openFile(fname, 'r')
         except:
             self.failProof("Couldn't open proof file '%s" % fname)
             return
@@ -19,11 +19,27 @@
 
 # Code for reading and generating CNF, order, schedule, and crat proof files
 
+import gzip
+import lzma
+import bz2
+
 def trim(s):
     while len(s) > 0 and s[-1] in '\r\n':
         s = s[:-1]
     return s
 
+# Map from compression suffix to module providing open()
+compressionModules = { 'gz' : gzip, 'xz' : lzma, 'bz2' : bz2 }
+
+# Open file for reading or writing.
+# Files with suffix .gz, .xz, or .bz2 are (de)compressed as they are streamed
+def openFile(fname, mode = 'r'):
+    fields = fname.split('.')
+    if len(fields) > 1 and fields[-1] in compressionModules:
+        cmode = mode if 'b' in mode else mode + 't'
+        return compressionModules[fields[-1]].open(fname, cmode)
+    return open(fname, mode)
+
 tautologyId = 1000 * 1000 * 1000
 
 # Clean up clause.
@@ -109,7 +125,7 @@ class CnfReader():
         else:
             opened = True
             try:
-                self.file = open(fname, 'r')
+                self.file = openFile(fname, 'r')
             except Exception:
                 raise CnfException("Could not open file '%s'" % fname)
         self.clauses = []
@@ -189,7 +205,7 @@ class Writer:
         if isNull:
             return
         try:
-            self.outfile = open(fname, 'w')
+            self.outfile = openFile(fname, 'w')
         except:
             print("Couldn't open file '%s'. Aborting" % fname)
             sys.exit(1)
@@ -0,0 +1,340 @@
+#!/usr/bin/python
+
+#####################################################################################
+# Copyright (c) 2021 Marijn Heule, Randal E. Bryant, Carnegie Mellon University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT
+# NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT
+# OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+########################################################################################
+
+# Benchmark BDD operations on deep parity chains.
+# Compares the recursive functions that bdd.py used previously
+# against the current generator-based versions,
+# evaluated both with an explicit stack and with recursion.
+# Checks that all give the same results and generate the same proof.
+
+import sys
+import getopt
+import datetime
+import os
+import tempfile
+
+import bdd
+import proof
+import resolver
+
+def usage(name):
+    print("Usage: %s [-h] [-n N] [-r REPS]" % name)
+    print("  -h       Print this message")
+    print("  -n N     Number of variables in parity chain (default = 2000)")
+    print("  -r REPS  Number of repetitions of each operation (default = 3)")
+
+#### Previous, recursive versions of BDD operations
+
+def legacyApplyAndJustify(manager, nodeA, nodeB):
+    manager.applyCount += 1
+    # Constant cases.
+    # No justifications required, since all return one of the arguments
+    if nodeA == manager.leaf0 or nodeB == manager.leaf0:
+        return (manager.leaf0, resolver.tautologyId)
+    if nodeA == manager.leaf1:
+        return (nodeB, resolver.tautologyId)
+    if nodeB == manager.leaf1:
+        return (nodeA, resolver.tautologyId)
+    if nodeA == nodeB:
+        return (nodeA, resolver.tautologyId)
+    if nodeA.id == -nodeB.id:
+        # Clause [-A, A] is tautological
+        return (manager.leaf0, resolver.tautologyId)
+
+    if nodeA.id > nodeB.id:
+        nodeA, nodeB = nodeB, nodeA
+    key = ("andj", nodeA.id, nodeB.id)
+    if key in manager.operationCache:
+        return manager.operationCache[key][:2]
+
+    # Mapping from rule names to clause numbers
+    ruleIndex = {}
+    # Mapping from variable names to variable numbers
+    splitVar = min(nodeA.variable, nodeB.variable)
+    highA = nodeA.branchHigh(splitVar)
+    lowA =  nodeA.branchLow(splitVar)
+    highB = nodeB.branchHigh(splitVar)
+    lowB =  nodeB.branchLow(splitVar)
+
+    if highA != lowA:
+        ruleIndex["UHD"] = nodeA.inferTrueDown
+        ruleIndex["ULD"] = nodeA.inferFalseDown
+    if highB != lowB:
+        ruleIndex["VHD"] = nodeB.inferTrueDown
+        ruleIndex["VLD"] = nodeB.inferFalseDown
+
+    (newHigh, andHigh) = legacyApplyAndJustify(manager, highA, highB)
+    ruleIndex["ANDH"] = andHigh
+
+    (newLow, andLow) = legacyApplyAndJustify(manager, lowA, lowB)
+    ruleIndex["ANDL"] = andLow
+
+    if newHigh == newLow:
+        newNode = newHigh
+    else:
+        newNode = manager.findOrMake(splitVar, newHigh, newLow)
+        ruleIndex["WHU"] = newNode.inferTrueUp
+        ruleIndex["WLU"] = newNode.inferFalseUp
+
+    targetClause = resolver.cleanClause([-nodeA.id, -nodeB.id, newNode.id])
+    if targetClause == resolver.tautologyId:
+        justification, clauseList = resolver.tautologyId, []
+    else:
+        comment = "Justification that %s & %s ==> %s" % (nodeA.label(), nodeB.label(), newNode.label())
+        justification, clauseList = manager.andResolver.run(targetClause, ruleIndex, comment)
+    manager.addCacheEntry(key, (newNode, justification,clauseList))
+    manager.cacheJustifyAdded += 1
+    return (newNode, justification)
+
+def legacyApplyAnd(manager, nodeA, nodeB):
+    manager.applyCount += 1
+    # Constant cases.
+    if nodeA == manager.leaf0 or nodeB == manager.leaf0:
+        return manager.leaf0
+    if nodeA == manager.leaf1:
+        return nodeB
+    if nodeB == manager.leaf1:
+        return nodeA
+    if nodeA == nodeB:
+        return nodeA
+    if nodeA.id == -nodeB.id:
+        return manager.leaf0
+
+    if nodeA.id > nodeB.id:
+        nodeA, nodeB = nodeB, nodeA
+    key = ("andnj", nodeA.id, nodeB.id)
+    if key in manager.operationCache:
+        return manager.operationCache[key][0]
+
+    # Mapping from variable names to variable numbers
+    splitVar = min(nodeA.variable, nodeB.variable)
+    highA = nodeA.branchHigh(splitVar)
+    lowA =  nodeA.branchLow(splitVar)
+    highB = nodeB.branchHigh(splitVar)
+    lowB =  nodeB.branchLow(splitVar)
+
+    newHigh = legacyApplyAnd(manager, highA, highB)
+    newLow  = legacyApplyAnd(manager, lowA, lowB)
+
+    if newHigh == newLow:
+        newNode = newHigh
+    else:
+        newNode = manager.findOrMake(splitVar, newHigh, newLow)
+
+    manager.addCacheEntry(key, (newNode, resolver.tautologyId, []))
+    return newNode
+
+def legacyApplyOr(manager, nodeA, nodeB):
+    if manager.complementEdges:
+        # De Morgan's Law
+        return legacyApplyAnd(manager, nodeA.negation(), nodeB.negation()).negation()
+    # Constant cases
+    if nodeA == manager.leaf1:
+        return manager.leaf1
+    if nodeB == manager.leaf1:
+        return manager.leaf1
+    if nodeA == manager.leaf0:
+        return nodeB
+    if nodeB == manager.leaf0:
+        return nodeA
+    if nodeA == nodeB:
+        return nodeA
+    if nodeA.id > nodeB.id:
+        nodeA, nodeB = nodeB, nodeA
+
+    key = ("ornj", nodeA.id, nodeB.id)
+    if key in manager.operationCache:
+        return manager.operationCache[key][0]
+
+    splitVar = min(nodeA.variable, nodeB.variable)
+    highA = nodeA.branchHigh(splitVar)
+    lowA =  nodeA.branchLow(splitVar)
+    highB = nodeB.branchHigh(splitVar)
+    lowB =  nodeB.branchLow(splitVar)
+
+    newHigh = legacyApplyOr(manager, highA, highB)
+    newLow = legacyApplyOr(manager, lowA, lowB)
+    newNode = newHigh if newHigh == newLow else manager.findOrMake(splitVar, newHigh, newLow)
+    manager.addCacheEntry(key, (newNode, resolver.tautologyId,[]))
+    manager.cacheNoJustifyAdded += 1
+    return newNode
+
+# Use clause to provide canonical list of nodes.  Should all be positive
+def legacyEquant(manager, node, clause, topLevel = True):
+    if topLevel:
+        nextc = clause
+        while not nextc.isLeaf():
+            manager.markQuantified(nextc.variable)
+            nextc = nextc.low
+    if node.isLeaf():
+        return node
+    while not clause.isLeaf() and node.variable > clause.variable:
+        clause = clause.low
+    if clause.isLeaf():
+        return node
+    key = ("equant", node.id, clause.id)
+
+    if key in manager.operationCache:
+        return manager.operationCache[key][0]
+
+    newHigh = legacyEquant(manager, node.high, clause, topLevel = False)
+    newLow = legacyEquant(manager, node.low, clause, topLevel = False)
+    quant = node.variable == clause.variable
+    if newHigh == newLow:
+        newNode = newHigh
+    elif quant:
+        newNode = legacyApplyOr(manager, newHigh, newLow)
+    else:
+        newNode = manager.findOrMake(node.variable, newHigh, newLow)
+    manager.addCacheEntry(key, (newNode, resolver.tautologyId,[]))
+    manager.cacheNoJustifyAdded += 1
+    return newNode
+
+# Use clause to provide canonical list of nodes.  Should all be positive
+def legacyUquant(manager, node, clause, topLevel = True):
+    if topLevel:
+        nextc = clause
+        while not nextc.isLeaf():
+            manager.markQuantified(nextc.variable)
+            nextc = nextc.low
+    if node.isLeaf():
+        return node
+    while not clause.isLeaf() and node.variable > clause.variable:
+        clause = clause.low
+    if clause.isLeaf():
+        return node
+    key = ("uquant", node.id, clause.id)
+
+    if key in manager.operationCache:
+        return manager.operationCache[key][0]
+
+    newHigh = legacyUquant(manager, node.high, clause, topLevel = False)
+    newLow = legacyUquant(manager, node.low, clause, topLevel = False)
+    quant = node.variable == clause.variable
+
+    if newHigh == newLow:
+        newNode = newHigh
+    elif quant:
+        newNode = legacyApplyAnd(manager, newHigh, newLow)
+    else:
+        newNode = manager.findOrMake(node.variable, newHigh, newLow)
+
+    manager.addCacheEntry(key, (newNode, resolver.tautologyId,[]))
+    manager.cacheNoJustifyAdded += 1
+    return newNode
+
+# Build BDD representation of parity of variables
+def parity(manager, varList):
+    node = manager.leaf0
+    for var in reversed(varList):
+        node = manager.applyXor(manager.literal(var, 1), node)
+    return node
+
+# Perform operations with one version of the code, returning list of (name, result, seconds)
+# Versions are "legacy", "recursive", and "stack"
+def runOperations(n, version, pname):
+    prover = proof.Prover(pname, writer = sys.stdout, mode = proof.ProverMode.refProof, verbLevel = 0)
+    manager = bdd.Manager(prover = prover, nextNodeId = n + 1, verbLevel = 0, recursive = version == "recursive")
+    varList = [manager.newVariable(1, name = "x%d" % i, id = i, existential = True) for i in range(1, n+1)]
+    evenList = [var for var in varList if var.id % 2 == 0]
+    nodeA = parity(manager, varList)
+    nodeB = parity(manager, varList[1:])
+    clause = manager.buildClause([manager.literal(var, 1) for var in evenList])
+    if version == "legacy":
+        operations = [
+            ("andJustify", lambda: legacyApplyAndJustify(manager, nodeA, nodeB)),
+            ("and",        lambda: legacyApplyAnd(manager, nodeA, nodeB)),
+            ("or",         lambda: legacyApplyOr(manager, nodeA, nodeB)),
+            ("equant",     lambda: legacyEquant(manager, nodeA, clause)),
+            ("uquant",     lambda: legacyUquant(manager, nodeB, clause)),
+        ]
+    else:
+        operations = [
+            ("andJustify", lambda: manager.applyAndJustify(nodeA, nodeB)),
+            ("and",        lambda: manager.applyAnd(nodeA, nodeB)),
+            ("or",         lambda: manager.applyOr(nodeA, nodeB)),
+            ("equant",     lambda: manager.equant(nodeA, clause)),
+            ("uquant",     lambda: manager.uquant(nodeB, clause)),
+        ]
+    results = []
+    for (name, fun) in operations:
+        # Clear cache so that each evaluation traverses full chain
+        manager.clearCache()
+        start = datetime.datetime.now()
+        result = fun()
+        delta = datetime.datetime.now() - start
+        seconds = delta.seconds + 1e-6 * delta.microseconds
+        if type(result) == type((1,2)):
+            result = (result[0].id, result[1])
+        else:
+            result = result.id
+        results.append((name, result, seconds))
+    prover.file.close()
+    return results
+
+def run(name, args):
+    n = 2000
+    reps = 3
+    optlist, args = getopt.getopt(args, "hn:r:")
+    for (opt, val) in optlist:
+        if opt == '-h':
+            usage(name)
+            return
+        elif opt == '-n':
+            n = int(val)
+        elif opt == '-r':
+            reps = int(val)
+    # Recursive evaluation requires several Python frames per level of BDD
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * n + 1000))
+    versions = ["legacy", "recursive", "stack"]
+    times = {}
+    outcomes = {}
+    proofs = {}
+    for version in versions:
+        for r in range(reps):
+            fd, pname = tempfile.mkstemp(suffix = ".qproof")
+            os.close(fd)
+            results = runOperations(n, version, pname)
+            proofs[version] = open(pname).read()
+            os.remove(pname)
+            outcomes[version] = [(opname, result) for (opname, result, seconds) in results]
+            for (opname, result, seconds) in results:
+                key = (opname, version)
+                times[key] = min(times[key], seconds) if key in times else seconds
+    print("Parity chain with %d variables.  Best of %d runs" % (n, reps))
+    print("%-12s %10s %10s %10s %8s" % ("Operation", "Legacy", "Recursive", "Stack", "Speedup"))
+    for (opname, result) in outcomes["legacy"]:
+        tl = times[(opname, "legacy")]
+        ts = times[(opname, "stack")]
+        print("%-12s %10.3f %10.3f %10.3f %8.2f" % (opname, tl, times[(opname, "recursive")], ts, tl / ts if ts > 0 else 0.0))
+    ok = True
+    for version in versions[1:]:
+        if outcomes[version] != outcomes["legacy"]:
+            print("ERROR: Results differ for %s version" % version)
+            ok = False
+        if proofs[version] != proofs["legacy"]:
+            print("ERROR: Proofs differ for %s version" % version)
+            ok = False
+    if ok:
+        print("Results and proofs identical")
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
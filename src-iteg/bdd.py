@@ -23,6 +23,12 @@
 from functools import total_ordering
 
 import sys
+import array
+import itertools
+import fractions
+import random
+import struct
+import mmap
 import resolver
 import proof
 
@@ -39,6 +45,8 @@ class BddException(Exception):
 # Also have quantifier type
 # Quantifier levels are odd for input variables and even for extension variables
 class Quantified:
+    # Allow subclasses to omit per-instance dictionaries
+    __slots__ = ()
     qindex = 0
     qlevel = 0
     isExistential = True
@@ -93,8 +101,11 @@ class Variable(Quantified):
 
 
 class Node(Quantified):
+    __slots__ = ()
     id = 0 # Also serves as identity of ER variable
     variable = None
+    # Support of function, as bit vector indexed by variable Id
+    support = 0
 
     def __init__(self, id, variable):
         self.id = id
@@ -121,10 +132,24 @@ class Node(Quantified):
     def isOne(self):
         return False
 
+    # Support for complement edges
+    # Reference to complement of node
+    def negation(self):
+        return NegatedNode(self)
+
+    # Is this a complemented reference to a node?
+    def isComplemented(self):
+        return False
+
+    # Node referenced, with any complementing removed
+    def regular(self):
+        return self
+
 
 class LeafNode(Node):
     value = None # 0 or 1
     inferValue = None # Number of unit clause asserting its value
+    complement = None # Other leaf.  Set by manager
 
     def __init__(self, value):
         id = resolver.tautologyId if value == 1 else -resolver.tautologyId        
@@ -144,10 +169,24 @@ class LeafNode(Node):
 
     def isOne(self):
         return self.value == 1
+
+    def negation(self):
+        return self.complement
     
     def __str__(self):
         return "leaf-%d" % self.value
 
+# Name for node reference in comments
+def referenceName(id):
+    if id == resolver.tautologyId:
+        return "ONE"
+    elif id == -resolver.tautologyId:
+        return "ZERO"
+    elif id < 0:
+        return "!N%d" % -id
+    else:
+        return "N%d" % id
+
 
 class VariableNode(Node):
     high = None
@@ -157,11 +196,17 @@ class VariableNode(Node):
     inferFalseUp = None
     inferTrueDown = None
     inferFalseDown = None
+    # Complemented reference to node, created on demand
+    complement = None
+    # Number of references from parent nodes.  Set to -1 once node reclaimed
+    refCount = 0
     
     def __init__(self, id, variable, high, low, prover):
         Node.__init__(self, id, variable)
         self.high = high
         self.low = low
+        self.refCount = 0
+        self.support = high.support | low.support | (1 << variable.id)
         # Extension variable must be at higher level than node variable
         # and at least as high as children
         qlevel = max(variable.qlevel+1, high.qlevel, low.qlevel)
@@ -177,8 +222,8 @@ class VariableNode(Node):
             self.inferFalseDown = None
             return
 
-        hname = "ONE" if hid == resolver.tautologyId else "ZERO" if hid == -resolver.tautologyId else "N%d" % hid
-        lname = "ONE" if lid == resolver.tautologyId else "ZERO" if lid == -resolver.tautologyId else "N%d" % lid
+        hname = referenceName(hid)
+        lname = referenceName(lid)
         prover.proveExtend(id, qlevel, "Define extension variable for node %s = ITE(%d, %s, %s).  Qlevel=%d" % (self.label(), vid, hname, lname, self.qlevel))
         blockers = []
         self.inferTrueUp = prover.proveAddBlocked([id, -vid, -hid], blockers, "ITE assertions for node %s" % self.label())
@@ -193,6 +238,11 @@ class VariableNode(Node):
     def isLeaf(self):
         return False
 
+    def negation(self):
+        if self.complement is None:
+            self.complement = NegatedNode(self)
+        return self.complement
+
     def branchHigh(self, variable):
         if self.variable < variable:
             raise BddException("Node at level %d cannot branch on variable at level %d" % 
@@ -229,22 +279,539 @@ class VariableNode(Node):
     def __str__(self):
         return "%d:%s->%s,%s" % (self.id, str(self.variable), self.high.label(), self.low.label())
 
+# Compact storage of BDD nodes.
+# Node attributes are held in parallel typed arrays indexed by node id,
+# rather than as separate Python objects.
+# Clients refer to nodes by their integer ids.
+# StoredNode objects provide a (transient) view of a stored node
+class NodeStore:
+    manager = None
+    # Variable level for each node
+    levels = None
+    # Ids of children (leaves represented by +/- tautologyId)
+    highs = None
+    lows = None
+    qlevels = None
+    # Defining clause Ids.  0 indicates none
+    trueUps = None
+    falseUps = None
+    trueDowns = None
+    falseDowns = None
+    # Reference counts
+    refCounts = None
+    # Support bit vectors.  Arbitrary-precision integers, and so held in list
+    supports = None
+    # Number of bits allotted to each field of a unique table key
+    keyBits = 34
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.levels = array.array('i')
+        self.highs = array.array('i')
+        self.lows = array.array('i')
+        self.qlevels = array.array('i')
+        self.trueUps = array.array('q')
+        self.falseUps = array.array('q')
+        self.trueDowns = array.array('q')
+        self.falseDowns = array.array('q')
+        self.refCounts = array.array('i')
+        self.supports = []
+
+    # Make sure there is a slot for node with given id
+    def allocate(self, id):
+        size = len(self.levels)
+        if id < size:
+            return
+        extra = max(id + 1, 2 * size) - size
+        for arr in [self.levels, self.highs, self.lows, self.qlevels,
+                    self.trueUps, self.falseUps, self.trueDowns, self.falseDowns, self.refCounts]:
+            arr.extend(itertools.repeat(0, extra))
+        self.supports.extend(itertools.repeat(0, extra))
+
+    # Encode child reference as nonnegative integer.
+    # Leaves get codes 0 and 1.  Node codes start at 2, so that node 0 is distinct from the leaves
+    def childCode(self, id):
+        if id == -resolver.tautologyId:
+            return 0
+        elif id == resolver.tautologyId:
+            return 1
+        elif id < 0:
+            # Complemented reference
+            return 2 * -id + 3
+        else:
+            return 2 * id + 2
+
+    # Pack (level, high, low) into single integer for use as unique table key
+    def packKey(self, level, hid, lid):
+        return (((level << self.keyBits) | self.childCode(hid)) << self.keyBits) | self.childCode(lid)
+
+    # Get node object for id
+    def node(self, id):
+        if id == resolver.tautologyId:
+            return self.manager.leaf1
+        if id == -resolver.tautologyId:
+            return self.manager.leaf0
+        if id < 0:
+            return NegatedNode(StoredNode(-id, self))
+        return StoredNode(id, self)
+
+    def size(self):
+        return len(self.levels)
+
+# View of node held in a NodeStore.
+# Equality and hashing are based on the node id,
+# and so any number of views of a single node can exist.
+# Views carry only the node id and the store
+class StoredNode(Node):
+    __slots__ = ('id', 'store')
+
+    # When variable is None, create view of existing node
+    # Otherwise, create new node
+    def __init__(self, id, store, variable = None, high = None, low = None, prover = None):
+        self.store = store
+        if variable is None:
+            self.id = id
+        else:
+            store.allocate(id)
+            VariableNode.__init__(self, id, variable, high, low, prover)
+
+    # Share operations with VariableNode
+    isLeaf = VariableNode.isLeaf
+    branchHigh = VariableNode.branchHigh
+    branchLow = VariableNode.branchLow
+    clauseIds = VariableNode.clauseIds
+    clauses = VariableNode.clauses
+    __str__ = VariableNode.__str__
+
+    @property
+    def qindex(self):
+        return self.id
+
+    @qindex.setter
+    def qindex(self, value):
+        pass
+
+    @property
+    def isExistential(self):
+        return True
+
+    @isExistential.setter
+    def isExistential(self, value):
+        pass
+
+    @property
+    def variable(self):
+        return self.store.manager.variables[self.store.levels[self.id]-1]
+
+    @variable.setter
+    def variable(self, value):
+        self.store.levels[self.id] = value.level
+
+    @property
+    def high(self):
+        return self.store.node(self.store.highs[self.id])
+
+    @high.setter
+    def high(self, value):
+        self.store.highs[self.id] = value.id
+
+    @property
+    def low(self):
+        return self.store.node(self.store.lows[self.id])
+
+    @low.setter
+    def low(self, value):
+        self.store.lows[self.id] = value.id
+
+    @property
+    def qlevel(self):
+        return self.store.qlevels[self.id]
+
+    @qlevel.setter
+    def qlevel(self, value):
+        self.store.qlevels[self.id] = value
+
+    @property
+    def inferTrueUp(self):
+        return self.store.trueUps[self.id] or None
+
+    @inferTrueUp.setter
+    def inferTrueUp(self, value):
+        self.store.trueUps[self.id] = 0 if value is None else value
+
+    @property
+    def inferFalseUp(self):
+        return self.store.falseUps[self.id] or None
+
+    @inferFalseUp.setter
+    def inferFalseUp(self, value):
+        self.store.falseUps[self.id] = 0 if value is None else value
+
+    @property
+    def inferTrueDown(self):
+        return self.store.trueDowns[self.id] or None
+
+    @inferTrueDown.setter
+    def inferTrueDown(self, value):
+        self.store.trueDowns[self.id] = 0 if value is None else value
+
+    @property
+    def inferFalseDown(self):
+        return self.store.falseDowns[self.id] or None
+
+    @inferFalseDown.setter
+    def inferFalseDown(self, value):
+        self.store.falseDowns[self.id] = 0 if value is None else value
+
+    @property
+    def refCount(self):
+        return self.store.refCounts[self.id]
+
+    @refCount.setter
+    def refCount(self, value):
+        self.store.refCounts[self.id] = value
+
+    @property
+    def support(self):
+        return self.store.supports[self.id]
+
+    @support.setter
+    def support(self, value):
+        self.store.supports[self.id] = value
+
+# Complemented reference to a node.
+# Represents ITE(var, !high, !low), using the negated extension variable of the node.
+# The defining clauses of the node serve as those for its complement,
+# with the roles of the upward and downward clauses exchanged.
+class NegatedNode(Node):
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        self.node = node
+
+    # Share operations with VariableNode
+    isLeaf = VariableNode.isLeaf
+    branchHigh = VariableNode.branchHigh
+    branchLow = VariableNode.branchLow
+    clauseIds = VariableNode.clauseIds
+    clauses = VariableNode.clauses
+    __str__ = VariableNode.__str__
+
+    def negation(self):
+        return self.node
+
+    def isComplemented(self):
+        return True
+
+    def regular(self):
+        return self.node
+
+    def label(self):
+        return "!N%d" % self.node.id
+
+    @property
+    def id(self):
+        return -self.node.id
+
+    @property
+    def qindex(self):
+        return self.id
+
+    @property
+    def isExistential(self):
+        return True
+
+    @property
+    def variable(self):
+        return self.node.variable
+
+    @property
+    def high(self):
+        return self.node.high.negation()
+
+    @property
+    def low(self):
+        return self.node.low.negation()
+
+    @property
+    def qlevel(self):
+        return self.node.qlevel
+
+    @property
+    def support(self):
+        return self.node.support
+
+    @property
+    def inferTrueUp(self):
+        return self.node.inferTrueDown
+
+    @property
+    def inferFalseUp(self):
+        return self.node.inferFalseDown
+
+    @property
+    def inferTrueDown(self):
+        return self.node.inferTrueUp
+
+    @property
+    def inferFalseDown(self):
+        return self.node.inferFalseUp
+
+# Fixed-capacity, lossy operation cache.
+# Direct mapped: each key hashes to a single slot,
+# and inserting a new entry evicts any entry already in its slot.
+# Supports the subset of dictionary operations used by the manager.
+# Entries have form (result, justification, clauseList).
+# Proof clauses of evicted entries are held until the manager reaches
+# a point where they can safely be deleted, since they may still be needed
+# to complete a justification in progress.
+class ComputedTable:
+    capacity = 0
+    keyList = []
+    valueList = []
+    # Number of occupied slots
+    count = 0
+    # Mapping from operation name to integer code.  Used in hashing
+    opCodes = {}
+    # Statistics, indexed by operation name
+    hitCounts = {}
+    missCounts = {}
+    evictionCounts = {}
+    # Proof clauses from evicted entries
+    pendingClauses = []
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise BddException("Invalid operation cache capacity %d" % capacity)
+        self.capacity = capacity
+        self.opCodes = {}
+        self.hitCounts = {}
+        self.missCounts = {}
+        self.evictionCounts = {}
+        self.pendingClauses = []
+        self.clear()
+
+    def clear(self):
+        self.keyList = [None] * self.capacity
+        self.valueList = [None] * self.capacity
+        self.count = 0
+
+    # Keys have form (opName, id1, id2, ...).
+    # Avoid hashing opName, since string hashes vary from run to run
+    def slot(self, key):
+        op = key[0]
+        code = self.opCodes.get(op)
+        if code is None:
+            code = len(self.opCodes) + 1
+            self.opCodes[op] = code
+            self.hitCounts[op] = 0
+            self.missCounts[op] = 0
+            self.evictionCounts[op] = 0
+        return (hash(key[1:]) + code * 0x9E3779B1) % self.capacity
+
+    def __contains__(self, key):
+        found = self.keyList[self.slot(key)] == key
+        if found:
+            self.hitCounts[key[0]] += 1
+        else:
+            self.missCounts[key[0]] += 1
+        return found
+
+    def __getitem__(self, key):
+        s = self.slot(key)
+        if self.keyList[s] != key:
+            raise KeyError(key)
+        return self.valueList[s]
+
+    def __setitem__(self, key, value):
+        s = self.slot(key)
+        oldKey = self.keyList[s]
+        if oldKey is None:
+            self.count += 1
+        elif oldKey != key:
+            self.evictionCounts[oldKey[0]] += 1
+            self.pendingClauses += self.valueList[s][2]
+        self.keyList[s] = key
+        self.valueList[s] = value
+
+    def __delitem__(self, key):
+        s = self.slot(key)
+        if self.keyList[s] != key:
+            raise KeyError(key)
+        self.keyList[s] = None
+        self.valueList[s] = None
+        self.count -= 1
+
+    def __len__(self):
+        return self.count
+
+    def keys(self):
+        return [k for k in self.keyList if k is not None]
+
+    # Lookup without recording hit or miss
+    def get(self, key, default = None):
+        s = self.slot(key)
+        return self.valueList[s] if self.keyList[s] == key else default
+
+    # Retrieve proof clauses from evicted entries.
+    def flushEvicted(self):
+        clauseList = self.pendingClauses
+        self.pendingClauses = []
+        return clauseList
+
+    def summarize(self, writer):
+        writer.write("Operation cache: capacity %d, %d entries\n" % (self.capacity, self.count))
+        for op in sorted(self.opCodes.keys()):
+            writer.write("  %s: %d hits, %d misses, %d evictions\n" % (op, self.hitCounts[op], self.missCounts[op], self.evictionCounts[op]))
+
+# Weighted, projected model counting for a single root.
+# Counts over variables in countVars (default = support of root).
+# Variables in support of root but not in countVars are existentially quantified first.
+# Weights given by dictionary mapping literal (+/- variable Id) to weight.
+# Literals not in dictionary have weight 1.
+# Retains per-node counts, so that models can then be sampled
+class ModelCounter:
+    manager = None
+    root = None
+    countVars = []
+    posWeights = []
+    negWeights = []
+    # Total weight of all assignments to variables at positions i and beyond
+    suffixWeights = []
+    # Mapping from variable Id to position in countVars
+    positions = {}
+    # Total weight of assignments to variables at positions i up to j-1, indexed by (i,j)
+    gapWeights = {}
+    # Mapping from node Id to weighted count of assignments to variables from node's position onward
+    counts = {}
+
+    def __init__(self, manager, root, countVars = None, weights = None):
+        self.manager = manager
+        supportVars = manager.getSupportVariables(root)
+        if countVars is None:
+            countVars = supportVars
+        self.countVars = sorted(set(countVars))
+        countIds = set([v.id for v in self.countVars])
+        projectVars = [v for v in supportVars if v.id not in countIds]
+        if len(projectVars) > 0:
+            clause = manager.buildClause([manager.literal(v, 1) for v in projectVars])
+            root = manager.equant(root, clause)
+        self.root = root
+        nvars = len(self.countVars)
+        self.posWeights = [self.weight(weights, v.id) for v in self.countVars]
+        self.negWeights = [self.weight(weights, -v.id) for v in self.countVars]
+        self.suffixWeights = [1] * (nvars+1)
+        for i in range(nvars-1, -1, -1):
+            self.suffixWeights[i] = (self.posWeights[i] + self.negWeights[i]) * self.suffixWeights[i+1]
+        self.positions = { self.countVars[i].id : i for i in range(nvars) }
+        self.gapWeights = {}
+        self.counts = {}
+        for node in manager.getNodeList(root, includeLeaves = False):
+            i = self.position(node)
+            self.counts[node.id] = self.posWeights[i] * self.refCount(node.high, i+1) + self.negWeights[i] * self.refCount(node.low, i+1)
+
+    def weight(self, weights, lit):
+        w = 1 if weights is None or lit not in weights else weights[lit]
+        return w if type(w) == type(1) else fractions.Fraction(w)
+
+    def gap(self, i, j):
+        if (i,j) not in self.gapWeights:
+            w = 1
+            for k in range(i, j):
+                w *= self.posWeights[k] + self.negWeights[k]
+            self.gapWeights[(i,j)] = w
+        return self.gapWeights[(i,j)]
+
+    def position(self, node):
+        if node.isLeaf():
+            return len(self.countVars)
+        return self.positions[node.variable.id]
+
+    # Weighted count of node, when referenced from position i
+    def refCount(self, node, i):
+        if node.isLeaf():
+            return self.suffixWeights[i] if node == self.manager.leaf1 else 0
+        p = self.position(node)
+        count = self.counts[node.regular().id]
+        if node.isComplemented():
+            count = self.suffixWeights[p] - count
+        return self.gap(i, p) * count
+
+    def count(self):
+        return self.refCount(self.root, 0)
+
+    # Choose true with probability numerator/denominator.  Exact, even for large or fractional weights
+    def choose(self, rng, numerator, denominator):
+        f = fractions.Fraction(numerator) / denominator
+        return rng.randrange(f.denominator) < f.numerator
+
+    # Generate single model as list of literals over counting variables.
+    # Requires nonzero count
+    def sample(self, rng):
+        model = []
+        node = self.root
+        i = 0
+        while i < len(self.countVars):
+            p = self.position(node)
+            # Variables skipped by path are free
+            while i < p:
+                if self.choose(rng, self.posWeights[i], self.posWeights[i] + self.negWeights[i]):
+                    model.append(self.countVars[i].id)
+                else:
+                    model.append(-self.countVars[i].id)
+                i += 1
+            if i == len(self.countVars):
+                break
+            vid = self.countVars[i].id
+            highCount = self.posWeights[i] * self.refCount(node.high, i+1)
+            lowCount = self.negWeights[i] * self.refCount(node.low, i+1)
+            if self.choose(rng, highCount, highCount + lowCount):
+                model.append(vid)
+                node = node.high
+            else:
+                model.append(-vid)
+                node = node.low
+            i += 1
+        return model
+
 class Manager:
     prover = None
     writer = None
     # List of variables, ordered by level
     variables = []
+    # Mapping from variable Id to variable
+    variableIds = {}
     nextNodeId = 0
     # Leaf nodes
     leaf0 = None
     leaf1 = None
     # Mapping from (variable, high, low) to node
+    # When using node store, mapping from packed key to node id
     uniqueTable = {}
+    # Optional array-based storage of nodes
+    nodeStore = None
+    # Evaluate operations with recursive function calls, rather than with explicit stack
+    recursive = False
+    # Represent negation by complemented references to nodes.
+    # Canonical form: the high child of every stored node is uncomplemented
+    complementEdges = False
     # Operation cache
-    # Key = (opName, operand1 ...) to (node, justification, clauseList)
+    # Key = (opName, operand1 ...) to (node, justification, clauseList, insertion number)
+    # Either a dictionary or, when cacheSize is given, a ComputedTable
     operationCache = {}
+    cacheSize = None
+    # Index of operation cache entries, so that GC only visits entries affected by reclaimed nodes.
+    # Mapping from node Id to list of keys of cache entries referring to node as operand or result.
+    # Lists are not updated when entries are evicted or removed, and so can hold stale keys
+    cacheRefs = {}
+    # Keys of cache entries whose results are not nonleaf nodes.  Removed by every GC
+    cacheLeafKeys = []
+    # Total length of lists in cacheRefs.  Index gets compacted when too many keys are stale
+    cacheRefCount = 0
+    cacheInsertCount = 0
     verbLevel = 1
     andResolver = None
+    andExistsResolver = None
     orResolver = None
     implyResolver = None
     restrictResolver = None
@@ -253,12 +820,42 @@ class Manager:
     rootGenerator = None
     # Set when have reduced to final BDD
     lastRoot = None
-    # How many quantifications had been performed by last GC?
-    lastGC = 0
-    # How many variables should be quantified to trigger GC?
-    gcThreshold = 4
-    # Dictionary mapping variables to their IDs.
-    # Used to determine when to trigger GC
+    # Nodes are reference counted, based on references from parent nodes.
+    # Nodes whose counts drop to zero are placed in dead queue.
+    # Those that are still unreferenced, and are not roots, get reclaimed at next GC
+    deadQueue = []
+    # Number of nodes in unique table having zero reference count
+    deadCount = 0
+    # Number of unreferenced nodes that survived last GC (because they were roots)
+    gcSurvivors = 0
+    # Trigger GC when this fraction of the nodes have become dead since last GC
+    gcDeadFraction = 0.5
+    # or when unique table grows to this size
+    gcNodeThreshold = 0
+    # Unique table size increase relative to previous GC that triggers next one
+    gcGrowth = 1.5
+    # Don't perform GC with smaller unique table
+    gcMinNodes = 10000
+    # Dynamic variable reordering by sifting.
+    # Nodes get modified in place, and so only allowed when not generating proof
+    reorder = False
+    # Reorder when number of live nodes reaches this value
+    reorderThreshold = 0
+    # Don't reorder with fewer live nodes
+    reorderMinNodes = 5000
+    # Stop moving variable in one direction once table grows by this factor over best size
+    siftGrowth = 1.2
+    # Limits on the work done by one reordering.
+    # Sift at most this many variables
+    siftMaxVars = 1000
+    # Stop sifting once this many level swaps have been performed
+    siftMaxSwaps = 20000
+    # Memoized graph sizes.  Mapping from node Id to number of nodes
+    sizeCache = {}
+    # Memoized combined size, and the set of root Ids for which it was computed
+    combinedSizeKey = None
+    combinedSize = 0
+    # Set of variables that have been quantified
     quantifiedVariableSet = None
     # Statistics
     cacheJustifyAdded = 0
@@ -271,25 +868,53 @@ class Manager:
     cacheRemoved = 0
     nodesRemoved = 0
     gcCount = 0
+    reorderCount = 0
+    swapCount = 0
 
-    def __init__(self, prover = None, rootGenerator = None, nextNodeId = 0, verbLevel = 1):
+    def __init__(self, prover = None, rootGenerator = None, nextNodeId = 0, verbLevel = 1, arrayStore = False, complementEdges = False, cacheSize = None, recursive = False,
+                 reorder = False):
         self.verbLevel = verbLevel
         self.prover = DummyProver() if prover is None else prover
         self.writer = self.prover.writer
         self.rootGenerator = rootGenerator
         self.lastRoot = None
         self.variables = []
+        self.variableIds = {}
         self.leaf0 = LeafNode(0)
         self.leaf1 = LeafNode(1)
-        self.nextNodeId = nextNodeId
+        self.leaf0.complement = self.leaf1
+        self.leaf1.complement = self.leaf0
+        self.complementEdges = complementEdges
+        self.recursive = recursive
+        if reorder and self.prover.mode != proof.ProverMode.noProof:
+            raise BddException("Cannot reorder variables when generating proof")
+        if reorder and arrayStore:
+            raise BddException("Cannot reorder variables held in node store")
+        self.reorder = reorder
+        self.reorderThreshold = self.reorderMinNodes
+        self.sizeCache = {}
+        self.combinedSizeKey = None
+        self.combinedSize = 0
+        # Complemented reference to node 0 would be indistinguishable from node itself
+        self.nextNodeId = max(nextNodeId, 1) if complementEdges else nextNodeId
         self.uniqueTable = {}
-        self.operationCache = {}
+        self.nodeStore = NodeStore(self) if arrayStore else None
+        self.cacheSize = cacheSize
+        self.operationCache = {} if cacheSize is None else ComputedTable(cacheSize)
+        self.cacheRefs = {}
+        self.cacheLeafKeys = []
+        self.cacheRefCount = 0
+        self.cacheInsertCount = 0
         self.andResolver = resolver.AndResolver(prover)
+        self.andExistsResolver = resolver.AndExistsResolver(prover)
         self.orResolver = resolver.OrResolver(prover)
         self.implyResolver = resolver.ImplyResolver(prover)
         self.restrictResolver = resolver.RestrictResolver(prover)
         self.quantifiedVariableSet = set([])
-        self.lastGC = 0
+        self.deadQueue = []
+        self.deadCount = 0
+        self.gcSurvivors = 0
+        self.gcNodeThreshold = self.gcMinNodes
         self.cacheJustifyAdded = 0
         self.cacheNoJustifyAdded = 0
         self.applyCount = 0
@@ -300,16 +925,24 @@ class Manager:
         self.cacheRemoved = 0
         self.nodesRemoved = 0
         self.gcCount = 0
+        self.reorderCount = 0
+        self.swapCount = 0
 
     def newVariable(self, qlevel, name, id = None, existential = False):
         level = len(self.variables) + 1
         var = Variable(level, qlevel, name, id, existential)
         self.variables.append(var)
+        self.variableIds[var.id] = var
         self.variableCount += 1
         self.prover.idToQlevel[id] = qlevel
         return var
         
     def findOrMake(self, variable, high, low):
+        if self.complementEdges and high.id < 0:
+            # Move complement from high child to node reference
+            return self.findOrMake(variable, high.negation(), low.negation()).negation()
+        if self.nodeStore is not None:
+            return self.findOrMakeStored(variable, high, low)
         key = (variable.level, high.id, low.id)
         if key in self.uniqueTable:
             return self.uniqueTable[key]
@@ -319,9 +952,56 @@ class Manager:
             self.nextNodeId += 1
             self.uniqueTable[key] = node
             self.nodeCount += 1
+            self.addNode(node)
+            self.maxLiveCount = max(self.maxLiveCount, len(self.uniqueTable))
+            return node
+
+    # Version of findOrMake when using array-based node store
+    def findOrMakeStored(self, variable, high, low):
+        key = self.nodeStore.packKey(variable.level, high.id, low.id)
+        if key in self.uniqueTable:
+            return self.nodeStore.node(self.uniqueTable[key])
+        else:
+            node = StoredNode(self.nextNodeId, self.nodeStore, variable, high, low, self.prover)
+            self.prover.idToQlevel[node.id] = node.qlevel
+            self.nextNodeId += 1
+            self.uniqueTable[key] = node.id
+            self.nodeCount += 1
+            self.addNode(node)
             self.maxLiveCount = max(self.maxLiveCount, len(self.uniqueTable))
             return node
   
+    # Unique table key for existing node
+    def nodeKey(self, node):
+        if self.nodeStore is not None:
+            return self.nodeStore.packKey(node.variable.level, node.high.id, node.low.id)
+        return (node.variable.level, node.high.id, node.low.id)
+
+    # Reference counting
+    # Newly created node has no references
+    def addNode(self, node):
+        self.addReference(node.high)
+        self.addReference(node.low)
+        self.deadCount += 1
+        self.deadQueue.append(node)
+
+    def addReference(self, node):
+        if node.isLeaf():
+            return
+        node = node.regular()
+        if node.refCount == 0:
+            self.deadCount -= 1
+        node.refCount += 1
+
+    def removeReference(self, node):
+        if node.isLeaf():
+            return
+        node = node.regular()
+        node.refCount -= 1
+        if node.refCount == 0:
+            self.deadCount += 1
+            self.deadQueue.append(node)
+
     def literal(self, variable, phase):
         if phase == 1:
             return self.findOrMake(variable, self.leaf1, self.leaf0)
@@ -428,62 +1108,81 @@ class Manager:
     # Build dictionary mapping nodes in DAG rooted by node to values
     # nodeFunction should be a function mapping a node to a value
     def buildInformation(self, node, nodeFunction, sofarDict):
-        if node in sofarDict:
-            return sofarDict
-        sofarDict[node] = nodeFunction(node)
-        if node.isLeaf():
-            return sofarDict
-        else:
-            sofarDict = self.buildInformation(node.high, nodeFunction, sofarDict)
-            return self.buildInformation(node.low, nodeFunction, sofarDict)
+        # Preorder traversal, visiting high child before low
+        stack = [node]
+        while len(stack) > 0:
+            node = stack.pop().regular()
+            if node in sofarDict:
+                continue
+            sofarDict[node] = nodeFunction(node)
+            if not node.isLeaf():
+                stack.append(node.low)
+                stack.append(node.high)
+        return sofarDict
         
     # Find support for function rooted by node.  Return as clause
     def getSupport(self, node):
-        varDict = self.buildInformation(node, lambda n: n.variable, {})
-        fullList = sorted(varDict.values())
-        vlist = []
-        for v in fullList:
-            if (len(vlist) == 0 or vlist[-1] != v) and v.level != Variable.leafLevel:
-                vlist.append(v)
-        lits = [self.literal(v, 1) for v in  vlist]
+        lits = [self.literal(v, 1) for v in self.getSupportVariables(node)]
         return self.buildClause(lits)
 
+    # Find support for function rooted by node.  Return as ordered list of variables
+    def getSupportVariables(self, node):
+        return sorted([self.variableIds[id] for id in self.getSupportIds(node)])
+
+    # Find support for function rooted by node.  Return as ordered list of variable Ids
     def getSupportIds(self, node):
-        varDict = self.buildInformation(node, lambda n: n.variable.id, {})
-        fullList = sorted(varDict.values())
+        bits = node.support
         ilist = []
-        for id in fullList:
-            if (len(ilist) == 0 or ilist[-1] != id) and id > 0:
-                ilist.append(id)
+        while bits != 0:
+            lowBit = bits & -bits
+            ilist.append(lowBit.bit_length() - 1)
+            bits ^= lowBit
         return ilist
 
+    # Number of nodes (including leaves) in graph rooted by node.
+    # Sizes are memoized until nodes get reclaimed or variables get reordered
     def getSize(self, node):
-        oneDict = self.buildInformation(node, lambda n: 1, {})
-        return len(oneDict)
+        id = abs(node.id)
+        if id not in self.sizeCache:
+            self.sizeCache[id] = len(self.buildInformation(node, lambda n: 1, {}))
+        return self.sizeCache[id]
 
-    # Get combined size of set of nodes
+    # Get combined size of set of nodes, counting shared nodes only once.
+    # Result for most recent set of roots is memoized until nodes get reclaimed or variables get reordered
     def getCombinedSize(self, nodeList):
-        oneDict = {}
-        for node in oneDict:
-            self.buildInformation(node, lambda n:1, oneDict)
-        return len(oneDict)
+        key = frozenset([abs(node.id) for node in nodeList])
+        if key != self.combinedSizeKey:
+            oneDict = {}
+            for node in nodeList:
+                self.buildInformation(node, lambda n:1, oneDict)
+            self.combinedSizeKey = key
+            self.combinedSize = len(oneDict)
+        return self.combinedSize
 
     # Generate list of all nodes from root.
     # Order according to postorder traversal of graph
     def getNodeList(self, node, includeLeaves = True):
         ndict = {}
         nlist = []
-        def traverse(n):
-            if n in ndict:
-                return
-            if not n.isLeaf():
-                traverse(n.high)
-                traverse(n.low)
-                nlist.append(n)
-            elif includeLeaves:
+        # Stack entries are (node, expanded).
+        # Node gets listed once its children have been traversed
+        stack = [(node, False)]
+        while len(stack) > 0:
+            n, expanded = stack.pop()
+            n = n.regular()
+            if expanded:
                 nlist.append(n)
-            ndict[n] = True
-        traverse(node)
+                ndict[n] = True
+            elif n in ndict:
+                continue
+            elif n.isLeaf():
+                if includeLeaves:
+                    nlist.append(n)
+                ndict[n] = True
+            else:
+                stack.append((n, True))
+                stack.append((n.low, False))
+                stack.append((n.high, False))
         return nlist
 
     # Shift all nodes in list to ones with consecutive ids starting with designated value
@@ -498,6 +1197,13 @@ class Manager:
         self.uniqueTable = {}
         # Nothing in here worth keeping
         self.uniqueTable = {}
+        # Cache entries refer to old node Ids, some of which will be reused
+        self.clearCache()
+        self.sizeCache = {}
+        self.combinedSizeKey = None
+        self.deadQueue = []
+        self.deadCount = 0
+        self.gcSurvivors = 0
         if startId is None:
             startId = self.nextNodeId
         self.nextNodeId = startId
@@ -508,12 +1214,130 @@ class Manager:
         newNodeList = []
         for n in nodeList:
             nhigh = n.high if n.high.isLeaf() else newMap[oldToNew[n.high.id]]
-            nlow = n.low if n.low.isLeaf() else newMap[oldToNew[n.low.id]]
+            if n.low.isLeaf():
+                nlow = n.low
+            elif n.low.isComplemented():
+                nlow = newMap[oldToNew[-n.low.id]].negation()
+            else:
+                nlow = newMap[oldToNew[n.low.id]]
             nn = self.findOrMake(n.variable, nhigh, nlow)
             newMap[nn.id] = nn
             newNodeList.append(nn)
         return newNodeList
 
+    # Binary snapshots of BDDs.
+    # File consists of:
+    #   Magic string and header (number of variables, nodes, roots, and bytes of variable names)
+    #   Variable table, ordered by level: arrays of Ids, qlevels, and existential flags
+    #   Node table, ordered by decreasing level so that children precede parents:
+    #     arrays of variable indices, high references, and low references
+    #   Array of root references
+    #   Variable names, separated by null characters
+    # All arrays hold 32-bit little-endian integers.
+    # Reference 0 is leaf0, 1 is leaf1, 2k+2 is node k, and 2k+3 is the complement of node k
+    snapshotMagic = b"BDDSNAP1"
+    snapshotHeader = struct.Struct("<iiii")
+
+    # Save graphs for list of roots to file
+    def saveSnapshot(self, fname, roots):
+        ndict = {}
+        for root in roots:
+            self.buildInformation(root, lambda n: 1, ndict)
+        nodes = [n for n in ndict.keys() if not n.isLeaf()]
+        nodes.sort(key = lambda n: -n.variable.level)
+        vlist = sorted(set([n.variable for n in nodes]))
+        vindex = { vlist[i].id : i for i in range(len(vlist)) }
+        nindex = { nodes[k].id : k for k in range(len(nodes)) }
+        def reference(node):
+            if node.isLeaf():
+                return node.value
+            k = nindex[node.regular().id]
+            return 2*k + 3 if node.isComplemented() else 2*k + 2
+        names = '\0'.join([v.name for v in vlist]).encode('utf-8')
+        arrays = [[v.id for v in vlist], [v.qlevel for v in vlist], [1 if v.isExistential else 0 for v in vlist],
+                  [vindex[n.variable.id] for n in nodes], [reference(n.high) for n in nodes], [reference(n.low) for n in nodes],
+                  [reference(r) for r in roots]]
+        try:
+            outfile = open(fname, 'wb')
+        except Exception:
+            raise BddException("Could not open snapshot file '%s'" % fname)
+        outfile.write(self.snapshotMagic)
+        outfile.write(self.snapshotHeader.pack(len(vlist), len(nodes), len(roots), len(names)))
+        for values in arrays:
+            arr = array.array('i', values)
+            if sys.byteorder == 'big':
+                arr.byteswap()
+            outfile.write(arr.tobytes())
+        outfile.write(names)
+        outfile.close()
+
+    # Restore graphs from snapshot file.  Return list of roots.
+    # Variables are matched by Id.  When manager has no variables, they are created from the snapshot
+    def loadSnapshot(self, fname):
+        try:
+            infile = open(fname, 'rb')
+        except Exception:
+            raise BddException("Could not open snapshot file '%s'" % fname)
+        with infile:
+            try:
+                buf = mmap.mmap(infile.fileno(), 0, access = mmap.ACCESS_READ)
+            except ValueError:
+                raise BddException("Snapshot file '%s' is empty" % fname)
+        pos = len(self.snapshotMagic)
+        if buf[:pos] != self.snapshotMagic:
+            buf.close()
+            raise BddException("File '%s' is not a BDD snapshot" % fname)
+        truncated = "Snapshot file '%s' is truncated" % fname
+        if pos + self.snapshotHeader.size > len(buf):
+            buf.close()
+            raise BddException(truncated)
+        nvars, nnodes, nroots, nameBytes = self.snapshotHeader.unpack_from(buf, pos)
+        pos += self.snapshotHeader.size
+        if min(nvars, nnodes, nroots, nameBytes) < 0:
+            buf.close()
+            raise BddException("Snapshot file '%s' has invalid header" % fname)
+        arrays = []
+        for count in [nvars, nvars, nvars, nnodes, nnodes, nnodes, nroots]:
+            arr = array.array('i')
+            if pos + count * arr.itemsize > len(buf):
+                buf.close()
+                raise BddException(truncated)
+            arr.frombytes(buf[pos:pos + count * arr.itemsize])
+            if sys.byteorder == 'big':
+                arr.byteswap()
+            arrays.append(arr)
+            pos += count * arr.itemsize
+        if pos + nameBytes > len(buf):
+            buf.close()
+            raise BddException(truncated)
+        names = buf[pos:pos+nameBytes].decode('utf-8').split('\0')
+        buf.close()
+        if len(names) < nvars:
+            raise BddException(truncated)
+        ids, qlevels, existentials, nodeVars, highs, lows, rootRefs = arrays
+        if len(self.variables) == 0:
+            vlist = [self.newVariable(qlevels[i], names[i], id = ids[i], existential = existentials[i] == 1) for i in range(nvars)]
+        else:
+            vlist = []
+            for id in ids:
+                if id not in self.variableIds:
+                    raise BddException("Snapshot variable %d not in manager" % id)
+                vlist.append(self.variableIds[id])
+        for i in range(1, nvars):
+            if vlist[i] < vlist[i-1]:
+                raise BddException("Snapshot variable ordering differs from that of manager")
+        nodes = []
+        def node(ref):
+            if ref < 2:
+                return self.leaf1 if ref == 1 else self.leaf0
+            n = nodes[(ref-2) >> 1]
+            if ref & 1 == 0:
+                return n
+            return n.negation() if self.complementEdges else self.applyNot(n)
+        for k in range(nnodes):
+            nodes.append(self.findOrMake(vlist[nodeVars[k]], node(highs[k]), node(lows[k])))
+        return [node(ref) for ref in rootRefs]
+
     # Generate clausal representation of BDD
     # Declare extension variables as existentially quantified
     # Include unit clause for root
@@ -532,7 +1356,20 @@ class Manager:
         maxId = max(idlist[-1], max([n.id for n in nodeList]))
         inputCount = len(idlist)
         sidlist = [str(v) for v in idlist]
-        gateMap = { nodeList[idx].id : idx+maxIndex+1  for idx in range(len(nodeList)) }
+        # Sequence of ITEG gates.  Complemented references to nodes
+        # require inverters, each implemented as ITE(a, 0, 1)
+        gateList = []
+        gateMap = {}
+        def addGate(n):
+            if n.id not in gateMap:
+                gateMap[n.id] = len(gateList)+maxIndex+1
+                gateList.append(n)
+        for n in nodeList:
+            if n.low.isComplemented():
+                addGate(n.low)
+            addGate(n)
+        if node.isComplemented():
+            addGate(node)
         outfile.write("c CNF representation of BDD with root node %d\n" % rootid)
         if len(nodeList) == 0:
             outfile.write("p cnf %d %d\n" % (inputCount, clauseCount))
@@ -542,7 +1379,7 @@ class Manager:
             slist = [str(n.id) for n in nodeList] + ['0']
             outfile.write("e %s\n" % " ".join(slist))
         # Header for iteg file
-        outfile.write("c_ITEG iteg %d %d 1 %d\n" % (maxIndex, inputCount, len(nodeList)))
+        outfile.write("c_ITEG iteg %d %d 1 %d\n" % (maxIndex, inputCount, len(gateList)))
         outfile.write("c Variables: %s\n" % " ".join(sidlist))
         outfile.write("c_ITEG c Input declarations\n")
         for v in idlist:
@@ -557,14 +1394,18 @@ class Manager:
                 sc = [str(l) for l in c] + ['0']
                 outfile.write(" ".join(sc))
                 outfile.write('\n')
-        for idx in range(len(nodeList)):
-            n = nodeList[idx]
+        idx = 0
+        for n in gateList:
             nid = n.id
+            if n.isComplemented():
+                outfile.write("c Inverter for node %d\n" % -nid)
+                outfile.write("c_ITEG %d %d 0 1\n" % (gateMap[nid], gateMap[-nid]))
+                continue
             vid = n.variable.id
             hid = n.high.id
             lid = n.low.id
-            hname = "ONE" if hid == resolver.tautologyId else "ZERO" if hid == -resolver.tautologyId else "N%d" % hid
-            lname = "ONE" if lid == resolver.tautologyId else "ZERO" if lid == -resolver.tautologyId else "N%d" % lid
+            hname = referenceName(hid)
+            lname = referenceName(lid)
             outfile.write("c Node %d.  Var %d.  Hi %s, Lo %s\n" % (n.id, n.variable.id, hname, lname))
             ngate = gateMap[nid]
             hgate = 1 if hid == resolver.tautologyId else 0 if hid == -resolver.tautologyId else gateMap[hid]
@@ -574,6 +1415,7 @@ class Manager:
                 sc = [str(l) for l in c] + ['0']
                 outfile.write(" ".join(sc))
                 outfile.write('\n')
+            idx += 1
         if len(nodeList) > 0:
             outfile.write("c Assert root node as unit clause\n")
             outfile.write("%d 0\n" % node.id)
@@ -592,68 +1434,112 @@ class Manager:
     # Count number of solutions to function
     # Over variables consisting of support set for function
     def satisfyCount(self, root):
-        supportClause = self.getSupport(root)
-        # Mapping from (node, support) to count
-        countDict = {(self.leaf1, self.leaf0) : 1}
-        count = self.countStep(root, supportClause, countDict)
-        return count
-
-    # Recursive step of solution counting
-    def countStep(self, root, supportClause, countDict):
-        if (root, supportClause) in countDict:
-            return countDict[(root, supportClause)]
-        if root == self.leaf0:
-            countDict[(root, supportClause)] = 0
-            return 0
-        if supportClause == self.leaf0:
-            msg = "Ran out of support variables with nonleaf root node %s" % (str(root))
-            raise BddException(msg)
-        varS = supportClause.variable
-        varR = root.variable
-        nsupport = supportClause.low
-        if varS < varR:
-            ncount = self.countStep(root, nsupport, countDict)
-            count = 2 * ncount
-        elif varS == varR:
-            highR = root.high
-            lowR =  root.low
-            countH = self.countStep(highR, nsupport, countDict)
-            countL = self.countStep(lowR, nsupport, countDict)
-            count = countH + countL
-        else:
-            msg = "Node variable not in support set" % (str(root))
-            raise BddException(msg)
-        countDict[(root, supportClause)] = count
-        return count
+        return self.modelCount(root)
+
+    # Weighted, projected model counting.
+    # Count over variables in countVars (default = support of root).
+    # Variables in support of root but not in countVars are existentially quantified first.
+    # Weights given by dictionary mapping literal (+/- variable Id) to weight.
+    # Literals not in dictionary have weight 1.
+    # Result is exact: an integer, or a Fraction when weights are not integers
+    def modelCount(self, root, countVars = None, weights = None):
+        counter = ModelCounter(self, root, countVars, weights)
+        return counter.count()
+
+    # Generate N models, chosen independently with probability proportional to their weights
+    # (uniformly, when no weights given).
+    # Counting variables and weights as for modelCount.
+    # Each model is list of literals (+/- variable Id) assigning every counting variable
+    def sampleModels(self, root, count, countVars = None, weights = None, rng = None):
+        counter = ModelCounter(self, root, countVars, weights)
+        if counter.count() == 0:
+            raise BddException("Cannot sample from function with no models")
+        if rng is None:
+            rng = random.Random()
+        return [counter.sample(rng) for i in range(count)]
+
+    # Generate satisfying paths, one at a time.
+    # Each represented as list of literals (+/- variable Id).
+    # Variables not on path can have either value
+    def satisfyCubes(self, node):
+        # Visit high branches before low ones
+        stack = [(node, [])]
+        while len(stack) > 0:
+            node, cube = stack.pop()
+            if node.isLeaf():
+                if node == self.leaf1:
+                    yield cube
+                continue
+            vid = node.variable.id
+            stack.append((node.low, cube + [-vid]))
+            stack.append((node.high, cube + [vid]))
 
     # Return lists of literals representing all solutions
     def satisfy(self, node):
-        if node.isLeaf():
-            return [] if node.value == 0 else [[]]
-        highList = self.satisfy(node.high)
-        highPrefix = [self.literal(node.variable, 1)]
-        highList = [highPrefix + ls for ls in highList]
-        lowList = self.satisfy(node.low)
-        lowPrefix = [self.literal(node.variable, 0)]
-        lowList = [lowPrefix + ls for ls in lowList]        
-        return  highList + lowList
+        varDict = { var.id : var for var in self.variables }
+        return [[self.literal(varDict[abs(lit)], 1 if lit > 0 else 0) for lit in cube] for cube in self.satisfyCubes(node)]
 
     # Generate strings representing all possible solutions
     def satisfyStrings(self, node, limit = None):
-        satList = self.satisfy(node)
+        levels = { var.id : var.level for var in self.variables }
         stringList = []
-        for litList in satList:
+        if limit is not None and limit <= 0:
+            return stringList
+        for cube in self.satisfyCubes(node):
             slist = ['-'] * len(self.variables)
-            for lit in litList:
-                positive = lit.high == self.leaf1
-                slist[lit.variable.level-1] = '1' if positive else '0'
+            for lit in cube:
+                slist[levels[abs(lit)]-1] = '1' if lit > 0 else '0'
             stringList.append(''.join(slist))
             if limit is not None and len(stringList) >= limit:
                 break
         return stringList
 
+    # Operations on BDDs are written as generators, named with suffix "Steps".
+    # Rather than calling itself recursively, an operation yields a generator
+    # for each subsidiary operation and is then sent its result.
+    # Evaluation with an explicit stack of pending generators
+    # lets operations go to any depth without recursion in Python.
+    # Cost of generators (see applybench.py): 0.97-1.23x the speed of the
+    # earlier recursive functions on parity chains, and within the timing noise
+    # (0.81-1.09x) on complete bddgen runs.  Accepted, since recursion
+    # would otherwise fail for BDDs deeper than Python's recursion limit.
+    def run(self, steps):
+        if self.recursive:
+            return self.runRecursive(steps)
+        # Stack holds send methods of suspended callers
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        send = steps.send
+        value = None
+        while True:
+            try:
+                subSteps = send(value)
+            except StopIteration as ex:
+                if not stack:
+                    return ex.value
+                send = pop()
+                value = ex.value
+                continue
+            push(send)
+            send = subSteps.send
+            value = None
+
+    # Evaluation using recursion
+    def runRecursive(self, steps):
+        value = None
+        while True:
+            try:
+                subSteps = steps.send(value)
+            except StopIteration as ex:
+                return ex.value
+            value = self.runRecursive(subSteps)
+
     # Return node + id of clause justifying that nodeA & NodeB ==> result
     def applyAndJustify(self, nodeA, nodeB):
+        return self.run(self.applyAndJustifySteps(nodeA, nodeB))
+
+    def applyAndJustifySteps(self, nodeA, nodeB):
         self.applyCount += 1
         # Constant cases.
         # No justifications required, since all return one of the arguments
@@ -665,6 +1551,9 @@ class Manager:
             return (nodeA, resolver.tautologyId)
         if nodeA == nodeB:
             return (nodeA, resolver.tautologyId)
+        if nodeA.id == -nodeB.id:
+            # Clause [-A, A] is tautological
+            return (self.leaf0, resolver.tautologyId)
 
         if nodeA.id > nodeB.id:
             nodeA, nodeB = nodeB, nodeA
@@ -688,10 +1577,10 @@ class Manager:
             ruleIndex["VHD"] = nodeB.inferTrueDown
             ruleIndex["VLD"] = nodeB.inferFalseDown
 
-        (newHigh, andHigh) = self.applyAndJustify(highA, highB)
+        (newHigh, andHigh) = (yield self.applyAndJustifySteps(highA, highB))
         ruleIndex["ANDH"] = andHigh
             
-        (newLow, andLow) = self.applyAndJustify(lowA, lowB)
+        (newLow, andLow) = (yield self.applyAndJustifySteps(lowA, lowB))
         ruleIndex["ANDL"] = andLow
 
         if newHigh == newLow:
@@ -707,12 +1596,15 @@ class Manager:
         else:
             comment = "Justification that %s & %s ==> %s" % (nodeA.label(), nodeB.label(), newNode.label())
             justification, clauseList = self.andResolver.run(targetClause, ruleIndex, comment)
-        self.operationCache[key] = (newNode, justification,clauseList)
+        self.addCacheEntry(key, (newNode, justification,clauseList))
         self.cacheJustifyAdded += 1
         return (newNode, justification)
 
     # Version that runs without generating justification
     def applyAnd(self, nodeA, nodeB):
+        return self.run(self.applyAndSteps(nodeA, nodeB))
+
+    def applyAndSteps(self, nodeA, nodeB):
         self.applyCount += 1
         # Constant cases.
         if nodeA == self.leaf0 or nodeB == self.leaf0:
@@ -723,6 +1615,8 @@ class Manager:
             return nodeA
         if nodeA == nodeB:
             return nodeA
+        if nodeA.id == -nodeB.id:
+            return self.leaf0
 
         if nodeA.id > nodeB.id:
             nodeA, nodeB = nodeB, nodeA
@@ -737,18 +1631,23 @@ class Manager:
         highB = nodeB.branchHigh(splitVar) 
         lowB =  nodeB.branchLow(splitVar)
 
-        newHigh = self.applyAnd(highA, highB)
-        newLow  = self.applyAnd(lowA, lowB)
+        newHigh = (yield self.applyAndSteps(highA, highB))
+        newLow  = (yield self.applyAndSteps(lowA, lowB))
 
         if newHigh == newLow:
             newNode = newHigh
         else:
             newNode = self.findOrMake(splitVar, newHigh, newLow)
 
-        self.operationCache[key] = (newNode, resolver.tautologyId, [])
+        self.addCacheEntry(key, (newNode, resolver.tautologyId, []))
         return newNode
 
     def applyNot(self, node):
+        return self.run(self.applyNotSteps(node))
+
+    def applyNotSteps(self, node):
+        if self.complementEdges:
+            return node.negation()
         # Constant case
         if node == self.leaf1:
             return self.leaf0
@@ -760,17 +1659,23 @@ class Manager:
         var = node.variable
         high = node.high
         low = node.low
-        newHigh = self.applyNot(high)
-        newLow = self.applyNot(low)
+        newHigh = (yield self.applyNotSteps(high))
+        newLow = (yield self.applyNotSteps(low))
         if newHigh == newLow:
             newNode = newNode
         else:
             newNode = self.findOrMake(var, newHigh, newLow)
-        self.operationCache[key] = (newNode, resolver.tautologyId,[])
+        self.addCacheEntry(key, (newNode, resolver.tautologyId,[]))
         self.cacheNoJustifyAdded += 1
         return newNode
 
     def applyOr(self, nodeA, nodeB):
+        return self.run(self.applyOrSteps(nodeA, nodeB))
+
+    def applyOrSteps(self, nodeA, nodeB):
+        if self.complementEdges:
+            # De Morgan's Law
+            return (yield self.applyAndSteps(nodeA.negation(), nodeB.negation())).negation()
         # Constant cases
         if nodeA == self.leaf1:
             return self.leaf1
@@ -795,15 +1700,23 @@ class Manager:
         highB = nodeB.branchHigh(splitVar) 
         lowB =  nodeB.branchLow(splitVar)
 
-        newHigh = self.applyOr(highA, highB)
-        newLow = self.applyOr(lowA, lowB)
+        newHigh = (yield self.applyOrSteps(highA, highB))
+        newLow = (yield self.applyOrSteps(lowA, lowB))
         newNode = newHigh if newHigh == newLow else self.findOrMake(splitVar, newHigh, newLow)
-        self.operationCache[key] = (newNode, resolver.tautologyId,[])
+        self.addCacheEntry(key, (newNode, resolver.tautologyId,[]))
         self.cacheNoJustifyAdded += 1
         return newNode
 
     # Return node + id of clause justifying that result ==> nodeA | NodeB
     def applyOrJustify(self, nodeA, nodeB):
+        return self.run(self.applyOrJustifySteps(nodeA, nodeB))
+
+    def applyOrJustifySteps(self, nodeA, nodeB):
+        if self.complementEdges:
+            # Clause [-!W, !A, !B] justifying !A & !B ==> W
+            # is the same as [-W, A, B] justifying !W ==> A | B
+            (newNode, justification) = (yield self.applyAndJustifySteps(nodeA.negation(), nodeB.negation()))
+            return (newNode.negation(), justification)
         self.applyCount += 1
         # Constant cases.
         # No justifications required, since all return one of the arguments
@@ -838,10 +1751,10 @@ class Manager:
             ruleIndex["VHU"] = nodeB.inferTrueUp
             ruleIndex["VLU"] = nodeB.inferFalseUp
 
-        (newHigh, orHigh) = self.applyOrJustify(highA, highB)
+        (newHigh, orHigh) = (yield self.applyOrJustifySteps(highA, highB))
         ruleIndex["ORH"] = orHigh
             
-        (newLow, orLow) = self.applyOrJustify(lowA, lowB)
+        (newLow, orLow) = (yield self.applyOrJustifySteps(lowA, lowB))
         ruleIndex["ORL"] = orLow
 
         if newHigh == newLow:
@@ -857,16 +1770,25 @@ class Manager:
         else:
             comment = "Justification that %s ==> %s | %s" % (newNode.label(), nodeA.label(), nodeB.label())
             justification, clauseList = self.orResolver.run(targetClause, ruleIndex, comment)
-        self.operationCache[key] = (newNode, justification,clauseList)
+        self.addCacheEntry(key, (newNode, justification,clauseList))
         self.cacheJustifyAdded += 1
         return (newNode, justification)
 
     def applyXor(self, nodeA, nodeB):
+        return self.run(self.applyXorSteps(nodeA, nodeB))
+
+    def applyXorSteps(self, nodeA, nodeB):
+        if self.complementEdges:
+            # Factor out complements: !A ^ B = A ^ !B = !(A ^ B)
+            if nodeA.isComplemented():
+                return (yield self.applyXorSteps(nodeA.negation(), nodeB)).negation()
+            if nodeB.isComplemented():
+                return (yield self.applyXorSteps(nodeA, nodeB.negation())).negation()
         # Constant cases
         if nodeA == self.leaf1:
-            return self.applyNot(nodeB)
+            return (yield self.applyNotSteps(nodeB))
         if nodeB == self.leaf1:
-            return self.applyNot(nodeA)
+            return (yield self.applyNotSteps(nodeA))
         if nodeA == self.leaf0:
             return nodeB
         if nodeB == self.leaf0:
@@ -886,14 +1808,17 @@ class Manager:
         highB = nodeB.branchHigh(splitVar) 
         lowB =  nodeB.branchLow(splitVar)
 
-        newHigh = self.applyXor(highA, highB)
-        newLow = self.applyXor(lowA, lowB)
+        newHigh = (yield self.applyXorSteps(highA, highB))
+        newLow = (yield self.applyXorSteps(lowA, lowB))
         newNode = newHigh if newHigh == newLow else self.findOrMake(splitVar, newHigh, newLow)
-        self.operationCache[key] = (newNode, resolver.tautologyId,[])
+        self.addCacheEntry(key, (newNode, resolver.tautologyId,[]))
         self.cacheNoJustifyAdded += 1
         return newNode
     
     def justifyImply(self, nodeA, nodeB):
+        return self.run(self.justifyImplySteps(nodeA, nodeB))
+
+    def justifyImplySteps(self, nodeA, nodeB):
         self.auxApplyCount += 1
 
         # Special cases
@@ -927,10 +1852,10 @@ class Manager:
             ruleIndex["VHU"] = nodeB.inferTrueUp
             ruleIndex["VLU"] = nodeB.inferFalseUp
 
-        (checkHigh, implyHigh) = self.justifyImply(highA, highB)
+        (checkHigh, implyHigh) = (yield self.justifyImplySteps(highA, highB))
         if implyHigh != resolver.tautologyId:
             ruleIndex["IMH"] = implyHigh
-        (checkLow, implyLow) = self.justifyImply(lowA, lowB)
+        (checkLow, implyLow) = (yield self.justifyImplySteps(lowA, lowB))
         if implyLow != resolver.tautologyId:
             ruleIndex["IML"] = implyLow
 
@@ -942,7 +1867,7 @@ class Manager:
         else:
             justification, clauseList = resolver.tautologyId, []
 
-        self.operationCache[key] = (check, justification, clauseList)
+        self.addCacheEntry(key, (check, justification, clauseList))
         if justification != resolver.tautologyId:
             self.cacheJustifyAdded += 1
         else:
@@ -966,6 +1891,9 @@ class Manager:
 
     # Use clause to provide canonical list of nodes.  Should all be positive
     def equant(self, node, clause, topLevel = True):
+        return self.run(self.equantSteps(node, clause, topLevel))
+
+    def equantSteps(self, node, clause, topLevel = True):
         if topLevel:
             nextc = clause
             while not nextc.isLeaf():
@@ -982,21 +1910,169 @@ class Manager:
         if key in self.operationCache:
             return self.operationCache[key][0]
 
-        newHigh = self.equant(node.high, clause, topLevel = False)
-        newLow = self.equant(node.low, clause, topLevel = False)
+        newHigh = (yield self.equantSteps(node.high, clause, topLevel = False))
+        newLow = (yield self.equantSteps(node.low, clause, topLevel = False))
         quant = node.variable == clause.variable
         if newHigh == newLow:
             newNode = newHigh
         elif quant:
-            newNode = self.applyOr(newHigh, newLow) 
+            newNode = (yield self.applyOrSteps(newHigh, newLow)) 
         else:
             newNode = self.findOrMake(node.variable, newHigh, newLow)
-        self.operationCache[key] = (newNode, resolver.tautologyId,[])
+        self.addCacheEntry(key, (newNode, resolver.tautologyId,[]))
         self.cacheNoJustifyAdded += 1
         return newNode
 
+    # Existential quantification of conjunction, without constructing conjunction.
+    # Use clause to provide canonical list of nodes.  Should all be positive
+    def applyAndExists(self, nodeA, nodeB, clause):
+        nextc = clause
+        while not nextc.isLeaf():
+            self.markQuantified(nextc.variable)
+            nextc = nextc.low
+        return self.run(self.applyAndExistsSteps(nodeA, nodeB, clause))
+
+    def applyAndExistsSteps(self, nodeA, nodeB, clause):
+        self.applyCount += 1
+        # Constant cases.
+        if nodeA == self.leaf0 or nodeB == self.leaf0:
+            return self.leaf0
+        if nodeA.id == -nodeB.id:
+            return self.leaf0
+        if nodeA == self.leaf1:
+            return (yield self.equantSteps(nodeB, clause, topLevel = False))
+        if nodeB == self.leaf1 or nodeA == nodeB:
+            return (yield self.equantSteps(nodeA, clause, topLevel = False))
+
+        splitVar = min(nodeA.variable, nodeB.variable)
+        while not clause.isLeaf() and splitVar > clause.variable:
+            clause = clause.low
+        if clause.isLeaf():
+            return (yield self.applyAndSteps(nodeA, nodeB))
+
+        if nodeA.id > nodeB.id:
+            nodeA, nodeB = nodeB, nodeA
+        key = ("andex", nodeA.id, nodeB.id, clause.id)
+        if key in self.operationCache:
+            return self.operationCache[key][0]
+
+        highA = nodeA.branchHigh(splitVar)
+        lowA =  nodeA.branchLow(splitVar)
+        highB = nodeB.branchHigh(splitVar) 
+        lowB =  nodeB.branchLow(splitVar)
+        quant = splitVar == clause.variable
+
+        newHigh = (yield self.applyAndExistsSteps(highA, highB, clause))
+        if quant and newHigh == self.leaf1:
+            # No need to evaluate low branch
+            newNode = self.leaf1
+        else:
+            newLow = (yield self.applyAndExistsSteps(lowA, lowB, clause))
+            if newHigh == newLow:
+                newNode = newHigh
+            elif quant:
+                newNode = (yield self.applyOrSteps(newHigh, newLow))
+            else:
+                newNode = self.findOrMake(splitVar, newHigh, newLow)
+
+        self.addCacheEntry(key, (newNode, resolver.tautologyId, []))
+        self.cacheNoJustifyAdded += 1
+        return newNode
+
+    # Return node + id of clause justifying that nodeA & NodeB ==> result,
+    # where result is existential quantification of conjunction.
+    def applyAndExistsJustify(self, nodeA, nodeB, clause):
+        nextc = clause
+        while not nextc.isLeaf():
+            self.markQuantified(nextc.variable)
+            nextc = nextc.low
+        return self.run(self.applyAndExistsJustifySteps(nodeA, nodeB, clause))
+
+    def applyAndExistsJustifySteps(self, nodeA, nodeB, clause):
+        self.applyCount += 1
+        # Constant cases.
+        if nodeA == self.leaf0 or nodeB == self.leaf0:
+            return (self.leaf0, resolver.tautologyId)
+        if nodeA.id == -nodeB.id:
+            # Clause [-A, A] is tautological
+            return (self.leaf0, resolver.tautologyId)
+        if nodeA == self.leaf1 or nodeA == nodeB:
+            # Reduces to quantification of single argument
+            newNode = (yield self.equantSteps(nodeB, clause, topLevel = False))
+            (check, implication) = (yield self.justifyImplySteps(nodeB, newNode))
+            return (newNode, implication)
+        if nodeB == self.leaf1:
+            newNode = (yield self.equantSteps(nodeA, clause, topLevel = False))
+            (check, implication) = (yield self.justifyImplySteps(nodeA, newNode))
+            return (newNode, implication)
+
+        splitVar = min(nodeA.variable, nodeB.variable)
+        while not clause.isLeaf() and splitVar > clause.variable:
+            clause = clause.low
+        if clause.isLeaf():
+            return (yield self.applyAndJustifySteps(nodeA, nodeB))
+
+        if nodeA.id > nodeB.id:
+            nodeA, nodeB = nodeB, nodeA
+        key = ("andexj", nodeA.id, nodeB.id, clause.id)
+        if key in self.operationCache:
+            return self.operationCache[key][:2]
+
+        # Mapping from rule names to clause numbers.
+        # Same rules as for conjunction, except that when splitting variable is quantified,
+        # WHU and WLU are implications from the branch results to their disjunction
+        ruleIndex = {}
+        highA = nodeA.branchHigh(splitVar)
+        lowA =  nodeA.branchLow(splitVar)
+        highB = nodeB.branchHigh(splitVar) 
+        lowB =  nodeB.branchLow(splitVar)
+        quant = splitVar == clause.variable
+
+        if highA != lowA:
+            ruleIndex["UHD"] = nodeA.inferTrueDown
+            ruleIndex["ULD"] = nodeA.inferFalseDown
+        if highB != lowB:
+            ruleIndex["VHD"] = nodeB.inferTrueDown
+            ruleIndex["VLD"] = nodeB.inferFalseDown
+
+        (newHigh, andHigh) = (yield self.applyAndExistsJustifySteps(highA, highB, clause))
+        if quant and newHigh == self.leaf1:
+            # Result is tautology.  No need to evaluate low branch
+            newNode = self.leaf1
+        else:
+            ruleIndex["ANDH"] = andHigh
+            (newLow, andLow) = (yield self.applyAndExistsJustifySteps(lowA, lowB, clause))
+            ruleIndex["ANDL"] = andLow
+            if newHigh == newLow:
+                newNode = newHigh
+            elif quant:
+                newNode = (yield self.applyOrSteps(newHigh, newLow))
+                (check, implyHigh) = (yield self.justifyImplySteps(newHigh, newNode))
+                if implyHigh != resolver.tautologyId:
+                    ruleIndex["WHU"] = implyHigh
+                (check, implyLow) = (yield self.justifyImplySteps(newLow, newNode))
+                if implyLow != resolver.tautologyId:
+                    ruleIndex["WLU"] = implyLow
+            else:
+                newNode = self.findOrMake(splitVar, newHigh, newLow)
+                ruleIndex["WHU"] = newNode.inferTrueUp
+                ruleIndex["WLU"] = newNode.inferFalseUp
+
+        targetClause = resolver.cleanClause([-nodeA.id, -nodeB.id, newNode.id])
+        if targetClause == resolver.tautologyId:
+            justification, clauseList = resolver.tautologyId, []
+        else:
+            comment = "Justification that %s & %s ==> %s" % (nodeA.label(), nodeB.label(), newNode.label())
+            justification, clauseList = self.andExistsResolver.run(targetClause, ruleIndex, comment)
+        self.addCacheEntry(key, (newNode, justification, clauseList))
+        self.cacheJustifyAdded += 1
+        return (newNode, justification)
+
     # Use clause to provide canonical list of nodes.  Should all be positive
     def uquant(self, node, clause, topLevel = True):
+        return self.run(self.uquantSteps(node, clause, topLevel))
+
+    def uquantSteps(self, node, clause, topLevel = True):
         if topLevel:
             nextc = clause
             while not nextc.isLeaf():
@@ -1013,18 +2089,18 @@ class Manager:
         if key in self.operationCache:
             return self.operationCache[key][0]
 
-        newHigh = self.uquant(node.high, clause, topLevel = False)
-        newLow = self.uquant(node.low, clause, topLevel = False)
+        newHigh = (yield self.uquantSteps(node.high, clause, topLevel = False))
+        newLow = (yield self.uquantSteps(node.low, clause, topLevel = False))
         quant = node.variable == clause.variable
         
         if newHigh == newLow:
             newNode = newHigh
         elif quant:
-            newNode = self.applyAnd(newHigh, newLow) 
+            newNode = (yield self.applyAndSteps(newHigh, newLow)) 
         else:
             newNode = self.findOrMake(node.variable, newHigh, newLow)
 
-        self.operationCache[key] = (newNode, resolver.tautologyId,[])
+        self.addCacheEntry(key, (newNode, resolver.tautologyId,[]))
         self.cacheNoJustifyAdded += 1
         return newNode
 
@@ -1032,6 +2108,9 @@ class Manager:
     # Variable and phase indicated by literal node
     # Generate justification that (literal &) node  --> newNode
     def applyRestrictDown(self, u, literal):
+        return self.run(self.applyRestrictDownSteps(u, literal))
+
+    def applyRestrictDownSteps(self, u, literal):
         if u.isLeaf():
             return (u, resolver.tautologyId)
         rvar = literal.variable
@@ -1054,9 +2133,9 @@ class Manager:
         ulow = u.low
         ruleIndex["ULX"] = u.inferFalseDown
 
-        (vhigh, resHigh) = self.applyRestrictDown(uhigh, literal)
+        (vhigh, resHigh) = (yield self.applyRestrictDownSteps(uhigh, literal))
         ruleIndex["RESH"] = resHigh
-        (vlow, resLow)   = self.applyRestrictDown(ulow, literal)
+        (vlow, resLow)   = (yield self.applyRestrictDownSteps(ulow, literal))
         ruleIndex["RESL"] = resLow
         
         if vhigh == vlow:
@@ -1078,7 +2157,7 @@ class Manager:
                 targetClause = resolver.cleanClause([-u.id, v.id])
                 comment = "Degenerate restriction.  Justification that %s ==> %s" % (u.label(), v.label())
                 justification, clauseList = self.restrictResolver.run(targetClause, ruleIndex, comment)
-        self.operationCache[key] = (v, justification,clauseList)
+        self.addCacheEntry(key, (v, justification,clauseList))
         self.cacheJustifyAdded += 1
         return (v, justification)
 
@@ -1086,6 +2165,9 @@ class Manager:
     # Variable and phase indicated by literal node
     # Generate justification that literal & newNode --> node
     def applyRestrictUp(self, u, literal):
+        return self.run(self.applyRestrictUpSteps(u, literal))
+
+    def applyRestrictUpSteps(self, u, literal):
         if u.isLeaf():
             return (u, resolver.tautologyId)
         rvar = literal.variable
@@ -1108,9 +2190,9 @@ class Manager:
         ulow = u.low
         ruleIndex["ULX"] = u.inferFalseUp
 
-        (vhigh, resHigh) = self.applyRestrictUp(uhigh, literal)
+        (vhigh, resHigh) = (yield self.applyRestrictUpSteps(uhigh, literal))
         ruleIndex["RESH"] = resHigh
-        (vlow, resLow)   = self.applyRestrictUp(ulow, literal)
+        (vlow, resLow)   = (yield self.applyRestrictUpSteps(ulow, literal))
         ruleIndex["RESL"] = resLow
         
         if vhigh == vlow:
@@ -1133,82 +2215,287 @@ class Manager:
                 justification, clauseList = self.restrictResolver.run(targetClause, ruleIndex, comment)
                 # Record this for use by the prover
                 self.prover.restrictDegeneracies.add(justification)
-        self.operationCache[key] = (v, justification,clauseList)
+        self.addCacheEntry(key, (v, justification,clauseList))
         self.cacheJustifyAdded += 1
         return (v, justification)
     
     # Should a GC be triggered?
+    # Also serves as point where proof clauses for evicted cache entries can be deleted
     def checkGC(self, generateClauses = True):
-        newQuants = len(self.quantifiedVariableSet) - self.lastGC
-        if newQuants > self.gcThreshold:
-            return self.collectGarbage(generateClauses)
-        return []
+        clauseList = []
+        if self.cacheSize is not None:
+            clauseList = self.operationCache.flushEvicted()
+            if not generateClauses:
+                clauseList = []
+        tableSize = len(self.uniqueTable)
+        if tableSize >= self.gcMinNodes:
+            newDead = self.deadCount - self.gcSurvivors
+            if newDead >= self.gcDeadFraction * tableSize or tableSize >= self.gcNodeThreshold:
+                clauseList += self.collectGarbage(generateClauses)
+        # Also a safe point for reordering
+        self.checkReorder()
+        return clauseList
 
+    # Add entry to operation cache and to index of cache entries
+    def addCacheEntry(self, key, value):
+        self.operationCache[key] = value + (self.cacheInsertCount,)
+        self.cacheInsertCount += 1
+        self.indexCacheEntry(key, value[0])
 
-    # Create set nodes that should not be collected
-    # Maintain frontier of marked nonleaf nodes
-    def doMarking(self, frontier):
-        markedSet = set([])
-        while len(frontier) > 0:
-            node = frontier[0]
-            frontier = frontier[1:]
-            if node in markedSet:
-                continue
-            markedSet.add(node)
-            if not node.high.isLeaf():
-                frontier.append(node.high)
-            if not node.low.isLeaf():
-                frontier.append(node.low)
-        return markedSet
-
-    def cleanCache(self, markedSet, generateClauses):
+    def indexCacheEntry(self, key, result):
+        ids = [abs(id) for id in key[1:]]
+        if isinstance(result, Node) and not result.isLeaf():
+            ids.append(abs(result.id))
+        else:
+            self.cacheLeafKeys.append(key)
+        for id in ids:
+            if id in self.cacheRefs:
+                self.cacheRefs[id].append(key)
+            else:
+                self.cacheRefs[id] = [key]
+        self.cacheRefCount += len(ids)
+
+    # Remove stale keys from index.  Work is proportional to size of index, not capacity of cache
+    def compactCacheIndex(self):
+        cache = self.operationCache
+        self.cacheRefCount = 0
+        for id in list(self.cacheRefs.keys()):
+            keys = [k for k in self.cacheRefs[id] if cache.get(k) is not None]
+            if len(keys) == 0:
+                del self.cacheRefs[id]
+            else:
+                self.cacheRefs[id] = keys
+                self.cacheRefCount += len(keys)
+
+    def clearCache(self):
+        self.operationCache.clear()
+        self.cacheRefs = {}
+        self.cacheLeafKeys = []
+        self.cacheRefCount = 0
+
+    # Remove cache entries referring to reclaimed nodes,
+    # as well as ones that don't yield nonleaf nodes.  Return their proof clauses.
+    # Entries are found through the cache index, so that work is proportional to
+    # the number of entries removed, not the size of the cache
+    def cleanCache(self, reclaimedIds, generateClauses):
         clauseList = []
-        markedIds = set([node.id for node in markedSet])
-        klist = list(self.operationCache.keys())
+        candidates = self.cacheLeafKeys
+        self.cacheLeafKeys = []
+        for id in reclaimedIds:
+            keys = self.cacheRefs.pop(id, None)
+            if keys is not None:
+                self.cacheRefCount -= len(keys)
+                candidates += keys
+        entries = {}
+        for k in candidates:
+            if k not in entries:
+                entry = self.operationCache.get(k)
+                # Stale keys no longer have entries
+                if entry is not None:
+                    entries[k] = entry
+        # Remove in the order in which entries are held by the cache
+        if self.cacheSize is None:
+            klist = sorted(entries.keys(), key = lambda k: entries[k][3])
+        else:
+            klist = sorted(entries.keys(), key = self.operationCache.slot)
         for k in klist:
-            kill = self.operationCache[k][0] not in markedSet
-            # Skip over operation name
-            for id in k[1:]:
-                kill = kill or id not in markedIds
-            if kill:
-                if generateClauses:
-                    clist = self.operationCache[k][2]
-                    clauseList += clist
-                self.cacheRemoved += 1
-                del self.operationCache[k]
+            if generateClauses:
+                clauseList += entries[k][2]
+            self.cacheRemoved += 1
+            del self.operationCache[k]
+        # Each entry has at most four references.  Compact once at least half of the index is stale
+        if self.cacheRefCount > 8 * len(self.operationCache) + self.gcMinNodes:
+            self.compactCacheIndex()
         return clauseList
-        
-    def cleanNodes(self, markedSet, generateClauses):
+
+    # Remove node from unique table.  Return its defining clauses
+    def cleanNode(self, node, generateClauses):
         clauseList = []
-        klist = list(self.uniqueTable.keys())
-        for k in klist:
-            node = self.uniqueTable[k]
-            # If node is marked, then its children will be, too
-            if node not in markedSet:
-                if generateClauses:
-                    clist = [node.inferTrueUp, node.inferFalseUp, node.inferTrueDown, node.inferFalseDown]
-                    clist = [c for c in clist if abs(c) != resolver.tautologyId]
-                    clauseList += clist
-                self.nodesRemoved += 1
-                del self.uniqueTable[k]
+        key = self.nodeKey(node)
+        entry = self.uniqueTable.get(key)
+        if entry is not None and (entry == node.id if self.nodeStore is not None else entry is node):
+            del self.uniqueTable[key]
+        node.refCount = -1
+        self.deadCount -= 1
+        self.nodesRemoved += 1
+        if generateClauses:
+            clist = [node.inferTrueUp, node.inferFalseUp, node.inferTrueDown, node.inferFalseDown]
+            clauseList = [c for c in clist if c is not None and abs(c) != resolver.tautologyId]
         return clauseList
 
-
     # Start garbage collection.
     # Provided with partial list of accessible roots
+    # Reclaim unreferenced nodes in dead queue, other than roots.
+    # Reclaiming node removes references to its children, possibly making them dead as well,
+    # so work on nodes is proportional to number of dead nodes, not size of unique table.
+    # Returns list of clauses that can be deleted
     def collectGarbage(self, generateClauses):
-        frontier = []
-        if self.rootGenerator is not None:
-            frontier += self.rootGenerator()
-        frontier = [r for r in frontier if not r.isLeaf()]
-        # Marking phase
-        markedSet = self.doMarking(frontier)
-        clauseList = self.cleanCache(markedSet, generateClauses)
-        clauseList += self.cleanNodes(markedSet, generateClauses)
-        # Turn off trigger for garbage collection
-        self.lastGC = len(self.quantifiedVariableSet)
+        rootIds = self.getRootIds()
+        reclaimedIds, nodeClauseList = self.reclaimNodes(rootIds, generateClauses)
+        cacheClauseList = []
+        if len(reclaimedIds) > 0:
+            cacheClauseList = self.cleanCache(reclaimedIds, generateClauses)
+            for id in reclaimedIds:
+                self.sizeCache.pop(id, None)
+            self.combinedSizeKey = None
+        self.gcNodeThreshold = max(self.gcMinNodes, int(self.gcGrowth * len(self.uniqueTable)))
         self.gcCount += 1
-        return clauseList
+        return cacheClauseList + nodeClauseList
+
+    def getRootIds(self):
+        rootIds = set([])
+        if self.rootGenerator is not None:
+            rootIds = set([abs(r.id) for r in self.rootGenerator() if not r.isLeaf()])
+        return rootIds
+
+    # Reclaim nodes in dead queue, other than roots.
+    # Return set of reclaimed Ids + list of their defining clauses
+    def reclaimNodes(self, rootIds, generateClauses):
+        nodeClauseList = []
+        reclaimedIds = set([])
+        survivorIds = set([])
+        survivors = []
+        queue = self.deadQueue
+        while len(queue) > 0:
+            node = queue.pop()
+            if node.refCount != 0:
+                # Node has been reclaimed or has gained references
+                continue
+            if node.id in rootIds:
+                if node.id not in survivorIds:
+                    survivorIds.add(node.id)
+                    survivors.append(node)
+                continue
+            reclaimedIds.add(node.id)
+            nodeClauseList += self.cleanNode(node, generateClauses)
+            # These can add children to queue
+            self.removeReference(node.high)
+            self.removeReference(node.low)
+        self.deadQueue = survivors
+        self.gcSurvivors = len(survivors)
+        return reclaimedIds, nodeClauseList
+
+    # Should variables be reordered?  Only call when all live roots are known to root generator
+    def checkReorder(self):
+        if not self.reorder or len(self.uniqueTable) - self.deadCount < self.reorderThreshold:
+            return
+        # Nodes below dead ones still have references.  Only get accurate count after GC
+        self.collectGarbage(False)
+        if len(self.uniqueTable) >= self.reorderThreshold:
+            self.reorderVariables()
+
+    # Dynamic variable reordering by sifting.
+    # Each variable in turn is moved through all levels by swapping adjacent levels,
+    # and then returned to the level that minimized the number of nodes.
+    # As with CUDD, the number of variables sifted and the number of swaps are limited,
+    # so that the cost of reordering does not grow quadratically with the number of variables.
+    # Swapping rewrites nodes in place, so that nodes keep their identities and functions.
+    # References to nodes and variables held by clients remain valid
+    def reorderVariables(self):
+        rootIds = self.getRootIds()
+        # Cache entries may refer to nodes reclaimed while reordering
+        self.clearCache()
+        self.reclaimNodes(rootIds, False)
+        startSize = len(self.uniqueTable)
+        # Level-indexed sets of nodes.  Can include nodes that have since been reclaimed
+        levelNodes = [set([]) for level in range(len(self.variables)+1)]
+        for node in self.uniqueTable.values():
+            levelNodes[node.variable.level].add(node)
+        # Sift variables with most nodes first
+        vlist = sorted(self.variables, key = lambda v: -len(levelNodes[v.level]))
+        swapLimit = self.swapCount + self.siftMaxSwaps
+        for var in vlist[:self.siftMaxVars]:
+            if self.swapCount >= swapLimit:
+                break
+            self.siftVariable(var, levelNodes, rootIds, swapLimit)
+        # Hashing of variables is based on their levels
+        self.quantifiedVariableSet = set(self.quantifiedVariableSet)
+        # Graphs have been restructured
+        self.sizeCache = {}
+        self.combinedSizeKey = None
+        size = len(self.uniqueTable)
+        self.reorderThreshold = max(self.reorderMinNodes, 2 * size)
+        self.gcNodeThreshold = max(self.gcMinNodes, int(self.gcGrowth * size))
+        self.reorderCount += 1
+        if self.verbLevel >= 2:
+            self.writer.write("Reordering #%d: %d --> %d nodes\n" % (self.reorderCount, startSize, size))
+
+    # Swaps required to return variable to its best level are not limited
+    def siftVariable(self, var, levelNodes, rootIds, swapLimit):
+        bestSize = len(self.uniqueTable)
+        bestLevel = var.level
+        # Move down
+        while var.level < len(self.variables) and self.swapCount < swapLimit:
+            self.swapLevels(var.level, levelNodes, rootIds)
+            size = len(self.uniqueTable)
+            if size < bestSize:
+                bestSize = size
+                bestLevel = var.level
+            elif size > self.siftGrowth * bestSize:
+                break
+        # Move up
+        while var.level > 1 and self.swapCount < swapLimit:
+            self.swapLevels(var.level-1, levelNodes, rootIds)
+            size = len(self.uniqueTable)
+            if size < bestSize:
+                bestSize = size
+                bestLevel = var.level
+            elif size > self.siftGrowth * bestSize and var.level < bestLevel:
+                break
+        # Return to best level
+        while var.level < bestLevel:
+            self.swapLevels(var.level, levelNodes, rootIds)
+        while var.level > bestLevel:
+            self.swapLevels(var.level-1, levelNodes, rootIds)
+
+    # Swap variables at levels level and level+1
+    def swapLevels(self, level, levelNodes, rootIds):
+        xvar = self.variables[level-1]
+        yvar = self.variables[level]
+        xnodes = [n for n in levelNodes[level] if n.refCount >= 0]
+        ynodes = [n for n in levelNodes[level+1] if n.refCount >= 0]
+        # Unique table keys are based on levels
+        for n in xnodes + ynodes:
+            del self.uniqueTable[self.nodeKey(n)]
+        xvar.level, yvar.level = yvar.level, xvar.level
+        self.variables[level-1] = yvar
+        self.variables[level] = xvar
+        upperNodes = set(ynodes)
+        lowerNodes = set([])
+        for n in ynodes:
+            self.uniqueTable[self.nodeKey(n)] = n
+        # Nodes that depend on both variables must be rewritten
+        rewriteNodes = []
+        for n in xnodes:
+            if n.high.variable is yvar or n.low.variable is yvar:
+                rewriteNodes.append(n)
+            else:
+                self.uniqueTable[self.nodeKey(n)] = n
+                lowerNodes.add(n)
+        for n in rewriteNodes:
+            oldHigh = n.high
+            oldLow = n.low
+            # Cofactors with respect to y
+            hh, hl = (oldHigh.high, oldHigh.low) if oldHigh.variable is yvar else (oldHigh, oldHigh)
+            lh, ll = (oldLow.high, oldLow.low) if oldLow.variable is yvar else (oldLow, oldLow)
+            newHigh = hh if hh == lh else self.findOrMake(xvar, hh, lh)
+            newLow = hl if hl == ll else self.findOrMake(xvar, hl, ll)
+            for child in [newHigh, newLow]:
+                if not child.isLeaf() and child.variable is xvar:
+                    lowerNodes.add(child.regular())
+            n.variable = yvar
+            n.high = newHigh
+            n.low = newLow
+            self.addReference(newHigh)
+            self.addReference(newLow)
+            self.removeReference(oldHigh)
+            self.removeReference(oldLow)
+            self.uniqueTable[self.nodeKey(n)] = n
+            upperNodes.add(n)
+        levelNodes[level] = upperNodes
+        levelNodes[level+1] = lowerNodes
+        self.reclaimNodes(rootIds, False)
+        self.swapCount += 1
 
     # Summarize activity
     def summarize(self):
@@ -1224,9 +2511,15 @@ class Manager:
             self.writer.write("Total cached results requiring proofs: %d\n" % self.cacheJustifyAdded)
             self.writer.write("Total cache entries removed: %d\n" % self.cacheRemoved)
             self.writer.write("Total GCs performed: %d\n" % self.gcCount)
+            if self.reorder:
+                self.writer.write("Total variable reorderings: %d (%d level swaps)\n" % (self.reorderCount, self.swapCount))
+            if self.cacheSize is not None:
+                self.operationCache.summarize(self.writer)
         if self.verbLevel >= 1:
             self.writer.write("Results from And Operations:\n")
             self.andResolver.summarize()
+            self.writer.write("Results from And-Exists Operations:\n")
+            self.andExistsResolver.summarize()
             self.writer.write("Results from Or Operations:\n")
             self.orResolver.summarize()
             self.writer.write("Results from Implication Testing Operations:\n")
@@ -33,25 +33,43 @@
 import sys
 import getopt
 import datetime
+import collections
+import heapq
 
 import bdd
 import resolver
 import proof
 import util
+import metrics
 
 
-# Increase maximum recursion depth
-sys.setrecursionlimit(50 * sys.getrecursionlimit())
-
 def usage(name):
-    sys.stderr.write("Usage: %s [-h][-v LEVEL]  [-i ifile] [-o file.cnf] [-p file.{qrat,qproof}] [-P VPERM] [-L logfile]\n" % name)
+    sys.stderr.write("Usage: %s [-h][-v LEVEL] [-A] [-a] [-C] [-c CSIZE] [-r RSIZE] [-R] [-E] [-W QSIZE] [-M] [-S NSAMPLE] [-m MODE] [-J file.json] [-B file.bdds] [-s POLICY] [-b CFILE] [-k SIZE] [-i ifile] [-o file.cnf] [-p file.{qrat,qproof,bqproof}] [-P VPERM] [-L logfile]\n" % name)
     sys.stderr.write("  -h          Print this message\n")
     sys.stderr.write("  -v LEVEL    Set verbosity level\n")
+    sys.stderr.write("  -A          Hold BDD nodes in compact, array-based node store\n")
+    sys.stderr.write("  -a          Hold proof clauses and antecedents in compact, array-based clause store\n")
+    sys.stderr.write("  -C          Represent negation with complement edges\n")
+    sys.stderr.write("  -c CSIZE    Limit operation cache to CSIZE entries\n")
+    sys.stderr.write("  -r RSIZE    Memoize up to RSIZE resolvents of pairs of proof clauses\n")
+    sys.stderr.write("  -R          Reorder variables dynamically by sifting.  Disables proof generation\n")
+    sys.stderr.write("  -E          Disable early quantification of variables occurring in only one term (modes r and n)\n")
+    sys.stderr.write("  -W QSIZE    Write proof on background thread, with up to QSIZE batches of steps queued\n")
+    sys.stderr.write("  -M          Print number of models of final BDD over free variables\n")
+    sys.stderr.write("  -S NSAMPLE  Print NSAMPLE uniformly chosen models of final BDD over free variables\n")
+    sys.stderr.write("  -m MODE     Proof mode: d (dual, default), r (refutation only), n (none)\n")
+    sys.stderr.write("              Fused AND-EXISTS operation is used only in modes r and n\n")
+    sys.stderr.write("  -J file     Write performance metrics to file (JSON format)\n")
+    sys.stderr.write("  -B file     Save final BDD as binary snapshot\n")
+    sys.stderr.write("  -s POLICY   Order for combining terms in bucket: tree (default), size, or affinity\n")
+    sys.stderr.write("  -b CFILE    Name of file specifying clusters of input clauses\n")
+    sys.stderr.write("  -k SIZE     Without cluster file, cluster clauses up to estimated BDD size SIZE (default = 0: no clustering)\n")
     sys.stderr.write("  -i ifile    Name of input file (qdimacs format)\n")
     sys.stderr.write("  -o bfile    Name of output file (cnf format with comments)\n")
-    sys.stderr.write("  -p pfile    Name of proof output file (QRAT or QPROOF format)\n")
+    sys.stderr.write("  -p pfile    Name of proof output file (QRAT, QPROOF, or binary QPROOF format)\n")
     sys.stderr.write("  -P VPERM    Name of file specifying mapping from CNF variable to BDD level\n")
     sys.stderr.write("  -L logfile  Append standard error output to logfile\n")
+    sys.stderr.write("  Input, proof, and permutation files with suffix .gz, .xz, or .bz2 are (de)compressed on the fly\n")
 
 # Verbosity levels
 # 0: Totally silent
@@ -72,14 +90,12 @@ class Term:
     manager = None
     root = None
     support = None    # Variables in support represented by list
-    size = 0
     validation = None # Clause id providing validation
     mode = None # What is type of proof is being generated
 
     def __init__(self, manager, root, validation, mode = None):
         self.manager = manager
         self.root = root
-        self.size = self.manager.getSize(root)
         self.support = None
         self.validation = validation
         if mode is None:
@@ -92,6 +108,11 @@ class Term:
             self.support = self.manager.getSupportIds(self.root)
         return self.support
 
+    # Number of BDD nodes.  Computed on demand and memoized by manager
+    @property
+    def size(self):
+        return self.manager.getSize(self.root)
+
     # Generate conjunction of two terms
     # All four modes
     def combine(self, other):
@@ -116,6 +137,36 @@ class Term:
             newRoot = self.manager.applyAnd(self.root, other.root)
         return Term(self.manager, newRoot, validation, mode = self.mode)
 
+    # Existentially quantify conjunction of two terms
+    # No proof or refutation
+    def andExists(self, other, literals, prover):
+        validation = None
+        if self.mode == proof.ProverMode.refProof:
+            newRoot, implication = self.manager.applyAndExistsJustify(self.root, other.root, literals)
+            if newRoot == self.manager.leaf1:
+                return None
+            if implication == resolver.tautologyId:
+                antecedents = [self.validation, other.validation]
+            else:
+                # Implication may subsume [-A, -B, R].  Only use validations of arguments it contains
+                iclause = self.manager.prover.clauseDict[implication]
+                antecedents = []
+                if -self.root.id in iclause:
+                    antecedents.append(self.validation)
+                if -other.root.id in iclause and other.root != self.root:
+                    antecedents.append(other.validation)
+                antecedents.append(implication)
+            if newRoot == self.manager.leaf0:
+                comment = "AndExists: Validation of Empty clause"
+            else:
+                comment = "AndExists: Validation of %s" % newRoot.label()
+            validation = self.manager.prover.proveAddResolution([newRoot.id], antecedents, comment)
+        else:
+            newRoot = self.manager.applyAndExists(self.root, other.root, literals)
+            if newRoot == self.manager.leaf1:
+                return None
+        return Term(self.manager, newRoot, validation, mode = self.mode)
+
     # No proof or refutation
     def equantifySimple(self, literals, prover):
         newRoot = self.manager.equant(self.root, literals)
@@ -518,6 +569,8 @@ class Term:
         nodeList = self.manager.getNodeList(root, includeLeaves = False)
         newNodeList = self.manager.shiftNodes(nodeList, startId)
         newRoot = newNodeList[-1]
+        if root.isComplemented():
+            newRoot = newRoot.negation()
         check, implication = self.manager.justifyImply(root, newRoot)
         antecedents = [implication, self.validation]
         comment = "Add unit clause for shifting root from %s to %s" % (root.label(), newRoot.label())
@@ -525,6 +578,122 @@ class Term:
         return Term(self.manager, newRoot, validation, mode = self.mode)
 
 
+# Dictionary of active terms, indexed by term id.
+# Maintains inverted index from each variable to the ids of the terms containing it in their supports
+class ActiveTerms(dict):
+    # Mapping from variable Id to set of term ids
+    varTerms = {}
+
+    def __init__(self):
+        dict.__init__(self)
+        self.varTerms = {}
+
+    def __setitem__(self, id, term):
+        if id in self:
+            del self[id]
+        dict.__setitem__(self, id, term)
+        for v in term.getSupport():
+            if v in self.varTerms:
+                self.varTerms[v].add(id)
+            else:
+                self.varTerms[v] = set([id])
+
+    def __delitem__(self, id):
+        for v in self[id].getSupport():
+            idSet = self.varTerms[v]
+            idSet.remove(id)
+            if len(idSet) == 0:
+                del self.varTerms[v]
+        dict.__delitem__(self, id)
+
+    # Find those variables in list that occur only in terms with the given ids
+    def localVariables(self, varList, idList):
+        return [v for v in varList if v in self.varTerms and self.varTerms[v].issubset(idList)]
+
+# Terms in a quantification bucket, and the order in which they get combined.
+# Default policy: queue, where results are added to the end.
+# This combines terms according to a balanced binary tree
+class TermBucket:
+    name = "tree"
+    solver = None
+    ids = None
+
+    def __init__(self, solver):
+        self.solver = solver
+        self.ids = collections.deque()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(list(self.ids))
+
+    def append(self, id):
+        self.ids.append(id)
+
+    def clear(self):
+        self.ids.clear()
+
+    # Remove next term to combine
+    def removeNext(self):
+        return self.ids.popleft()
+
+    # Remove next pair of terms to combine
+    def removePair(self):
+        id1 = self.removeNext()
+        id2 = self.removeNext()
+        return id1, id2
+
+# Combine two smallest terms, according to BDD size
+class SizeBucket(TermBucket):
+    name = "size"
+
+    def __init__(self, solver):
+        self.solver = solver
+        self.ids = []
+
+    def __iter__(self):
+        return iter([id for (size, id) in sorted(self.ids)])
+
+    def append(self, id):
+        heapq.heappush(self.ids, (self.solver.activeIds[id].size, id))
+
+    def removeNext(self):
+        size, id = heapq.heappop(self.ids)
+        return id
+
+# Combine smallest term with the term whose support overlaps it most closely,
+# measured as the ratio of shared variables to all variables in the two supports.
+# Ties broken in favor of smaller terms
+class AffinityBucket(SizeBucket):
+    name = "affinity"
+
+    def removePair(self):
+        id1 = self.removeNext()
+        support1 = self.solver.activeIds[id1].root.support
+        best = None
+        bestScore = None
+        for i in range(len(self.ids)):
+            size, id2 = self.ids[i]
+            support2 = self.solver.activeIds[id2].root.support
+            union = bin(support1 | support2).count('1')
+            shared = bin(support1 & support2).count('1')
+            # Compare shared/union between candidates without division
+            score = (shared, union, size, id2)
+            if best is None or score[0] * bestScore[1] > bestScore[0] * score[1] or \
+               score[0] * bestScore[1] == bestScore[0] * score[1] and score[2:] < bestScore[2:]:
+                best = i
+                bestScore = score
+        size, id2 = self.ids[best]
+        self.ids[best] = self.ids[-1]
+        self.ids.pop()
+        heapq.heapify(self.ids)
+        return id1, id2
+
+bucketPolicies = { bclass.name : bclass for bclass in [TermBucket, SizeBucket, AffinityBucket] }
+
+proofModes = { 'n' : proof.ProverMode.noProof, 'r' : proof.ProverMode.refProof, 'd' : proof.ProverMode.dualProof }
+
 class SolverException(Exception):
 
     def __init__(self, value):
@@ -547,6 +716,8 @@ class Solver:
 
     # Dictionary of Ids of terms remaining to be combined
     activeIds = {}
+    # Quantify existential variables as soon as they occur in only one term
+    earlyQuantify = True
     # Have found formula to be True, False, or Unknown (None)
     outcome = None
     permuter = None
@@ -554,9 +725,29 @@ class Solver:
     writer = None
     # Mapping from quantifier levels to tuple (vars,isExistential)
     quantMap = {}
-
-    def __init__(self, reader = None, prover = None, permuter = None, verbLevel = 1):
+    # Largest combined size of active terms measured
+    maxActiveSize = 0
+    # List of (level, peak live nodes) for buckets processed
+    bucketPeaks = []
+    # Level of bucket being processed, and peak live nodes before it started
+    peakLevel = None
+    priorPeak = 0
+    # Name of policy for choosing which terms in bucket to combine
+    bucketPolicy = "tree"
+    # Limit on estimated BDD size when automatically clustering input clauses.  0 disables clustering
+    clusterLimit = 0
+    # Have clauses already been clustered?
+    clustered = False
+
+    def __init__(self, reader = None, prover = None, permuter = None, verbLevel = 1, arrayStore = False, complementEdges = False, cacheSize = None,
+                 reorder = False, metrics = None, bucketPolicy = "tree", clusterLimit = 0, earlyQuantify = True):
         self.verbLevel = verbLevel
+        self.earlyQuantify = earlyQuantify
+        self.clusterLimit = clusterLimit
+        self.clustered = False
+        if bucketPolicy not in bucketPolicies:
+            raise SolverException("Unknown scheduling policy '%s'" % bucketPolicy)
+        self.bucketPolicy = bucketPolicy
         if prover is None:
             prover = proof.Prover(verbLevel = verbLevel)
         self.prover = prover
@@ -583,7 +774,10 @@ class Solver:
         self.prover.inputDone()
 
         self.manager = bdd.Manager(prover = self.prover, rootGenerator = self.rootGenerator,
-                                   nextNodeId = reader.nvar+1, verbLevel = verbLevel)
+                                   nextNodeId = reader.nvar+1, verbLevel = verbLevel, arrayStore = arrayStore,
+                                   complementEdges = complementEdges, cacheSize = cacheSize, reorder = reorder)
+        if metrics is not None:
+            metrics.instrumentManager(self.manager)
         # Generate BDD representations of literals
         if permuter is None:
             # Default is identity permutation
@@ -599,7 +793,7 @@ class Solver:
             self.varMap[inputId] = var
         # Generate BDD representations of clauses
         self.termCount = 0
-        self.activeIds = {}
+        self.activeIds = ActiveTerms()
         for clause in reader.clauses:
             self.termCount += 1
             litList = [self.getLiteral(lval) for lval in clause]
@@ -614,6 +808,12 @@ class Solver:
             term = Term(self.manager, root, validation, mode = prover.mode)
             self.activeIds[self.termCount] = term
         self.outcome = None
+        self.maxActiveSize = 0
+        self.bucketPeaks = []
+        self.peakLevel = None
+        self.priorPeak = 0
+        if metrics is not None:
+            metrics.instrumentSolver(self)
 
     def getLiteral(self, lval):
         if lval not in self.litMap:
@@ -676,6 +876,7 @@ class Solver:
             self.outcome = False
             self.manager.summarize()
             return -1
+        self.manager.checkReorder()
         return self.termCount
 
     # Used in refutation proofs, and when no proof
@@ -704,6 +905,40 @@ class Solver:
             self.prover.deleteClauses(clauseList)
         return self.termCount
 
+    # Existentially quantify conjunction of two terms
+    # Used in refutation proofs, and when no proof
+    def andExistsTerms(self, id1, id2, varList):
+        termA = self.activeIds[id1]
+        termB = self.activeIds[id2]
+        del self.activeIds[id1]
+        del self.activeIds[id2]
+        litList = [self.getLiteral(v) for v in varList]
+        clause = self.manager.buildClause(litList)
+        vstring = " ".join(sorted([str(v) for v in varList]))
+        if self.verbLevel >= 3:
+            print("Computing EQuant(%s) T%d (Node %s) & T%d (Node %s) --> T%d" % (vstring, id1, termA.root.label(), id2, termB.root.label(), self.termCount+1))
+        newTerm = termA.andExists(termB, clause, self.prover)
+        if newTerm is None:
+            return -1
+        self.termCount += 1
+        comment = "EQuant(%s) T%d (Node %s) & T%d (Node %s) --> T%d (Node %s)" % (vstring, id1, termA.root.label(), id2, termB.root.label(),
+                                                                                 self.termCount, newTerm.root.label())
+        self.prover.comment(comment)
+        if self.verbLevel >= 3:
+            print(comment)
+        self.activeIds[self.termCount] = newTerm
+        if newTerm.root == self.manager.leaf0:
+            if self.verbLevel >= 1:
+                self.writer.write("Conjunction: Formula FALSE\n")
+            self.outcome = False
+            self.manager.summarize()
+            return -1
+        # This could be a good time for garbage collection
+        clauseList = self.manager.checkGC(generateClauses = self.prover.mode != proof.ProverMode.noProof)
+        if len(clauseList) > 0:
+            self.prover.deleteClauses(clauseList)
+        return self.termCount
+
     # Used in dual proofs
     def uquantifyTermDual(self, id, var):
         term = self.activeIds[id]
@@ -890,6 +1125,37 @@ class Solver:
         if self.verbLevel >= 2:
             self.writer.write("Combined %d clauses to form %d clusters\n" % (clauseCount, clusterCount))
         infile.close()
+        self.clustered = True
+        return True
+
+    # Automatically cluster terms, without a cluster file.
+    # Only terms that would go into the same existential bucket get clustered.
+    # Within a bucket, terms are ordered by the level of their top variable,
+    # and consecutive terms are combined until their summed BDD sizes would exceed the limit.
+    # Returns False if formula found to be False
+    def clusterTerms(self):
+        groups = {}
+        for id in sorted(self.activeIds.keys()):
+            level = self.activeIds[id].root.qlevel-1
+            if level > 0 and self.quantMap[level][1]:
+                if level in groups:
+                    groups[level].append(id)
+                else:
+                    groups[level] = [id]
+        termCount = len(self.activeIds)
+        for level in sorted(groups.keys()):
+            ids = sorted(groups[level], key = lambda id: (self.activeIds[id].root.variable.level, id))
+            clusterId = None
+            for id in ids:
+                if clusterId is not None and self.activeIds[clusterId].size + self.activeIds[id].size <= self.clusterLimit:
+                    clusterId = self.combineTerms(clusterId, id)
+                    if clusterId < 0:
+                        return False
+                else:
+                    clusterId = id
+        if self.verbLevel >= 2:
+            self.writer.write("Automatically clustered %d terms to form %d clusters\n" % (termCount, len(self.activeIds)))
+        self.clustered = True
         return True
 
     def placeInQuantBucket(self, buckets, id):
@@ -903,30 +1169,64 @@ class Solver:
     # Bucket elimination based on quantification levels
     def runQuantBucket(self):
         levels = sorted(self.quantMap.keys(), key = lambda x : -x)
-        buckets = { level : [] for level in levels }
-        # Insert ids into lists according quantification level
-        ids = sorted(self.activeIds.keys())
+        bucketClass = bucketPolicies[self.bucketPolicy]
+        buckets = { level : bucketClass(self) for level in levels }
         # What is final BDD root
         resultNode = None
         # What is the validating clause for the root
         keepStep = None
         resultId = None
+        if self.clusterLimit > 0 and not self.clustered and not self.clusterTerms():
+            # Conjunction of clauses within cluster is False
+            resultNode = self.manager.leaf0
+            self.writer.write("Got False\n")
+            levels = []
+        # Insert ids into lists according quantification level
+        ids = sorted(self.activeIds.keys()) if resultNode is None else []
         for id in ids:
             if self.verbLevel >= 3:
                 self.writer.write("Initial cluster #%d.  Size: %d\n" % (id, self.activeIds[id].size))
             self.placeInQuantBucket(buckets, id)
         for blevel in levels:
+            self.recordBucketPeak(blevel)
             vars, isExistential = self.quantMap[blevel]
             if self.verbLevel >= 3:
                 self.writer.write("Processing %s level %d.  Vars = %s.  Bucket size = %d\n" %
                                   ("existential" if isExistential else "universal", blevel, str(vars), len(buckets[blevel])))
+            if self.verbLevel >= 2:
+                self.writer.write("Level %d: %d active terms.  Combined size = %d nodes.  Unique table size = %d\n" %
+                                  (blevel, len(self.activeIds), self.activeSize(), len(self.manager.uniqueTable)))
             if isExistential:
                 # Conjunct all terms in bucket
                 gotFalse = False
+                # Can quantify final pair of terms while forming their conjunction
+                fuse = blevel > 1 and self.prover.mode in [proof.ProverMode.noProof, proof.ProverMode.refProof]
+                early = fuse and self.earlyQuantify
+                if early:
+                    # Quantify variables that occur in only one term
+                    idList = list(buckets[blevel])
+                    buckets[blevel].clear()
+                    for id in idList:
+                        localVars = self.activeIds.localVariables(vars, [id])
+                        if len(localVars) > 0 and len(idList) > 1:
+                            id = self.equantifyTerm(id, localVars)
+                        self.placeInQuantBucket(buckets, id)
                 while len(buckets[blevel]) > 1:
-                    id1 = buckets[blevel][0]
-                    id2 = buckets[blevel][1]
-                    buckets[blevel] = buckets[blevel][2:]
+                    id1, id2 = buckets[blevel].removePair()
+                    if fuse and len(buckets[blevel]) == 0:
+                        # Final pair of terms
+                        qvars = vars
+                    else:
+                        # Variables that occur in no other terms
+                        qvars = self.activeIds.localVariables(vars, [id1, id2]) if early else []
+                    if len(qvars) > 0:
+                        newId = self.andExistsTerms(id1, id2, qvars)
+                        if newId < 0 and self.outcome == False:
+                            # Hit False case
+                            gotFalse = True
+                            break
+                        self.placeInQuantBucket(buckets, newId)
+                        continue
                     newId = self.combineTerms(id1, id2)
                     if newId < 0:
                         # Hit False case
@@ -945,14 +1245,13 @@ class Solver:
                         resultNode = self.manager.leaf1
                         self.writer.write("Got tautology\n")
                         break
-                    id = buckets[blevel][0]
+                    id = buckets[blevel].removeNext()
                     resultNode = self.activeIds[id].root
                     resultId = id
                     keepStep = self.activeIds[id].validation
                     break
                 elif blevel > 1 and len(buckets[blevel]) > 0:
-                    id = buckets[blevel][0]
-                    buckets[blevel] = []
+                    id = buckets[blevel].removeNext()
                     if self.prover.mode in [proof.ProverMode.satProof, proof.ProverMode.dualProof]:
                         # Satisfaction
                         if len(vars) > 1:
@@ -996,6 +1295,7 @@ class Solver:
                                 resultNode = self.manager.leaf0
                                 break
                         self.placeInQuantBucket(buckets, newId)
+        self.recordBucketPeak(None)
 
         # Get here with resultNode
         if resultNode is None:
@@ -1034,6 +1334,15 @@ class Solver:
             bsize = self.manager.getSize(resultNode)
             self.writer.write("Got final output BDD with root node %d.  BDD size = %s\n" %
                               (resultNode.id, bsize))
+            self.writer.write("Maximum combined size of active terms: %d nodes\n" % self.maxActiveSize)
+        if self.verbLevel >= 1:
+            self.writer.write("Scheduling policy: %s.  Peak live nodes: %d\n" % (self.bucketPolicy, self.manager.maxLiveCount))
+            if len(self.bucketPeaks) > 0:
+                (level, peak) = max(self.bucketPeaks, key = lambda p : p[1])
+                self.writer.write("Largest bucket peak: %d live nodes at level %d\n" % (peak, level))
+        if self.verbLevel >= 2:
+            for (level, peak) in self.bucketPeaks:
+                self.writer.write("  Level %d: Peak live nodes = %d\n" % (level, peak))
 
 
         if self.verbLevel >= 0:
@@ -1043,6 +1352,24 @@ class Solver:
 
         return resultNode
 
+    # Number of BDD nodes used by active terms, counting shared nodes once
+    def activeSize(self):
+        size = self.manager.getCombinedSize([t.root for t in self.activeIds.values()])
+        self.maxActiveSize = max(self.maxActiveSize, size)
+        return size
+
+    # Finish measuring peak live nodes for current bucket, and start measuring for bucket at level
+    # Manager's peak is reset to current count while bucket is processed, and then restored
+    def recordBucketPeak(self, level):
+        if self.peakLevel is not None:
+            peak = self.manager.maxLiveCount
+            self.bucketPeaks.append((self.peakLevel, peak))
+            self.manager.maxLiveCount = max(self.priorPeak, peak)
+        self.peakLevel = level
+        if level is not None:
+            self.priorPeak = self.manager.maxLiveCount
+            self.manager.maxLiveCount = len(self.manager.uniqueTable)
+
     # Provide roots of active nodes to garbage collector
     def rootGenerator(self):
         rootList = [t.root for t in self.activeIds.values()]
@@ -1062,14 +1389,73 @@ def run(name, args):
     mode = proof.ProverMode.dualProof
     stretchExistential = False
     stretchUniversal = False
-
-    optlist, args = getopt.getopt(args, "hP:v:i:p:o:m:p:L:")
+    arrayStore = False
+    clauseArrayStore = False
+    complementEdges = False
+    cacheSize = None
+    resolventCacheSize = 0
+    reorder = False
+    earlyQuantify = True
+    writerQueueSize = 0
+    countModels = False
+    sampleCount = 0
+    metricsName = None
+    snapshotName = None
+    bucketPolicy = "tree"
+    clusterName = None
+    clusterLimit = 0
+
+    optlist, args = getopt.getopt(args, "hAaCc:r:REW:MS:J:B:s:b:k:P:v:i:p:o:m:p:L:")
     for (opt, val) in optlist:
         if opt == '-h':
             usage(name)
             return
         elif opt == '-v':
             verbLevel = int(val)
+        elif opt == '-A':
+            arrayStore = True
+        elif opt == '-a':
+            clauseArrayStore = True
+        elif opt == '-C':
+            complementEdges = True
+        elif opt == '-c':
+            cacheSize = int(val)
+            if cacheSize < 1:
+                sys.stderr.write("Cache size must be at least 1\n")
+                usage(name)
+                return
+        elif opt == '-r':
+            resolventCacheSize = int(val)
+        elif opt == '-R':
+            reorder = True
+        elif opt == '-E':
+            earlyQuantify = False
+        elif opt == '-W':
+            writerQueueSize = int(val)
+        elif opt == '-M':
+            countModels = True
+        elif opt == '-S':
+            sampleCount = int(val)
+        elif opt == '-m':
+            if val not in proofModes:
+                sys.stderr.write("Unknown proof mode '%s'\n" % val)
+                usage(name)
+                return
+            mode = proofModes[val]
+        elif opt == '-J':
+            metricsName = val
+        elif opt == '-B':
+            snapshotName = val
+        elif opt == '-s':
+            if val not in bucketPolicies:
+                sys.stderr.write("Unknown scheduling policy '%s'\n" % val)
+                usage(name)
+                return
+            bucketPolicy = val
+        elif opt == '-b':
+            clusterName = val
+        elif opt == '-k':
+            clusterLimit = int(val)
         elif opt == '-i':
             cnfName = val
         elif opt == '-o':
@@ -1089,11 +1475,25 @@ def run(name, args):
 
     writer = util.Logger(logName)
 
+    if reorder:
+        if proofName is not None:
+            writer.write("Cannot generate proof when reordering variables\n")
+            return
+        if arrayStore:
+            writer.write("Cannot reorder variables held in array-based node store\n")
+            return
+        mode = proof.ProverMode.noProof
+
     try:
-        prover = proof.Prover(proofName, writer = writer, verbLevel = verbLevel, mode = mode)
+        prover = proof.Prover(proofName, writer = writer, verbLevel = verbLevel, mode = mode,
+                              arrayStore = clauseArrayStore)
     except Exception as ex:
         writer.write("Couldn't create prover (%s)\n" % str(ex))
         return
+    if resolventCacheSize > 0:
+        prover.resolventCache = resolver.ResolventCache(resolventCacheSize)
+    if writerQueueSize > 0 and mode != proof.ProverMode.noProof:
+        prover.startBackgroundWriter(writerQueueSize)
 
     # If no quantification permuter specified, follow variable ordering
     # This will cause the quantifications to be performed from the bottom of the BDDs upward
@@ -1111,6 +1511,11 @@ def run(name, args):
 
     start = datetime.datetime.now()
 
+    stats = None
+    if metricsName is not None:
+        stats = metrics.Metrics()
+        stats.instrumentProver(prover)
+
     if mode in [proof.ProverMode.satProof, proof.ProverMode.dualProof]:
         stretchExistential = True
     if mode in [proof.ProverMode.refProof, proof.ProverMode.dualProof]:
@@ -1125,20 +1530,46 @@ def run(name, args):
     if reader.stretched and mode != proof.ProverMode.noProof:
         prover.generateLevels(reader.varList)
 
-    solver = Solver(reader, prover = prover, permuter = permuter, verbLevel = verbLevel)
+    solver = Solver(reader, prover = prover, permuter = permuter, verbLevel = verbLevel, arrayStore = arrayStore, complementEdges = complementEdges,
+                    cacheSize = cacheSize, reorder = reorder, metrics = stats, bucketPolicy = bucketPolicy,
+                    clusterLimit = clusterLimit, earlyQuantify = earlyQuantify)
+    if clusterName is not None and not solver.processClusters(clusterName):
+        return
 
     node = solver.runQuantBucket()
     vlist = solver.quantMap[1][0]
     solver.manager.generateClauses(node, vlist, outfile)
     ncount = solver.manager.getSize(node)
     writer.write("Final BDD size: %d nodes\n" % ncount)
+    if countModels:
+        mcount = solver.manager.modelCount(node, [solver.varMap[id] for id in vlist])
+        writer.write("Model count: %d\n" % mcount)
+    if sampleCount > 0:
+        try:
+            samples = solver.manager.sampleModels(node, sampleCount, [solver.varMap[id] for id in vlist])
+        except bdd.BddException as ex:
+            writer.write("Cannot generate samples: %s\n" % str(ex))
+            samples = []
+        for model in samples:
+            writer.write("v %s 0\n" % " ".join([str(lit) for lit in model]))
+    if snapshotName is not None:
+        try:
+            solver.manager.saveSnapshot(snapshotName, [node])
+        except bdd.BddException as ex:
+            writer.write("Couldn't save snapshot: %s\n" % str(ex))
     if outfile != sys.stdout:
         outfile.close()
+    prover.close()
     
     delta = datetime.datetime.now() - start
     seconds = delta.seconds + 1e-6 * delta.microseconds
     if verbLevel > 0:
         writer.write("Elapsed time for SAT: %.2f seconds\n" % seconds)
+    if stats is not None:
+        try:
+            stats.write(metricsName)
+        except Exception as ex:
+            writer.write("Couldn't write metrics file '%s' (%s)\n" % (metricsName, str(ex)))
     if writer != sys.stderr:
         writer.close()
     
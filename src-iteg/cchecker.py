@@ -27,13 +27,20 @@
 import sys
 import getopt
 import datetime
+import array
+import gzip
+import lzma
+import bz2
 
 def usage(name):
-    print("Usage: %s [-h] [-v] -i FILE.qcnf -c FILE.qcnf -p FILE.qproof" % name)
+    print("Usage: %s [-h] [-v] [-b] [-r] -i FILE.qcnf -c FILE.qcnf -p FILE.qproof" % name)
     print("   -v        Print more helpful diagnostic information if there is an error")
+    print("   -b        Proof is in binary format (default when file has extension .bqproof)")
+    print("   -r        Proof is in refutation mode: only check that first file implies second")
     print(" -i FILE.qcnf   Original input file")
     print(" -c FILE.qcnf   File to be checked for equivalence")
     print(" -p FILE.qproof Proof of transformation from first file to second")
+    print(" Files with suffix .gz, .xz, or .bz2 are decompressed on the fly")
 
 
 ######################################################################################
@@ -98,8 +105,42 @@ def usage(name):
 #    No clauses other than those in first list can contain Var or -Var
 #    None of these can contain a universal literal > Var
 
+### Binary format
+
+# File starts with the bytes "QPB1", followed by 32-bit little-endian signed integers.
+# Each step consists of:
+#   command code, step number (0 for -), count of values, values
+# where the values are the numbers following the command in the text version.
+# Command codes: a=1, ab=2, ar=3, d=4, dd=5, dr=6, l=7, u=8, x=9
+
 ######################################################################################
 
+binaryMagic = b"QPB1"
+binaryCommands = { 1 : 'a', 2 : 'ab', 3 : 'ar', 4 : 'd', 5 : 'dd', 6 : 'dr', 7 : 'l', 8 : 'u', 9 : 'x' }
+binaryChunkSize = 1 << 20
+# Number of bytes to read at a time from text proof
+textChunkSize = 1 << 20
+# Command names, as they appear in text proof
+textCommands = { cmd.encode() : cmd for cmd in binaryCommands.values() }
+
+# Map from compression suffix to module providing open()
+compressionModules = { 'gz' : gzip, 'xz' : lzma, 'bz2' : bz2 }
+
+# Strip compression suffix (if any) from file name
+def baseFileName(fname):
+    fields = fname.split('.')
+    if len(fields) > 1 and fields[-1] in compressionModules:
+        return '.'.join(fields[:-1])
+    return fname
+
+# Open file, decompressing as it is read when it has suffix .gz, .xz, or .bz2
+def openFile(fname, mode = 'r'):
+    fields = fname.split('.')
+    if len(fields) > 1 and fields[-1] in compressionModules:
+        cmode = mode if 'b' in mode else mode + 't'
+        return compressionModules[fields[-1]].open(fname, cmode)
+    return open(fname, mode)
+
 def trim(s):
     while len(s) > 0 and s[-1] in ' \r\n\t':
         s = s[:-1]
@@ -254,7 +295,7 @@ class QcnfReader():
         self.failed = False
         self.errorMessage = ""
         try:
-            self.file = open(fname, 'r')
+            self.file = openFile(fname, 'r')
         except Exception:
             self.fail("Could not open file '%s'" % fname)
             return
@@ -573,6 +614,16 @@ class Prover:
     verbose = False
     lineNumber = 0
     line = ""
+    # Reading binary proof?
+    binary = False
+    # Read text proof in large chunks, converting numbers as they are read
+    fastParse = True
+    # Have the values following the command of the current step been converted to integers?
+    intFields = False
+    # Current step when reading binary proof
+    binaryStep = None
+    # Mapping from command to (handler, does handler take step Id as argument)
+    dispatchTable = {}
     # Clause Manager
     cmgr = None
     # List of input variables.
@@ -591,6 +642,13 @@ class Prover:
         self.verbose = verbose
         self.lineNumber = 0
         self.line = ""
+        self.binary = False
+        self.fastParse = True
+        self.intFields = False
+        self.binaryStep = None
+        self.dispatchTable = {'a' : (self.doAdd, True), 'ab' : (self.doAddBlocked, True), 'ar' : (self.doAddResolution, True),
+                              'd' : (self.doDelete, False), 'dd' : (self.doDeleteDavisPutnam, False), 'dr' : (self.doDeleteResolution, False),
+                              'l' : (self.doLevel, False), 'u' : (self.doUniversalReduction, True), 'x' : (self.doExtend, False) }
         self.cmgr = ClauseManager(verbose, trackLiveClauses)
         self.varDict = { v : (q, e) for (v, q, e) in qreader.varList }
         self.shiftedVarDict = {}
@@ -608,40 +666,44 @@ class Prover:
                 break
 
     def flagError(self, msg):
-        print("ERROR.  Line %d (%s): %s" % (self.lineNumber, self.line, msg))
+        line = self.line
+        if type(line) == bytes:
+            line = trim(line.decode(errors = 'replace'))
+        if line is None:
+            # Binary proof.  Show text form of step
+            line = ""
+            if self.binaryStep is not None:
+                (id, cmd, rest) = self.binaryStep
+                line = " ".join(['-' if id is None else str(id), cmd] + [str(v) for v in rest])
+        print("ERROR.  Line %d (%s): %s" % (self.lineNumber, line, msg))
         self.failed = True
 
-    def prove(self, fname):
+    def prove(self, fname, binary = False):
         foundLevels = False
         doneLevels = False
         if self.failed:
             self.failProof("Problem with QCNF file")
             return False
         try:
-            pfile = open(fname)
+            pfile = openFile(fname, 'rb' if binary or self.fastParse else 'r')
         except:
             self.failProof("Couldn't open proof file '%s" % fname)
             return False
-        for line in pfile:
-            self.line = trim(line)
-            self.lineNumber += 1
-            fields = line.split()
-            if len(fields) == 0 or fields[0][0] == 'c':
-                continue
-            try:
-                id = None if fields[0] == '-' else int(fields[0])
-            except:
-                self.flagError("First element must be dash or integer.  Got '%s'" % fields[0])
-                break
-            if len(fields) == 1:
-                self.flagError("No command present")
-                break
-            cmd = fields[1]
-            if cmd not in self.ruleCounters:
+        self.binary = binary
+        if binary:
+            steps = self.readBinarySteps(pfile)
+        elif self.fastParse:
+            steps = self.readFastTextSteps(pfile)
+        else:
+            steps = self.readTextSteps(pfile)
+        dispatchTable = self.dispatchTable
+        ruleCounters = self.ruleCounters
+        for (id, cmd, rest) in steps:
+            entry = dispatchTable.get(cmd)
+            if entry is None:
                 self.invalidCommand(cmd)
                 break
-            self.ruleCounters[cmd] += 1
-            rest = fields[2:]
+            ruleCounters[cmd] += 1
             # Dispatch on command
             # Level command requires special consideration, since it only occurs at beginning of file
             if cmd == 'l':
@@ -657,30 +719,137 @@ class Prover:
                     break
                 self.varDict = self.shiftedVarDict
             doneLevels = True
-            if cmd == 'a':
-                self.doAdd(id, rest)
-            elif cmd == 'ab':
-                self.doAddBlocked(id, rest)
-            elif cmd == 'ar':
-                self.doAddResolution(id, rest)
-            elif cmd == 'd':
-                self.doDelete(rest)
-            elif cmd == 'dd':
-                self.doDeleteDavisPutnam(rest)
-            elif cmd == 'dr':
-                self.doDeleteResolution(rest)
-            elif cmd == 'u':
-                self.doUniversalReduction(id, rest)
-            elif cmd == 'x':
-                self.doExtend(rest)
+            (handler, takesId) = entry
+            if takesId:
+                handler(id, rest)
             else:
-                self.invalidCommand(cmd)
+                handler(rest)
             if self.failed:
                 break
         pfile.close()
         self.checkProof()
         return not self.failed
-            
+
+    # Generate (id, command, rest) for each step of text proof.
+    # Rest is list of strings
+    def readTextSteps(self, pfile):
+        self.intFields = False
+        for line in pfile:
+            self.line = trim(line)
+            self.lineNumber += 1
+            fields = line.split()
+            if len(fields) == 0 or fields[0][0] == 'c':
+                continue
+            try:
+                id = None if fields[0] == '-' else int(fields[0])
+            except:
+                self.flagError("First element must be dash or integer.  Got '%s'" % fields[0])
+                return
+            if len(fields) == 1:
+                self.flagError("No command present")
+                return
+            yield (id, fields[1], fields[2:])
+
+    # Generate (id, command, rest) for each step of text proof, with file opened in binary mode.
+    # Reads file in large chunks and converts all of the numbers in a step at once.
+    # Rest is list of integers.  When a step contains an invalid number,
+    # rest is instead list of strings, so that command handlers can report the error
+    def readFastTextSteps(self, pfile):
+        lineNumber = self.lineNumber
+        commentByte = ord('c')
+        pending = b''
+        while True:
+            chunk = pfile.read(textChunkSize)
+            if len(chunk) == 0:
+                lines = [pending] if len(pending) > 0 else []
+            else:
+                lines = (pending + chunk).split(b'\n')
+                # Hold back partial line at end of chunk
+                pending = lines.pop()
+            for line in lines:
+                lineNumber += 1
+                fields = line.split()
+                if len(fields) == 0 or fields[0][0] == commentByte:
+                    continue
+                self.lineNumber = lineNumber
+                self.line = line
+                first = fields[0]
+                if first == b'-':
+                    id = None
+                else:
+                    try:
+                        id = int(first)
+                    except ValueError:
+                        self.flagError("First element must be dash or integer.  Got '%s'" % first.decode(errors = 'replace'))
+                        return
+                if len(fields) == 1:
+                    self.flagError("No command present")
+                    return
+                cmd = textCommands.get(fields[1])
+                if cmd is None:
+                    cmd = fields[1].decode(errors = 'replace')
+                # Lists rather than array('i') slices: building an array for each step,
+                # and converting its elements back to ints in the handlers, parsed ~20% slower
+                try:
+                    rest = list(map(int, fields[2:]))
+                    self.intFields = True
+                except ValueError:
+                    rest = [f.decode(errors = 'replace') for f in fields[2:]]
+                    self.intFields = False
+                yield (id, cmd, rest)
+            if len(chunk) == 0:
+                break
+        self.lineNumber = lineNumber
+
+    # Generate (id, command, rest) for each step of binary proof.
+    # Rest is list of integers.  Line numbers count steps
+    def readBinarySteps(self, pfile):
+        self.intFields = True
+        if pfile.read(len(binaryMagic)) != binaryMagic:
+            self.flagError("Not a binary proof file")
+            return
+        values = []
+        pending = b''
+        self.line = None
+        while True:
+            chunk = pfile.read(binaryChunkSize)
+            if len(chunk) == 0:
+                break
+            data = pending + chunk
+            # Hold back partial integer at end of chunk
+            usable = len(data) - len(data) % 4
+            pending = data[usable:]
+            words = array.array('i')
+            words.frombytes(data[:usable])
+            if sys.byteorder == 'big':
+                words.byteswap()
+            values += words.tolist()
+            pos = 0
+            count = len(values)
+            while pos + 3 <= count:
+                vcount = values[pos+2]
+                if vcount < 0:
+                    self.lineNumber += 1
+                    self.binaryStep = None
+                    self.flagError("Invalid value count %d in binary proof" % vcount)
+                    return
+                last = pos + 3 + vcount
+                if last > count:
+                    break
+                cmd = binaryCommands.get(values[pos])
+                if cmd is None:
+                    cmd = str(values[pos])
+                step = (values[pos+1] or None, cmd, values[pos+3:last])
+                pos = last
+                self.lineNumber += 1
+                self.binaryStep = step
+                yield step
+            values = values[pos:]
+        if len(values) > 0 or len(pending) > 0:
+            self.lineNumber += 1
+            self.binaryStep = None
+            self.flagError("Incomplete step at end of binary proof")
+
     def invalidCommand(self, cmd):
         self.flagError("Invalid command '%s' in proof" % cmd)
 
@@ -871,6 +1040,13 @@ class Prover:
     # Get integers until encounter 0.
     # return (list of integers, rest of input list, message)
     def getIntegerList(self, slist):
+        if self.intFields:
+            # Already have integers
+            try:
+                count = slist.index(0)
+            except ValueError:
+                return (None, slist, "Terminating zero not found")
+            return (slist[:count], slist[count+1:], "")
         ilist = []
         msg = ""
         count = 0
@@ -1218,19 +1394,72 @@ class CheckProver(DualProver):
         self.summarize()
         return not self.failed
 
+# Check proof generated in refutation mode.
+# Clauses can be deleted without justification, and so the proof
+# only shows that the input formula implies the check formula.
+# Requires each check clause to be live at the end of the proof
+class ImplicationProver(CheckProver):
+
+    def __init__(self, inQreader, checkQreader, verbose = False):
+        CheckProver.__init__(self, inQreader, checkQreader, verbose)
+
+    def doDelete(self, rest):
+        (idList, rest, msg) = self.getIntegerList(rest)
+        if idList is None:
+            self.flagError(msg)
+            return
+        if len(rest) > 0:
+            self.flagError("Extraneous values at end of line")
+            return
+        for id in idList:
+            (ok, msg) = self.cmgr.deleteClause(id)
+            if not ok:
+                self.flagError(msg)
+                return
+
+    def checkProof(self):
+        if self.failed:
+            self.failProof("")
+        elif self.cmgr.addedEmpty:
+            self.passProof("DERIVED FALSE")
+        else:
+            liveSet = set([str(self.cmgr.clauseDict[id]) for id in self.cmgr.liveClauseSet])
+            missing = []
+            for clause in self.checkQreader.clauses:
+                nclause = cleanClause(clause)
+                if not regularClause(nclause):
+                    continue
+                if str(nclause) not in liveSet:
+                    missing.append(nclause)
+            if len(missing) > 0:
+                msg = "%d check clauses not derived from input" % len(missing)
+                if self.verbose:
+                    msg += ": %s" % (str(missing))
+                self.failProof(msg)
+            else:
+                self.passProof("Input implies all %d check clauses." % len(self.checkQreader.clauses))
+        self.summarize()
+        return not self.failed
+
 
 def run(name, args):
     inQcnfName = None
     checkQcnfName = None
     proofName = None
     verbose = False
-    optList, args = getopt.getopt(args, "hvi:c:p:")
+    binary = False
+    implication = False
+    optList, args = getopt.getopt(args, "hvbri:c:p:")
     for (opt, val) in optList:
         if opt == '-h':
             usage(name)
             return False
         elif opt == '-v':
             verbose = True
+        elif opt == '-b':
+            binary = True
+        elif opt == '-r':
+            implication = True
         elif opt == '-i':
             inQcnfName = val
         elif opt == '-c':
@@ -1263,8 +1492,13 @@ def run(name, args):
         print("PROOF FAILED")
         return False
 
-    prover = CheckProver(iqreader, cqreader, verbose)
-    ok = prover.prove(proofName)
+    if baseFileName(proofName).split('.')[-1] == 'bqproof':
+        binary = True
+    if implication:
+        prover = ImplicationProver(iqreader, cqreader, verbose)
+    else:
+        prover = CheckProver(iqreader, cqreader, verbose)
+    ok = prover.prove(proofName, binary)
     delta = datetime.datetime.now() - start
     seconds = delta.seconds + 1e-6 * delta.microseconds
     print("Elapsed time for check: %.2f seconds" % seconds)
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+
+#####################################################################################
+# Copyright (c) 2021 Marijn Heule, Randal E. Bryant, Carnegie Mellon University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT
+# NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT
+# OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+########################################################################################
+
+# Benchmark text proof parsing in cchecker.
+# Compares the line-at-a-time reader that cchecker used previously
+# against the chunked reader, both for parsing alone
+# and for a complete check of the proof.
+# Reports throughput in proof lines per second.
+
+import sys
+import getopt
+import datetime
+import io
+import contextlib
+
+import cchecker
+
+def usage(name):
+    print("Usage: %s [-h] [-r REPS] -i IN.qcnf -c CHECK.qcnf -p FILE.qproof" % name)
+    print("  -h         Print this message")
+    print("  -r REPS    Number of repetitions of each measurement (default = 3)")
+    print("  -i IN      Input QCNF file")
+    print("  -c CHECK   Check QCNF file")
+    print("  -p FILE    Proof file (qproof format, optionally compressed)")
+
+def elapsed(start):
+    delta = datetime.datetime.now() - start
+    return delta.seconds + 1e-6 * delta.microseconds
+
+# Parse proof and convert fields to integers without checking.
+# Return (seconds, lines, steps)
+def timeParse(prover, fname):
+    prover.lineNumber = 0
+    start = datetime.datetime.now()
+    pfile = cchecker.openFile(fname, 'rb' if prover.fastParse else 'r')
+    steps = prover.readFastTextSteps(pfile) if prover.fastParse else prover.readTextSteps(pfile)
+    count = 0
+    for (id, cmd, rest) in steps:
+        count += 1
+        # Convert fields to integers, as the command handlers do
+        while len(rest) > 0:
+            (ilist, rest, msg) = prover.getIntegerList(rest)
+            if ilist is None:
+                break
+    pfile.close()
+    return (elapsed(start), prover.lineNumber, count)
+
+# Check complete proof.  Return (seconds, lines, passed)
+def timeCheck(inName, checkName, fname, fastParse):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        inQreader = cchecker.QcnfReader(inName)
+        checkQreader = cchecker.QcnfReader(checkName)
+        prover = cchecker.CheckProver(inQreader, checkQreader)
+        prover.fastParse = fastParse
+        start = datetime.datetime.now()
+        passed = prover.prove(fname)
+        seconds = elapsed(start)
+    return (seconds, prover.lineNumber, passed and "PROOF SUCCESSFUL" in output.getvalue())
+
+def run(name, args):
+    reps = 3
+    inName = None
+    checkName = None
+    proofName = None
+    optlist, args = getopt.getopt(args, "hr:i:c:p:")
+    for (opt, val) in optlist:
+        if opt == '-h':
+            usage(name)
+            return
+        elif opt == '-r':
+            reps = int(val)
+        elif opt == '-i':
+            inName = val
+        elif opt == '-c':
+            checkName = val
+        elif opt == '-p':
+            proofName = val
+    if inName is None or checkName is None or proofName is None:
+        usage(name)
+        return
+    times = {}
+    lines = {}
+    outcomes = {}
+    for r in range(reps):
+        for fastParse in [False, True]:
+            version = "current" if fastParse else "legacy"
+            with contextlib.redirect_stdout(io.StringIO()):
+                prover = cchecker.CheckProver(cchecker.QcnfReader(inName), cchecker.QcnfReader(checkName))
+            prover.fastParse = fastParse
+            seconds, nlines, count = timeParse(prover, proofName)
+            key = "parse-" + version
+            times[key] = min(times[key], seconds) if key in times else seconds
+            lines[key] = nlines
+            outcomes[key] = count
+            seconds, nlines, passed = timeCheck(inName, checkName, proofName, fastParse)
+            key = "check-" + version
+            times[key] = min(times[key], seconds) if key in times else seconds
+            lines[key] = nlines
+            outcomes[key] = passed
+    print("%d proof lines, %d steps.  Best of %d runs" % (lines["parse-current"], outcomes["parse-current"], reps))
+    print("%-10s %12s %12s %8s" % ("Operation", "Legacy l/s", "Current l/s", "Speedup"))
+    for op in ["parse", "check"]:
+        tl = times[op + "-legacy"]
+        tc = times[op + "-current"]
+        rl = lines[op + "-legacy"] / tl if tl > 0 else 0.0
+        rc = lines[op + "-current"] / tc if tc > 0 else 0.0
+        print("%-10s %12.0f %12.0f %8.2f" % (op, rl, rc, tl / tc if tc > 0 else 0.0))
+    ok = True
+    if outcomes["parse-legacy"] != outcomes["parse-current"] or lines["parse-legacy"] != lines["parse-current"]:
+        print("ERROR: Parsers read different numbers of steps")
+        ok = False
+    if not outcomes["check-legacy"] or not outcomes["check-current"]:
+        print("ERROR: Proof check failed")
+        ok = False
+    if ok:
+        print("Results identical")
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
@@ -0,0 +1,261 @@
+#####################################################################################
+# Copyright (c) 2021 Marijn Heule, Randal E. Bryant, Carnegie Mellon University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT
+# NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT
+# OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+########################################################################################
+
+# Optional instrumentation of BDD manager, resolvers, prover, and solver.
+# Instrumentation is installed by replacing methods of individual objects with timed versions,
+# and so it has no cost when not enabled.
+# Timing of manager methods ("families") covers only calls made through the methods themselves.
+# Operations that invoke one another as "Steps" generators bypass those methods,
+# and so their time is also recorded per generator ("steps").
+
+import time
+import json
+
+# Operation cache that counts hits and misses for each operation.
+# Cache lookups are performed by testing for membership
+class CacheMonitor:
+    cache = None
+    # Mapping from operation name to [hits, misses]
+    counts = {}
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.counts = {}
+
+    def __contains__(self, key):
+        found = key in self.cache
+        if key[0] not in self.counts:
+            self.counts[key[0]] = [0, 0]
+        self.counts[key[0]][0 if found else 1] += 1
+        return found
+
+    def __getitem__(self, key):
+        return self.cache[key]
+
+    def __setitem__(self, key, value):
+        self.cache[key] = value
+
+    def __delitem__(self, key):
+        del self.cache[key]
+
+    def __len__(self):
+        return len(self.cache)
+
+    def keys(self):
+        return self.cache.keys()
+
+    def clear(self):
+        self.cache.clear()
+
+    # Remaining operations supported by ComputedTable
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+class Metrics:
+    # Manager operations, by family
+    managerFamilies = {
+        "applyAndJustify" : "andJustify", "applyAnd" : "and",
+        "applyOrJustify" : "orJustify", "applyOr" : "or",
+        "applyNot" : "not", "applyXor" : "xor",
+        "justifyImply" : "imply", "checkImply" : "imply",
+        "equant" : "equant", "uquant" : "uquant",
+        "applyAndExists" : "andExists", "applyAndExistsJustify" : "andExistsJustify",
+        "applyRestrictDown" : "restrict", "applyRestrictUp" : "restrict",
+        "collectGarbage" : "gc", "reorderVariables" : "reorder" }
+    resolverNames = ["andResolver", "andExistsResolver", "orResolver", "implyResolver", "restrictResolver"]
+    proverMethods = ["createClause", "deleteClauses", "proveExtend", "proveAddResolution", "proveAddBlocked",
+                     "proveUniversal", "proveAdd", "proveDeleteResolution", "proveDeleteDavisPutnam", "qcollect"]
+    # Solver operations.  Live nodes get sampled after each one
+    solverFamilies = {
+        "combineTerms" : "combine", "andExistsTerms" : "andExistsTerms",
+        "equantifyTerm" : "quantify", "equantifyTermDualSatisfaction" : "quantify",
+        "uquantifyTerm" : "quantify", "uquantifyTermRefutation" : "quantify", "uquantifyTermDual" : "quantify" }
+
+    startTime = 0.0
+    manager = None
+    solver = None
+    cacheMonitor = None
+    # Mapping from family name to [calls, total seconds, seconds excluding nested instrumented calls]
+    families = {}
+    # Nesting depth of each family.  Recursive calls only counted once in total time
+    depths = {}
+    # Time in nested calls for each active call
+    nestedTimes = []
+    # Mapping from family name to [generator invocations, seconds spent in generator itself]
+    # Includes time in functions it calls directly, such as resolvers and the prover
+    steps = {}
+    # Mapping from generator function name to its entry in steps
+    stepEntries = {}
+    # Entries for generators being evaluated, innermost last
+    activeSteps = []
+    # Time at which time spent in generators was last recorded
+    stepTime = 0.0
+    # List of [seconds, event, unique table size, dead nodes]
+    samples = []
+
+    def __init__(self):
+        self.startTime = time.perf_counter()
+        self.manager = None
+        self.solver = None
+        self.cacheMonitor = None
+        self.families = {}
+        self.depths = {}
+        self.nestedTimes = [0.0]
+        self.steps = {}
+        self.stepEntries = {}
+        self.activeSteps = []
+        self.stepTime = 0.0
+        self.samples = []
+
+    # Replace method of object with one that records time spent in it
+    def instrument(self, obj, methodName, family, sample = False):
+        fun = getattr(obj, methodName)
+        if family not in self.families:
+            self.families[family] = [0, 0.0, 0.0]
+            self.depths[family] = 0
+        entry = self.families[family]
+        def timed(*args, **kwargs):
+            self.depths[family] += 1
+            self.nestedTimes.append(0.0)
+            start = time.perf_counter()
+            try:
+                return fun(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = self.nestedTimes.pop()
+                self.nestedTimes[-1] += elapsed
+                self.depths[family] -= 1
+                entry[0] += 1
+                if self.depths[family] == 0:
+                    entry[1] += elapsed
+                entry[2] += elapsed - nested
+                if sample:
+                    self.sample(family)
+        setattr(obj, methodName, timed)
+
+    def instrumentProver(self, prover):
+        for methodName in self.proverMethods:
+            self.instrument(prover, methodName, "proof")
+
+    def instrumentManager(self, manager):
+        self.manager = manager
+        for methodName, family in self.managerFamilies.items():
+            self.instrument(manager, methodName, family)
+        for resolverName in self.resolverNames:
+            self.instrument(getattr(manager, resolverName), "run", "resolve")
+        self.cacheMonitor = CacheMonitor(manager.operationCache)
+        manager.operationCache = self.cacheMonitor
+        self.instrumentSteps(manager)
+
+    # Entry in steps for generator.  Family determined by name of operation
+    def stepEntry(self, steps):
+        name = steps.gi_code.co_name
+        if name not in self.stepEntries:
+            opName = name[:-len("Steps")] if name.endswith("Steps") else name
+            family = self.managerFamilies.get(opName, opName)
+            if family not in self.steps:
+                self.steps[family] = [0, 0.0]
+            self.stepEntries[name] = self.steps[family]
+        return self.stepEntries[name]
+
+    # Replace evaluation of "Steps" generators with one that charges
+    # time to the generator that is running.
+    # Nested evaluations share the record of active generators
+    def instrumentSteps(self, manager):
+        clock = time.perf_counter
+        active = self.activeSteps
+        def timedRun(steps):
+            now = clock()
+            if len(active) > 0:
+                active[-1][1] += now - self.stepTime
+            self.stepTime = now
+            base = len(active)
+            stack = []
+            send = steps.send
+            active.append(self.stepEntry(steps))
+            value = None
+            try:
+                while True:
+                    try:
+                        subSteps = send(value)
+                    except StopIteration as ex:
+                        entry = active.pop()
+                        now = clock()
+                        entry[0] += 1
+                        entry[1] += now - self.stepTime
+                        self.stepTime = now
+                        if not stack:
+                            return ex.value
+                        send = stack.pop()
+                        value = ex.value
+                        continue
+                    now = clock()
+                    active[-1][1] += now - self.stepTime
+                    self.stepTime = now
+                    stack.append(send)
+                    send = subSteps.send
+                    active.append(self.stepEntry(subSteps))
+                    value = None
+            except BaseException:
+                del active[base:]
+                raise
+        manager.run = timedRun
+
+    def instrumentSolver(self, solver):
+        self.solver = solver
+        for methodName, family in self.solverFamilies.items():
+            self.instrument(solver, methodName, family, sample = True)
+
+    def sample(self, event):
+        seconds = time.perf_counter() - self.startTime
+        self.samples.append([round(seconds, 6), event, len(self.manager.uniqueTable), self.manager.deadCount])
+
+    def report(self):
+        seconds = time.perf_counter() - self.startTime
+        result = { "seconds" : seconds }
+        result["families"] = { family : { "calls" : entry[0], "seconds" : entry[1], "selfSeconds" : entry[2] }
+                               for family, entry in self.families.items() if entry[0] > 0 }
+        result["steps"] = { family : { "calls" : entry[0], "selfSeconds" : entry[1] }
+                            for family, entry in self.steps.items() if entry[0] > 0 }
+        if self.manager is not None:
+            caches = {}
+            for op, (hits, misses) in sorted(self.cacheMonitor.counts.items()):
+                caches[op] = { "hits" : hits, "misses" : misses, "hitRate" : float(hits) / (hits + misses) }
+            result["caches"] = caches
+            result["nodes"] = { "created" : self.manager.nodeCount,
+                                "perSecond" : self.manager.nodeCount / seconds if seconds > 0 else 0.0,
+                                "removed" : self.manager.nodesRemoved,
+                                "maxLive" : self.manager.maxLiveCount,
+                                "gcCount" : self.manager.gcCount }
+            cache = self.manager.prover.resolventCache
+            if cache is not None:
+                total = cache.hits + cache.misses
+                result["resolvents"] = { "hits" : cache.hits, "misses" : cache.misses,
+                                         "hitRate" : float(cache.hits) / total if total > 0 else 0.0,
+                                         "invalidated" : cache.invalidations, "evicted" : cache.evictions }
+        if self.solver is not None:
+            result["buckets"] = { "policy" : self.solver.bucketPolicy,
+                                  "peakLive" : [ { "level" : level, "nodes" : peak } for (level, peak) in self.solver.bucketPeaks ] }
+        result["samples"] = { "fields" : ["seconds", "event", "nodes", "deadNodes"], "values" : self.samples }
+        return result
+
+    def write(self, fname):
+        with open(fname, 'w') as outfile:
+            json.dump(self.report(), outfile, indent = 1)
+            outfile.write('\n')
@@ -21,9 +21,26 @@
 # Resolution Prover for QBF solver
 
 import sys
+import array
+import threading
+import queue
+import atexit
+import itertools
 import bdd
 import resolver
-
+import util
+
+# Binary version of qproof format (file extension .bqproof).
+# File starts with binaryMagic, followed by 32-bit little-endian signed integers.
+# Each step consists of:
+#   command code, step number (0 for unnumbered steps), count of values, values
+# where the values are the numbers that follow the command in the text version, including zeros.
+# Comments are not included
+binaryMagic = b"QPB1"
+binaryCommands = ['a', 'ab', 'ar', 'd', 'dd', 'dr', 'l', 'u', 'x']
+binaryCommandCodes = { cmd : i+1 for i, cmd in enumerate(binaryCommands) }
+# Number of integers to accumulate before writing to binary proof file
+binaryBufferSize = 1 << 18
 
 class ProverException(Exception):
 
@@ -33,6 +50,176 @@ class ProverException(Exception):
     def __str__(self):
         return "Prover Exception: " + str(self.value)
 
+# Format qproof step as line of text
+def formatStepQP(stepNumber, cmd, values):
+    fields = ['-' if stepNumber is None else str(stepNumber), cmd] + [str(v) for v in values]
+    return ' '.join(fields) + '\n'
+
+# Append binary encoding of qproof step to integer array
+def encodeStepQP(buffer, stepNumber, cmd, values):
+    buffer.append(binaryCommandCodes[cmd])
+    buffer.append(0 if stepNumber is None else stepNumber)
+    buffer.append(len(values))
+    buffer.extend(values)
+
+# Write proof on a separate thread, so that file output can overlap BDD operations.
+# The prover accumulates records into batches.  Full batches are passed
+# through a bounded queue to the worker thread, which formats and writes them.
+# Each record is either a tuple (stepNumber, cmd, values) for a qproof step,
+# or a string to be written as is.
+class BackgroundWriter:
+    file = None
+    doBinary = False
+    # Queue of batches waiting to be written.  None indicates that worker should stop
+    batchQueue = None
+    thread = None
+    # Records not yet passed to worker
+    batch = []
+    batchSize = 4096
+    # Exception raised by worker (if any)
+    error = None
+
+    def __init__(self, file, doBinary = False, queueSize = 16, batchSize = 4096):
+        self.file = file
+        self.doBinary = doBinary
+        self.batchQueue = queue.Queue(maxsize = queueSize)
+        self.batch = []
+        self.batchSize = batchSize
+        self.error = None
+        self.thread = threading.Thread(target = self.work, daemon = True)
+        self.thread.start()
+
+    def addStep(self, stepNumber, cmd, values):
+        self.batch.append((stepNumber, cmd, values))
+        if len(self.batch) >= self.batchSize:
+            self.submit()
+
+    def addText(self, text):
+        self.batch.append(text)
+        if len(self.batch) >= self.batchSize:
+            self.submit()
+
+    # Pass current batch to worker.  Blocks when queue is full
+    def submit(self):
+        if len(self.batch) > 0:
+            self.batchQueue.put(self.batch)
+            self.batch = []
+
+    # Wait until all records have been written
+    def flush(self):
+        self.submit()
+        self.batchQueue.join()
+        if self.error is not None:
+            raise ProverException("Background writer failed (%s)" % str(self.error))
+
+    # Write remaining records and stop worker thread
+    def finish(self):
+        try:
+            self.flush()
+        finally:
+            self.batchQueue.put(None)
+            self.thread.join()
+
+    def work(self):
+        while True:
+            batch = self.batchQueue.get()
+            if batch is None:
+                self.batchQueue.task_done()
+                return
+            try:
+                # Once a write has failed, discard remaining batches
+                if self.error is None:
+                    self.writeBatch(batch)
+            except Exception as ex:
+                self.error = ex
+            self.batchQueue.task_done()
+
+    def writeBatch(self, batch):
+        if self.doBinary:
+            buffer = array.array('i')
+            for record in batch:
+                encodeStepQP(buffer, *record)
+            if sys.byteorder == 'big':
+                buffer.byteswap()
+            buffer.tofile(self.file)
+        else:
+            self.file.write(''.join([record if type(record) == str else formatStepQP(*record) for record in batch]))
+
+# Compact storage of integer lists (clauses or antecedents), indexed by clause Id.
+# The lists are held in a single integer array (the pool).  Each entry in the pool
+# consists of the list length, followed by the list elements.
+# The offset index gives the position of each list in the pool, with 0 indicating none.
+# Entries freed by deletion are kept on free lists organized by length,
+# and are reused for lists of the same length.
+# Supports the dictionary operations used on Prover.clauseDict and Prover.antecedentDict,
+# with lists returned as tuples.
+class ClauseStore:
+    pool = None
+    offsets = None
+    # Mapping from length to list of offsets of free entries
+    freeLists = {}
+    # Number of lists stored
+    count = 0
+    # Number of pool entries taken from free lists
+    reuseCount = 0
+
+    def __init__(self):
+        # Position 0 is not used, so that offset 0 can indicate absence
+        self.pool = array.array('i', [0])
+        # 32-bit offsets.  Pool is limited to 2^32 integers
+        self.offsets = array.array('I')
+        self.freeLists = {}
+        self.count = 0
+        self.reuseCount = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, id):
+        return 0 <= id < len(self.offsets) and self.offsets[id] != 0
+
+    def __getitem__(self, id):
+        offset = self.offsets[id] if 0 <= id < len(self.offsets) else 0
+        if offset == 0:
+            raise KeyError(id)
+        pool = self.pool
+        return tuple(pool[offset+1:offset+1+pool[offset]])
+
+    def __setitem__(self, id, values):
+        if id in self:
+            del self[id]
+        size = len(self.offsets)
+        if id >= size:
+            self.offsets.extend(itertools.repeat(0, max(id + 1, 2 * size) - size))
+        length = len(values)
+        free = self.freeLists.get(length)
+        if free:
+            offset = free.pop()
+            self.pool[offset+1:offset+1+length] = array.array('i', values)
+            self.reuseCount += 1
+        else:
+            offset = len(self.pool)
+            self.pool.append(length)
+            self.pool.extend(values)
+        self.offsets[id] = offset
+        self.count += 1
+
+    def __delitem__(self, id):
+        offset = self.offsets[id] if 0 <= id < len(self.offsets) else 0
+        if offset == 0:
+            raise KeyError(id)
+        length = self.pool[offset]
+        if length in self.freeLists:
+            self.freeLists[length].append(offset)
+        else:
+            self.freeLists[length] = [offset]
+        self.offsets[id] = 0
+        self.count -= 1
+
+    # Number of integers held in pool, including free entries
+    def poolSize(self):
+        return len(self.pool)
+
 class ProverMode:
     (noProof, refProof, satProof, dualProof) = list(range(4))
     modeNames = ["No Proof", "Refutation Proof", "Satisfaction Proof", "Dual Proof"]
@@ -46,10 +233,19 @@ class Prover:
     writer = None
     opened = False
     verbLevel = 1
-    clauseDict = {}  # Mapping from clause ID to list of literals in clause
+    clauseDict = {}  # Mapping from clause ID to clause (tuple of literals)
     antecedentDict = {}  # Mapping from clause ID to list of antecedents
+    # Hold clauses and antecedents in ClauseStores rather than dictionaries
+    arrayStore = False
+    # Optional memo of resolvents of stored clauses (resolver.ResolventCache)
+    resolventCache = None
     mode = None
     doQrat = True
+    doBinary = False
+    # Integers not yet written to binary proof file
+    binaryBuffer = None
+    # Optional writer thread (BackgroundWriter)
+    backgroundWriter = None
     ### Support for satisfaction proofs
     # Mapping from Id to qlevel.  Items inserted by BDD manager
     idToQlevel = {}
@@ -63,56 +259,90 @@ class Prover:
     # Restrict justifications that encounter degenerate case
     restrictDegeneracies = set([])
 
-    def __init__(self, fname = None, writer = None, mode = None, verbLevel = 1):
+    def __init__(self, fname = None, writer = None, mode = None, verbLevel = 1, arrayStore = False):
         if mode is None:
             self.mode = ProverMode.noProof
         else:
             self.mode = mode
         self.verbLevel = verbLevel
         self.doQrat = False
+        self.doBinary = False
+        self.binaryBuffer = array.array('i')
+        self.backgroundWriter = None
         if fname is None:
             self.opened = False
             self.file = sys.stdout
         else:
             self.opened = True
+            fields = util.baseFileName(fname).split('.')
+            self.doQrat = fields[-1] == 'qrat'
+            self.doBinary = fields[-1] == 'bqproof'
             try:
-                self.file = open(fname, 'w')
+                if self.doBinary:
+                    self.file = util.openFile(fname, 'wb')
+                    self.file.write(binaryMagic)
+                else:
+                    self.file = util.openFile(fname, 'w')
             except Exception:
                 raise ProverException("Could not open file '%s'" % fname)
-            fields = fname.split('.')
-            self.doQrat = fields[-1] == 'qrat'
         self.writer = sys.stderr if writer is None else writer
         self.clauseCount = 0
         self.proofCount = 0
+        self.arrayStore = arrayStore
+        if arrayStore:
+            self.clauseDict = ClauseStore()
+            self.antecedentDict = ClauseStore()
         self.idToQlevel = {}
         self.qlevelClauses = {}
         self.qlevelEvars = {}
         self.evarQlevels = {}
         self.restrictDegeneracies = set([])
-
+        self.resolventCache = None
+
+    # Hand off formatting and writing of proof to worker thread,
+    # with up to queueSize batches of steps pending.
+    # Proof is closed at exit if not before, since worker thread
+    # cannot complete pending writes once interpreter is shutting down
+    def startBackgroundWriter(self, queueSize = 16):
+        if self.backgroundWriter is not None:
+            return
+        self.flush()
+        self.backgroundWriter = BackgroundWriter(self.file, self.doBinary, queueSize)
+        atexit.register(self.close)
+
+    # Write text to proof file
+    def writeText(self, text):
+        if self.backgroundWriter is None:
+            self.file.write(text)
+        else:
+            self.backgroundWriter.addText(text)
 
     def inputDone(self):
         self.inputClauseCount = self.clauseCount
 
     def comment(self, comment):
-        if self.mode == ProverMode.noProof:
+        if self.mode == ProverMode.noProof or self.doBinary:
             return
         if self.verbLevel > 1 and comment is not None:
-            self.file.write("c " + comment + '\n')
+            self.writeText("c " + comment + '\n')
 
     def expungeClause(self, id):
         if id in self.clauseDict:
             del self.clauseDict[id]
         if id in self.antecedentDict:
             del self.antecedentDict[id]
+        if self.resolventCache is not None:
+            self.resolventCache.invalidate(id)
 
     # Remove universal literal from clause in QRAT proof
     def qratUniversal(self, id, ulit):
         oclause = self.clauseDict[id]
-        nclause = [lit for lit in oclause if lit != ulit]
-        slist = ['u'] + [str(i) for i in ([ulit] + nclause + [0])]
-        self.file.write(" ".join(slist) + '\n')
+        nclause = tuple([lit for lit in oclause if lit != ulit])
+        slist = ['u'] + [str(i) for i in ([ulit] + list(nclause) + [0])]
+        self.writeText(" ".join(slist) + '\n')
         self.clauseDict[id] = nclause
+        if self.resolventCache is not None:
+            self.resolventCache.invalidate(id)
         return id
 
     def createClause(self, result, antecedent = [], comment = None, isInput = False, isUniversal = False, ulit = None):
@@ -123,7 +353,7 @@ class Prover:
         self.clauseCount += 1
         antecedent = list(antecedent)
         middle = ['u'] if isUniversal else []
-        rest = result + [0]
+        rest = list(result) + [0]
         if self.mode in [ProverMode.refProof, ProverMode.dualProof] and not self.doQrat:
             rest += antecedent + [0]
         ilist = [self.clauseCount] if not self.doQrat else []
@@ -133,9 +363,9 @@ class Prover:
         if isInput:
             self.comment(istring)
         else:
-            self.file.write(istring + '\n')
+            self.writeText(istring + '\n')
         if isUniversal and ulit is not None:
-            result = [lit for lit in result if lit != ulit]
+            result = tuple([lit for lit in result if lit != ulit])
         self.clauseDict[self.clauseCount] = result
         if len(antecedent) > 0:
             self.antecedentDict[self.clauseCount] = antecedent
@@ -147,23 +377,42 @@ class Prover:
             for id in clauseList:
                 slist = ['d'] + [str(lit) for lit in self.clauseDict[id]] + ['0']
                 istring = ' '.join(slist)
-                self.file.write(istring + '\n')
+                self.writeText(istring + '\n')
         else:
             for id in clauseList:
                 self.expungeClause(id)
-            slist = ['-', 'd'] + [str(id) for id in clauseList] + ['0']
-            istring = " ".join(slist)
-            self.file.write(istring + '\n')
-
-    def generateStepQP(self, fields, addNumber = True, comment = None):
+            self.writeStepQP(None, 'd', list(clauseList) + [0])
+
+    # Write step in either text or binary qproof format.
+    # Values are the numbers following the command
+    def writeStepQP(self, stepNumber, cmd, values):
+        if self.backgroundWriter is not None:
+            self.backgroundWriter.addStep(stepNumber, cmd, values)
+        elif self.doBinary:
+            encodeStepQP(self.binaryBuffer, stepNumber, cmd, values)
+            if len(self.binaryBuffer) >= binaryBufferSize:
+                self.flush()
+        else:
+            self.file.write(formatStepQP(stepNumber, cmd, values))
+
+    # Write any buffered steps
+    def flush(self):
+        if self.backgroundWriter is not None:
+            self.backgroundWriter.flush()
+        if self.doBinary and len(self.binaryBuffer) > 0:
+            if sys.byteorder == 'big':
+                self.binaryBuffer.byteswap()
+            self.binaryBuffer.tofile(self.file)
+            self.binaryBuffer = array.array('i')
+
+    def generateStepQP(self, cmd, values, addNumber = True, comment = None):
         self.comment(comment)
+        stepNumber = None
         if addNumber:
             self.clauseCount += 1
-            fields = [str(self.clauseCount)] + fields
-        else:
-            fields = ['-'] + fields
+            stepNumber = self.clauseCount
         if self.doQrat is False:
-            self.file.write(' '.join(fields) + '\n')
+            self.writeStepQP(stepNumber, cmd, values)
         return self.clauseCount
 
     ## Refutation and satisfaction steps
@@ -181,16 +430,14 @@ class Prover:
                 levelDict[l] = [v]
         levels = sorted(levelDict.keys())
         for l in levels:
-            fields = ['-', 'l', str(l)] + [str(v) for v in levelDict[l]] + ['0']
-            self.file.write(' '.join(fields) + '\n')
+            self.writeStepQP(None, 'l', [l] + levelDict[l] + [0])
 
     def proveExtend(self, var, level, comment = None):
-        fields = ['x', str(level), str(var), '0']
         if level not in self.qlevelEvars:
             self.qlevelEvars[level] = {}
         self.qlevelEvars[level][var] = []
         self.evarQlevels[var] = level
-        self.generateStepQP(fields, False, comment)
+        self.generateStepQP('x', [level, var, 0], False, comment)
 
     ## Refutation, satisfaction and dual steps, but with different actions
 
@@ -199,24 +446,21 @@ class Prover:
         if result == resolver.tautologyId:
             self.comment(comment)
             return result
-        rfields = [str(r) for r in result]
-        afields = [str(a) for a in antecedent]
         cmd =  'ar' if self.mode in [ProverMode.refProof, ProverMode.dualProof] else 'a'
-        fields = [cmd] + rfields + ['0']
+        values = list(result) + [0]
         if self.mode in [ProverMode.refProof, ProverMode.dualProof]:
-            afields = [str(a) for a in antecedent]
-            fields += afields + ['0']
-        stepNumber = self.generateStepQP(fields, True, comment)
+            values += list(antecedent) + [0]
+        stepNumber = self.generateStepQP(cmd, values, True, comment)
         if len(result) > 0 and self.mode in [ProverMode.satProof, ProverMode.refProof, ProverMode.dualProof]:
             qlevel = max([self.idToQlevel[abs(lit)] for lit in result])
             if qlevel in self.qlevelClauses:
                 self.qlevelClauses[qlevel].append(stepNumber)
             else:
-                self.qlevelClauses[qlevel] = [stepNumber]
+                self.qlevelClauses[qlevel] = array.array('i', [stepNumber])
         self.clauseDict[stepNumber] = result
         self.antecedentDict[stepNumber] = antecedent
         if self.doQrat:
-            self.file.write(' '.join(rfields) + ' 0\n')
+            self.writeText(' '.join([str(r) for r in result]) + ' 0\n')
         return stepNumber
 
     def proveAddBlocked(self, clause, blockers, comment = None):
@@ -224,13 +468,11 @@ class Prover:
         if result == resolver.tautologyId:
             self.comment(comment)
             return result
-        rfields = [str(r) for r in result]
         cmd =  'ab' if self.mode in [ProverMode.refProof, ProverMode.dualProof] else 'a'
-        fields = [cmd] + rfields + ['0']
+        values = list(result) + [0]
         if self.mode in [ProverMode.refProof, ProverMode.dualProof]:
-            bfields = [str(-abs(b)) for b in blockers]
-            fields += bfields + ['0']
-        stepNumber = self.generateStepQP(fields, True, comment)
+            values += [-abs(b) for b in blockers] + [0]
+        stepNumber = self.generateStepQP(cmd, values, True, comment)
         self.clauseDict[stepNumber] = result
         var = abs(clause[0])
         # Record defining clause
@@ -243,10 +485,9 @@ class Prover:
     ## Refutation and dual steps
 
     def proveUniversal(self, lit, oldId, comment = None):
-        fields = ['u', str(lit), str(oldId)]
-        stepNumber = self.generateStepQP(fields, True, comment)
+        stepNumber = self.generateStepQP('u', [lit, oldId], True, comment)
         oclause = self.clauseDict[oldId]
-        nclause = [l for l in oclause if l != lit]
+        nclause = tuple([l for l in oclause if l != lit])
         self.clauseDict[stepNumber] = nclause
         return stepNumber
 
@@ -257,9 +498,7 @@ class Prover:
         if result == resolver.tautologyId:
             self.comment(comment)
             return result
-        rfields = [str(r) for r in result]
-        fields = ['a'] + rfields + ['0']
-        stepNumber = self.generateStepQP(fields, True, comment)
+        stepNumber = self.generateStepQP('a', list(result) + [0], True, comment)
         self.clauseDict[stepNumber] = result
         if self.doQrat:
             return self.createClause(result, comment)
@@ -270,28 +509,24 @@ class Prover:
     def proveDeleteResolution(self, id, antecedent = None, comment = None):
         if self.doQrat:
             lfields = [str(lit) for lit in self.clauseDict[id]]
-            self.file.write('d ' + ' '.join(lfields) + ' 0\n')
+            self.writeText('d ' + ' '.join(lfields) + ' 0\n')
             self.expungeClause(id)
             return 
         if antecedent is None:
             antecedent = self.antecedentDict[id]
-        afields = [str(a) for a in antecedent]
-        fields = ['dr', str(id)] + afields + ['0']
-        self.generateStepQP(fields, False, comment)
+        self.generateStepQP('dr', [id] + list(antecedent) + [0], False, comment)
         self.expungeClause(id)
 
     def proveDeleteDavisPutnam(self, var, deleteIdList, causeIdList, comment = None):
-        dlist = [str(id) for id in deleteIdList]
         if self.doQrat:
             for id in deleteIdList:
                 list1 = [lit for lit in self.clauseDict[id] if abs(lit) == var]
                 list2 = [lit for lit in self.clauseDict[id] if abs(lit) != var]
                 slist = [str(lit) for lit in (list1+list2)]
-                self.file.write('d ' + ' '.join(slist) + ' 0\n')
+                self.writeText('d ' + ' '.join(slist) + ' 0\n')
         else:
-            clist = [str(id) for id in causeIdList]
-            fields = ['dd', str(var)] + dlist + ['0'] + clist + ['0']
-            self.generateStepQP(fields, False, comment)
+            values = [var] + list(deleteIdList) + [0] + list(causeIdList) + [0]
+            self.generateStepQP('dd', values, False, comment)
         for id in deleteIdList:
             if id not in self.clauseDict:
                 print("INTERNAL ERROR.  Cannot delete clause #%d.  Not in clause dictionary" % id)
@@ -316,7 +551,7 @@ class Prover:
                 if id in self.antecedentDict:
                     self.proveDeleteResolution(id, self.antecedentDict[id], comment)
                     comment = None
-            self.qlevelClauses[q] = []
+            self.qlevelClauses[q] = array.array('i')
 
         keepSet = set(keepList)
 
@@ -336,13 +571,30 @@ class Prover:
                 comment = None
 
     def summarize(self):
+        self.flush()
         if self.verbLevel >= 1:
             self.writer.write("Total Clauses: %d\n" % self.clauseCount)
             self.writer.write("Input clauses: %d\n" % self.inputClauseCount)
             acount = self.clauseCount - self.inputClauseCount - self.proofCount
             self.writer.write("Added clauses without antecedents: %d\n" % acount)
             self.writer.write("Added clauses requiring proofs: %d\n" % (self.proofCount))
-
-    def __del__(self):
+            if self.resolventCache is not None:
+                self.resolventCache.summarize(self.writer)
+            if self.arrayStore:
+                self.writer.write("Clause store: %d clauses, %d antecedent lists.  Pools hold %d + %d integers.  %d + %d entries reused\n" %
+                                  (len(self.clauseDict), len(self.antecedentDict), self.clauseDict.poolSize(), self.antecedentDict.poolSize(),
+                                   self.clauseDict.reuseCount, self.antecedentDict.reuseCount))
+
+    # Write any buffered steps and close proof file
+    def close(self):
+        if self.backgroundWriter is not None:
+            atexit.unregister(self.close)
+            self.backgroundWriter.finish()
+            self.backgroundWriter = None
         if self.opened:
+            self.flush()
             self.file.close()
+            self.opened = False
+
+    def __del__(self):
+        self.close()
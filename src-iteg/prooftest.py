@@ -0,0 +1,141 @@
+#!/usr/bin/python
+
+#####################################################################################
+# Copyright (c) 2021 Marijn Heule, Randal E. Bryant, Carnegie Mellon University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT
+# NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT
+# OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+########################################################################################
+
+# Check proofs generated by bddgen on random QBF formulas.
+# Each formula has its free variables at the outermost level,
+# followed by a series of existential levels.
+# Runs bddgen in refutation mode, where the final pair of terms at each
+# existential level is combined with the fused AND-EXISTS operation,
+# and in dual mode.  Checks each proof with cchecker.
+
+import sys
+import getopt
+import os
+import random
+import subprocess
+import tempfile
+
+def usage(name):
+    print("Usage: %s [-h] [-n COUNT] [-f FREE] [-e EXIST] [-b BLOCK] [-r RATIO] [-s SEED]" % name)
+    print("  -h        Print this message")
+    print("  -n COUNT  Number of random formulas (default = 4)")
+    print("  -f FREE   Number of free variables (default = 8)")
+    print("  -e EXIST  Number of existential variables (default = 16)")
+    print("  -b BLOCK  Number of variables in each existential level (default = 4)")
+    print("  -r RATIO  Ratio of clauses to variables (default = 2.5)")
+    print("  -s SEED   Random seed (default = 1)")
+
+# Bddgen options for each test case, and whether proof is in refutation mode
+testCases = [ ("refutation", ["-m", "r"], True),
+              ("refutation without early quantification", ["-m", "r", "-E"], True),
+              ("dual", ["-m", "d"], False),
+              ("dual with clustering", ["-m", "d", "-k", "40"], False) ]
+
+srcDir = os.path.dirname(os.path.abspath(__file__))
+
+def randomFormula(fname, rng, freeCount, existCount, blockSize, ratio):
+    nvar = freeCount + existCount
+    nclause = int(ratio * nvar)
+    outfile = open(fname, 'w')
+    outfile.write("p cnf %d %d\n" % (nvar, nclause))
+    for first in range(freeCount+1, nvar+1, blockSize):
+        vars = range(first, min(first+blockSize, nvar+1))
+        outfile.write("e %s 0\n" % " ".join([str(var) for var in vars]))
+    for c in range(nclause):
+        vars = rng.sample(range(1, nvar+1), 3)
+        lits = [var if rng.randint(0, 1) == 1 else -var for var in vars]
+        outfile.write(" ".join([str(lit) for lit in lits]) + " 0\n")
+    outfile.close()
+
+# Return (ok, message)
+def runCase(tdir, qname, flags, refutation):
+    oname = os.path.join(tdir, "formula.out")
+    pname = os.path.join(tdir, "formula.qproof")
+    cmd = [sys.executable, os.path.join(srcDir, "bddgen.py"), "-v", "2", "-i", qname, "-o", oname, "-p", pname] + flags
+    cp = subprocess.run(cmd, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+    if cp.returncode != 0 or not os.path.exists(oname):
+        return (False, "bddgen failed: %s" % cp.stdout.strip())
+    fused = 0
+    single = 0
+    with open(pname) as pfile:
+        for line in pfile:
+            if line.startswith("c EQuant(") and "&" in line:
+                fused += 1
+            elif line.startswith("c T") and "EQuant(" in line:
+                single += 1
+    cmd = [sys.executable, os.path.join(srcDir, "cchecker.py"), "-i", qname, "-c", oname, "-p", pname]
+    if refutation:
+        cmd.append("-r")
+    cp = subprocess.run(cmd, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+    if cp.returncode != 0 or "PROOF SUCCESSFUL" not in cp.stdout:
+        return (False, "Checker failed: %s" % cp.stdout.strip())
+    return (True, "%d fused operations, %d single-term quantifications" % (fused, single))
+
+def run(name, args):
+    count = 4
+    freeCount = 8
+    existCount = 16
+    blockSize = 4
+    ratio = 2.5
+    seed = 1
+    optlist, args = getopt.getopt(args, "hn:f:e:b:r:s:")
+    for (opt, val) in optlist:
+        if opt == '-h':
+            usage(name)
+            return
+        elif opt == '-n':
+            count = int(val)
+        elif opt == '-f':
+            freeCount = int(val)
+        elif opt == '-e':
+            existCount = int(val)
+        elif opt == '-b':
+            blockSize = int(val)
+        elif opt == '-r':
+            ratio = float(val)
+        elif opt == '-s':
+            seed = int(val)
+        else:
+            print("Unknown option '%s'" % opt)
+            usage(name)
+            return
+    rng = random.Random(seed)
+    failures = 0
+    fusedCount = 0
+    with tempfile.TemporaryDirectory() as tdir:
+        for i in range(count):
+            qname = os.path.join(tdir, "formula.qcnf")
+            randomFormula(qname, rng, freeCount, existCount, blockSize, ratio)
+            for (cname, flags, refutation) in testCases:
+                (ok, msg) = runCase(tdir, qname, flags, refutation)
+                print("Formula %d, %s proof: %s.  %s" % (i+1, cname, "PASS" if ok else "FAIL", msg))
+                if not ok:
+                    failures += 1
+                elif refutation:
+                    fusedCount += int(msg.split()[0])
+    if fusedCount == 0:
+        print("No refutation proof used fused AND-EXISTS operation")
+        failures += 1
+    print("%d failures" % failures)
+    sys.exit(1 if failures > 0 else 0)
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
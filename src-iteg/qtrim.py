@@ -0,0 +1,307 @@
+#!/usr/bin/python
+
+#####################################################################################
+# Copyright (c) 2021 Marijn Heule, Randal E. Bryant, Carnegie Mellon University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT
+# NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT
+# OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+########################################################################################
+
+# Trim qproof file by removing derived clauses that cannot affect the outcome.
+# Clauses added by resolution ('ar') or universal reduction ('u') are dropped
+# unless they can be reached by walking backward over the antecedents from:
+#   The clauses that are live at the end of the proof
+#     (or the empty clause, once it has been derived)
+#   The clauses referenced by steps that are always kept
+#     (blocked clauses, Davis-Putnam deletions, deletions of other clauses)
+# Deletions of dropped clauses are removed, and the remaining steps are renumbered.
+# Both the text and the binary version of the format are supported,
+# and the output format need not match the input format.
+
+import sys
+import getopt
+import datetime
+import array
+
+import proof
+import util
+
+def usage(name):
+    print("Usage: %s [-h] [-v VLEVEL] -i IN.qproof -o OUT.qproof" % name)
+    print("  -h         Print this message")
+    print("  -v VLEVEL  Set verbosity level")
+    print("  -i IN      Input proof (.qproof or .bqproof, optionally compressed)")
+    print("  -o OUT     Output proof (.qproof or .bqproof, optionally compressed)")
+
+class TrimException(Exception):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return "Trim Exception: " + str(self.value)
+
+# Number of bytes to read at a time from binary proof
+binaryChunkSize = 1 << 20
+
+# Generate proof steps as tuples of form (stepNumber, cmd, values)
+# stepNumber is None for unnumbered steps.  Comments are skipped
+def readSteps(fname):
+    binary = util.baseFileName(fname).split('.')[-1] == 'bqproof'
+    try:
+        pfile = util.openFile(fname, 'rb' if binary else 'r')
+    except Exception:
+        raise TrimException("Could not open file '%s'" % fname)
+    try:
+        if binary:
+            yield from readBinarySteps(pfile)
+        else:
+            yield from readTextSteps(pfile)
+    finally:
+        pfile.close()
+
+def readTextSteps(pfile):
+    lineNumber = 0
+    for line in pfile:
+        lineNumber += 1
+        fields = line.split()
+        if len(fields) == 0 or fields[0][0] == 'c':
+            continue
+        if len(fields) < 2:
+            raise TrimException("Line #%d.  Incomplete step" % lineNumber)
+        try:
+            stepNumber = None if fields[0] == '-' else int(fields[0])
+            values = [int(f) for f in fields[2:]]
+        except ValueError:
+            raise TrimException("Line #%d.  Invalid number" % lineNumber)
+        yield (stepNumber, fields[1], values)
+
+def readBinarySteps(pfile):
+    if pfile.read(len(proof.binaryMagic)) != proof.binaryMagic:
+        raise TrimException("Not a binary proof file")
+    words = []
+    pos = 0
+    leftover = b''
+    while True:
+        chunk = pfile.read(binaryChunkSize)
+        if len(chunk) == 0:
+            break
+        chunk = leftover + chunk
+        extra = len(chunk) % 4
+        leftover = chunk[len(chunk)-extra:] if extra > 0 else b''
+        buffer = array.array('i')
+        buffer.frombytes(chunk[:len(chunk)-extra])
+        if sys.byteorder == 'big':
+            buffer.byteswap()
+        words = words[pos:] + buffer.tolist()
+        pos = 0
+        while pos + 3 <= len(words):
+            count = words[pos+2]
+            if pos + 3 + count > len(words):
+                break
+            code = words[pos]
+            if code < 1 or code > len(proof.binaryCommands):
+                raise TrimException("Invalid command code %d" % code)
+            stepNumber = words[pos+1]
+            yield (None if stepNumber == 0 else stepNumber, proof.binaryCommands[code-1], words[pos+3:pos+3+count])
+            pos += 3 + count
+    if pos < len(words) or len(leftover) > 0:
+        raise TrimException("Incomplete step at end of binary proof")
+
+# Split list of form X* 0 Y* into X* and Y*
+def splitList(values):
+    try:
+        pos = values.index(0)
+    except ValueError:
+        raise TrimException("Terminating zero not found")
+    return (values[:pos], values[pos+1:])
+
+class Trimmer:
+    writer = None
+    verbLevel = 1
+    # Mapping from Id of derived clause to list of antecedents,
+    # including those used to delete the clause
+    dependencyDict = {}
+    # Ids of clauses that must be retained
+    roots = set([])
+    # Ids of derived clauses that are retained
+    keepSet = set([])
+    # Id of first empty clause added (if any)
+    emptyId = None
+    # Statistics
+    stepCount = 0
+    derivedCount = 0
+
+    def __init__(self, writer = None, verbLevel = 1):
+        self.writer = sys.stderr if writer is None else writer
+        self.verbLevel = verbLevel
+        self.dependencyDict = {}
+        self.roots = set([])
+        self.keepSet = set([])
+        self.emptyId = None
+        self.stepCount = 0
+        self.derivedCount = 0
+
+    # First pass.  Build dependency graph and determine roots
+    def analyze(self, fname):
+        liveSet = set([])
+        for (stepNumber, cmd, values) in readSteps(fname):
+            self.stepCount += 1
+            if cmd == 'ar':
+                (clause, antecedents) = splitList(values)
+                antecedents = splitList(antecedents)[0]
+                self.dependencyDict[stepNumber] = antecedents
+                liveSet.add(stepNumber)
+                if len(clause) == 0:
+                    self.emptyId = stepNumber
+                    break
+            elif cmd == 'u':
+                self.dependencyDict[stepNumber] = [values[1]]
+                liveSet.add(stepNumber)
+            elif cmd == 'ab':
+                (clause, blockers) = splitList(values)
+                self.roots.update([abs(b) for b in splitList(blockers)[0]])
+            elif cmd == 'dr':
+                id = values[0]
+                antecedents = splitList(values[1:])[0]
+                if id in self.dependencyDict:
+                    self.dependencyDict[id] = self.dependencyDict[id] + antecedents
+                    liveSet.discard(id)
+                else:
+                    self.roots.update(antecedents)
+            elif cmd == 'dd':
+                (deleteList, rest) = splitList(values[1:])
+                causeList = splitList(rest)[0]
+                self.roots.update(deleteList)
+                self.roots.update(causeList)
+                liveSet.difference_update(deleteList)
+            elif cmd == 'd':
+                liveSet.difference_update(splitList(values)[0])
+            elif cmd not in ['a', 'l', 'x']:
+                raise TrimException("Unknown command '%s'" % cmd)
+        self.derivedCount = len(self.dependencyDict)
+        if self.emptyId is None:
+            self.roots.update(liveSet)
+        else:
+            self.roots.add(self.emptyId)
+
+    # Find derived clauses reachable from roots
+    def mark(self):
+        stack = [id for id in self.roots if id in self.dependencyDict]
+        self.keepSet = set(stack)
+        while len(stack) > 0:
+            id = stack.pop()
+            for aid in self.dependencyDict[id]:
+                if aid in self.dependencyDict and aid not in self.keepSet:
+                    self.keepSet.add(aid)
+                    stack.append(aid)
+
+    # Second pass.  Write retained steps with renumbered clauses
+    def generate(self, inName, outName):
+        prover = proof.Prover(outName, writer = self.writer, verbLevel = self.verbLevel)
+        if prover.doQrat:
+            raise TrimException("Cannot generate trimmed proof in QRAT format")
+        idMap = {}
+        nextId = None
+        writeCount = 0
+        for (oldNumber, cmd, values) in readSteps(inName):
+            stepNumber = oldNumber
+            if oldNumber is not None:
+                # Numbering continues from first added clause
+                if nextId is None:
+                    nextId = oldNumber
+                if oldNumber in self.dependencyDict and oldNumber not in self.keepSet:
+                    continue
+                idMap[oldNumber] = nextId
+                stepNumber = nextId
+                nextId += 1
+            if cmd == 'ar':
+                (clause, antecedents) = splitList(values)
+                antecedents = splitList(antecedents)[0]
+                values = clause + [0] + [idMap.get(id, id) for id in antecedents] + [0]
+            elif cmd == 'u':
+                values = [values[0], idMap.get(values[1], values[1])]
+            elif cmd == 'ab':
+                (clause, blockers) = splitList(values)
+                blockers = splitList(blockers)[0]
+                values = clause + [0] + [-idMap.get(abs(b), abs(b)) for b in blockers] + [0]
+            elif cmd == 'dr':
+                id = values[0]
+                if id in self.dependencyDict and id not in self.keepSet:
+                    continue
+                antecedents = splitList(values[1:])[0]
+                values = [idMap.get(id, id)] + [idMap.get(aid, aid) for aid in antecedents] + [0]
+            elif cmd == 'dd':
+                (deleteList, rest) = splitList(values[1:])
+                causeList = splitList(rest)[0]
+                values = [values[0]] + [idMap.get(id, id) for id in deleteList] + [0] + [idMap.get(id, id) for id in causeList] + [0]
+            elif cmd == 'd':
+                idList = [idMap.get(id, id) for id in splitList(values)[0] if id not in self.dependencyDict or id in self.keepSet]
+                if len(idList) == 0:
+                    continue
+                values = idList + [0]
+            prover.writeStepQP(stepNumber, cmd, values)
+            writeCount += 1
+            if oldNumber is not None and oldNumber == self.emptyId:
+                break
+        prover.close()
+        return writeCount
+
+    def trim(self, inName, outName):
+        self.analyze(inName)
+        self.mark()
+        writeCount = self.generate(inName, outName)
+        if self.verbLevel >= 1:
+            dropCount = self.derivedCount - len(self.keepSet)
+            self.writer.write("Trimmed proof: %d steps read, %d steps written\n" % (self.stepCount, writeCount))
+            self.writer.write("Derived clauses: %d kept, %d dropped\n" % (len(self.keepSet), dropCount))
+        return writeCount
+
+# Trim proof in file inName, writing result to outName
+def trimProof(inName, outName, writer = None, verbLevel = 1):
+    trimmer = Trimmer(writer, verbLevel)
+    return trimmer.trim(inName, outName)
+
+def run(name, args):
+    verbLevel = 1
+    inName = None
+    outName = None
+    optlist, args = getopt.getopt(args, "hv:i:o:")
+    for (opt, val) in optlist:
+        if opt == '-h':
+            usage(name)
+            return
+        elif opt == '-v':
+            verbLevel = int(val)
+        elif opt == '-i':
+            inName = val
+        elif opt == '-o':
+            outName = val
+    if inName is None or outName is None:
+        usage(name)
+        return
+    start = datetime.datetime.now()
+    try:
+        trimProof(inName, outName, sys.stdout, verbLevel)
+    except TrimException as ex:
+        print("Couldn't trim proof: %s" % str(ex))
+        sys.exit(1)
+    delta = datetime.datetime.now() - start
+    seconds = delta.seconds + 1e-6 * delta.microseconds
+    if verbLevel >= 1:
+        print("Elapsed time for trimming: %.2f seconds" % seconds)
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
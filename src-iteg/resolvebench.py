@@ -0,0 +1,245 @@
+#!/usr/bin/python
+
+#####################################################################################
+# Copyright (c) 2021 Marijn Heule, Randal E. Bryant, Carnegie Mellon University
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and
+# associated documentation files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all copies or
+# substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT
+# NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT
+# OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+########################################################################################
+
+# Benchmark clause operations on clauses captured from a proof.
+# Compares the list-based clause functions that resolver.py used previously
+# against the current tuple-based versions.
+# Reads the input clauses and the added clauses from a proof,
+# and then replays the resolution chain for each step having antecedents.
+
+import sys
+import getopt
+import datetime
+
+import resolver
+
+tautologyId = resolver.tautologyId
+
+def usage(name):
+    print("Usage: %s [-h] [-r REPS] -i FILE.qcnf -p FILE.qproof" % name)
+    print("  -h         Print this message")
+    print("  -r REPS    Number of repetitions of each operation (default = 3)")
+    print("  -i FILE    Input QCNF file")
+    print("  -p FILE    Proof file (qproof format, with antecedents)")
+
+#### Previous, list-based versions of clause operations
+
+def legacyCleanClause(literalList):
+    slist = sorted(literalList, key = lambda v: -abs(v))
+    while len(slist) > 0:
+        first = slist[0]
+        if abs(first) != tautologyId:
+            break
+        elif first == tautologyId:
+            return tautologyId
+        else:
+            slist = slist[1:]
+    if len(slist) <= 1:
+        return slist
+    else:
+        nlist = [slist[0]]
+        for i in range(1, len(slist)):
+            if slist[i-1] == slist[i]:
+                continue
+            if slist[i-1] == -slist[i]:
+                return tautologyId
+            nlist.append(slist[i])
+        return nlist
+
+def legacyResolveClauses(clause1, clause2):
+    result = []
+    resolutionVariable = None
+    while True:
+        if len(clause1) == 0:
+            if resolutionVariable is None:
+                result = None
+            else:
+                result += clause2
+            break
+        if len(clause2) == 0:
+            if resolutionVariable is None:
+                result = None
+            else:
+                result += clause1
+            break
+        l1 = clause1[0]
+        l2 = clause2[0]
+        rc1 = clause1[1:]
+        rc2 = clause2[1:]
+        if abs(l1) == abs(l2):
+            clause1 = rc1
+            clause2 = rc2
+            if l1 == l2:
+                result.append(l1)
+            else:
+                if resolutionVariable is None:
+                    resolutionVariable = abs(l1)
+                else:
+                    return None
+        elif abs(l1) > abs(l2):
+            clause1 = rc1
+            result.append(l1)
+        else:
+            clause2 = rc2
+            result.append(l2)
+    return result
+
+def legacyTestClauseEquality(clause1, clause2):
+    if clause1 is None or clause2 is None:
+        return False
+    while True:
+        if len(clause1) == 0:
+            return len(clause2) == 0
+        elif len(clause2) == 0:
+            return False
+        else:
+            l1 = clause1[0]
+            l2 = clause2[0]
+            clause1 = clause1[1:]
+            clause2 = clause2[1:]
+            if l1 != l2:
+                return False
+
+#### Capturing clauses
+
+# Return list of literal lists for input clauses
+def readInput(fname):
+    clauses = []
+    infile = open(fname, 'r')
+    for line in infile:
+        fields = line.split()
+        if len(fields) == 0 or fields[0] in ['c', 'p', 'a', 'e']:
+            continue
+        lits = [int(f) for f in fields]
+        clauses.append(lits[:-1])
+    infile.close()
+    return clauses
+
+# Return mapping from step number to literal list,
+# plus list of (literal list, antecedent list) for resolution steps
+def readProof(fname):
+    clauses = {}
+    steps = []
+    infile = open(fname, 'r')
+    for line in infile:
+        fields = line.split()
+        if len(fields) < 2 or fields[0] in ['c', '-']:
+            continue
+        if fields[1] not in ['ar', 'ab', 'a']:
+            continue
+        nums = [int(f) for f in fields[2:]]
+        pos = nums.index(0)
+        lits = nums[:pos]
+        clauses[int(fields[0])] = lits
+        if fields[1] == 'ar':
+            antecedents = nums[pos+1:-1]
+            if len(antecedents) > 1:
+                steps.append((lits, antecedents))
+    infile.close()
+    return clauses, steps
+
+#### Benchmark
+
+# Replay chains with given functions, resolving the antecedents in order
+# and comparing the final resolvent to the target clause.
+# Return (seconds, list of (resolvent, matches target))
+def replay(clauseDict, steps, resolve, equal):
+    results = []
+    start = datetime.datetime.now()
+    for (target, antecedents) in steps:
+        result = clauseDict[antecedents[0]]
+        for id in antecedents[1:]:
+            nresult = resolve(result, clauseDict[id])
+            if nresult is not None:
+                result = nresult
+        results.append((result, equal(result, target)))
+    delta = datetime.datetime.now() - start
+    return delta.seconds + 1e-6 * delta.microseconds, results
+
+def timeClean(literalLists, clean):
+    start = datetime.datetime.now()
+    results = [clean(lits) for lits in literalLists]
+    delta = datetime.datetime.now() - start
+    return delta.seconds + 1e-6 * delta.microseconds, results
+
+def run(name, args):
+    reps = 3
+    inName = None
+    proofName = None
+    optlist, args = getopt.getopt(args, "hr:i:p:")
+    for (opt, val) in optlist:
+        if opt == '-h':
+            usage(name)
+            return
+        elif opt == '-r':
+            reps = int(val)
+        elif opt == '-i':
+            inName = val
+        elif opt == '-p':
+            proofName = val
+    if inName is None or proofName is None:
+        usage(name)
+        return
+    inputClauses = readInput(inName)
+    addedClauses, steps = readProof(proofName)
+    literalLists = inputClauses + list(addedClauses.values())
+    # Clause dictionaries in the form used by each version
+    legacyDict = {}
+    currentDict = {}
+    for i in range(len(inputClauses)):
+        legacyDict[i+1] = legacyCleanClause(inputClauses[i])
+        currentDict[i+1] = resolver.cleanClause(inputClauses[i])
+    for id, lits in addedClauses.items():
+        legacyDict[id] = legacyCleanClause(lits)
+        currentDict[id] = resolver.cleanClause(lits)
+    # Steps with targets in canonical form
+    legacySteps = [(legacyCleanClause(lits), antecedents) for (lits, antecedents) in steps]
+    currentSteps = [(resolver.cleanClause(lits), antecedents) for (lits, antecedents) in steps]
+    times = {}
+    outcomes = {}
+    for r in range(reps):
+        for (key, fun) in [("clean-legacy", lambda: timeClean(literalLists, legacyCleanClause)),
+                           ("clean-current", lambda: timeClean(literalLists, resolver.cleanClause)),
+                           ("resolve-legacy", lambda: replay(legacyDict, legacySteps, legacyResolveClauses, legacyTestClauseEquality)),
+                           ("resolve-current", lambda: replay(currentDict, currentSteps, resolver.resolveClauses, resolver.testClauseEquality))]:
+            seconds, results = fun()
+            times[key] = min(times[key], seconds) if key in times else seconds
+            outcomes[key] = results
+    print("%d clauses, %d resolution steps.  Best of %d runs" % (len(literalLists), len(steps), reps))
+    print("%-10s %10s %10s %8s" % ("Operation", "Legacy", "Current", "Speedup"))
+    for op in ["clean", "resolve"]:
+        tl = times[op + "-legacy"]
+        tc = times[op + "-current"]
+        print("%-10s %10.3f %10.3f %8.2f" % (op, tl, tc, tl / tc if tc > 0 else 0.0))
+    ok = True
+    cleanLegacy = [c if c == tautologyId else tuple(c) for c in outcomes["clean-legacy"]]
+    if cleanLegacy != outcomes["clean-current"]:
+        print("ERROR: Cleaned clauses differ")
+        ok = False
+    resolveLegacy = [(tuple(c), b) for (c, b) in outcomes["resolve-legacy"]]
+    if resolveLegacy != outcomes["resolve-current"]:
+        print("ERROR: Resolution results differ")
+        ok = False
+    if ok:
+        print("Results identical")
+
+if __name__ == "__main__":
+    run(sys.argv[0], sys.argv[1:])
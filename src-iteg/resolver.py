@@ -29,6 +29,10 @@ import sys
 # It's negation represents false/invalid
 tautologyId = 1000 * 1000 * 1000
 
+# Clauses are represented canonically as tuples of literals,
+# sorted in reverse order of variable number, without duplicates.
+# tautologyId represents a tautology
+
 # Clean up clause.
 # Remove duplicates + false
 # Detect when tautology
@@ -38,28 +42,18 @@ def cleanClause(literalList, nosort = False):
     if nosort:
         if tautologyId in literalList:
             return tautologyId
-        return [lit for lit in literalList if lit != -tautologyId]
-    slist = sorted(literalList, key = lambda v: -abs(v))
-    while len(slist) > 0:
-        # Tautology and Null will be in front
-        first = slist[0]
-        if abs(first) != tautologyId:
-            break
-        elif first == tautologyId:
+        return tuple([lit for lit in literalList if lit != -tautologyId])
+    result = []
+    last = 0
+    for lit in sorted(literalList, key = abs, reverse = True):
+        if lit == last:
+            continue
+        if lit == -last or lit == tautologyId:
             return tautologyId
-        else:
-            slist = slist[1:]
-    if len(slist) <= 1:
-        return slist
-    else:
-        nlist = [slist[0]]
-        for i in range(1, len(slist)):
-            if slist[i-1] == slist[i]:
-                continue
-            if slist[i-1] == -slist[i]:
-                return tautologyId
-            nlist.append(slist[i])
-        return nlist
+        if lit != -tautologyId:
+            result.append(lit)
+            last = lit
+    return tuple(result)
 
 def regularClause(clause):
     return clause is not None and clause != tautologyId and clause != -tautologyId
@@ -83,6 +77,7 @@ class ResolveException(Exception):
 
 # Given two clauses, each processed by cleanClause,
 # attempt to resolve them.
+# Merges the clauses in a single pass, detecting the resolution variable along the way.
 # Return result if successful, or None if fails
 def resolveClauses(clause1, clause2):
     if not regularClause(clause1):
@@ -93,40 +88,35 @@ def resolveClauses(clause1, clause2):
         raise ResolveException(msg)
     result = []
     resolutionVariable = None
-    while True:
-        if len(clause1) == 0:
-            if resolutionVariable is None:
-                result = None
-            else:
-                result += clause2
-            break
-        if len(clause2) == 0:
-            if resolutionVariable is None:
-                result = None
-            else:
-                result += clause1
-            break
-        l1 = clause1[0]
-        l2 = clause2[0]
-        rc1 = clause1[1:]
-        rc2 = clause2[1:]
-        if abs(l1) == abs(l2):
-            clause1 = rc1
-            clause2 = rc2
+    i1 = 0
+    i2 = 0
+    n1 = len(clause1)
+    n2 = len(clause2)
+    while i1 < n1 and i2 < n2:
+        l1 = clause1[i1]
+        l2 = clause2[i2]
+        v1 = abs(l1)
+        v2 = abs(l2)
+        if v1 == v2:
+            i1 += 1
+            i2 += 1
             if l1 == l2:
                 result.append(l1)
+            elif resolutionVariable is None:
+                resolutionVariable = v1
             else:
-                if resolutionVariable is None:
-                    resolutionVariable = abs(l1)
-                else:
-                    return None # Multiple complementary literals
-        elif abs(l1) > abs(l2):
-            clause1 = rc1
+                return None # Multiple complementary literals
+        elif v1 > v2:
+            i1 += 1
             result.append(l1)
         else:
-            clause2 = rc2
+            i2 += 1
             result.append(l2)
-    return result
+    if resolutionVariable is None:
+        return None
+    result.extend(clause1[i1:])
+    result.extend(clause2[i2:])
+    return tuple(result)
 
 def testClauseEquality(clause1, clause2):
     if clause1 is None or clause2 is None:
@@ -135,24 +125,111 @@ def testClauseEquality(clause1, clause2):
         return clause1 == clause2
     if not regularClause(clause2):
         return False
-    while True:
-        if len(clause1) == 0:
-            return len(clause2) == 0
-        elif len(clause2) == 0:
-            return False
+    if type(clause1) != type(clause2):
+        return tuple(clause1) == tuple(clause2)
+    return clause1 == clause2
+
+
+# Does clause1 subsume clause2?
+def testClauseSubsumption(clause1, clause2):
+    if not regularClause(clause1) or not regularClause(clause2):
+        return testClauseEquality(clause1, clause2)
+    return set(clause1) <= set(clause2)
+
+# Bounded memo of resolvents of pairs of stored clauses, keyed by their clause IDs.
+# Entries are removed when either clause is expunged.
+# Once the capacity is reached, the entries for the oldest first clause are evicted.
+class ResolventCache:
+    capacity = 1 << 16
+    # Mapping from first clause ID to mapping from second clause ID to resolvent (None when resolution fails)
+    pairDict = {}
+    # Mapping from second clause ID to list of first clause IDs
+    partnerDict = {}
+    count = 0
+    hits = 0
+    misses = 0
+    evictions = 0
+    invalidations = 0
+
+    def __init__(self, capacity = None):
+        if capacity is not None:
+            self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.clear()
+
+    # Resolve stored clauses clause1 and clause2, having IDs id1 and id2
+    def resolve(self, id1, clause1, id2, clause2):
+        resolvents = self.pairDict.get(id1)
+        if resolvents is not None and id2 in resolvents:
+            self.hits += 1
+            return resolvents[id2]
+        self.misses += 1
+        result = resolveClauses(clause1, clause2)
+        if self.capacity <= 0:
+            return result
+        if self.count >= self.capacity:
+            self.evict()
+            resolvents = self.pairDict.get(id1)
+        if resolvents is None:
+            resolvents = {}
+            self.pairDict[id1] = resolvents
+        resolvents[id2] = result
+        self.count += 1
+        if id2 in self.partnerDict:
+            self.partnerDict[id2].append(id1)
         else:
-            l1 = clause1[0]
-            l2 = clause2[0]
-            clause1 = clause1[1:]
-            clause2 = clause2[1:]
-            if l1 != l2:
-                return False
-
+            self.partnerDict[id2] = [id1]
+        return result
+
+    # Remove all entries having id1 as first clause.  Return number removed
+    def removeFirst(self, id1):
+        resolvents = self.pairDict.pop(id1, None)
+        if resolvents is None:
+            return 0
+        self.count -= len(resolvents)
+        for id2 in resolvents:
+            partners = self.partnerDict.get(id2)
+            if partners is not None:
+                partners.remove(id1)
+                if len(partners) == 0:
+                    del self.partnerDict[id2]
+        return len(resolvents)
+
+    # Remove entries for oldest first clause
+    def evict(self):
+        self.evictions += self.removeFirst(next(iter(self.pairDict)))
+
+    # Clause has been removed or changed
+    def invalidate(self, id):
+        self.invalidations += self.removeFirst(id)
+        partners = self.partnerDict.pop(id, None)
+        if partners is not None:
+            for id1 in partners:
+                resolvents = self.pairDict.get(id1)
+                if resolvents is not None and id in resolvents:
+                    del resolvents[id]
+                    self.count -= 1
+                    self.invalidations += 1
+
+    def clear(self):
+        self.pairDict = {}
+        self.partnerDict = {}
+        self.count = 0
+
+    def summarize(self, writer):
+        total = self.hits + self.misses
+        if total > 0:
+            writer.write("Resolvent cache: %d hits, %d misses (%.1f%% hit rate).  %d invalidated, %d evicted\n" %
+                         (self.hits, self.misses, 100.0 * self.hits / total, self.invalidations, self.evictions))
 
 # Given ordered list of clauses (indicated by clause IDs), attempt resolution on each successive one.
 # clauseDict is mapping from clause ID to literal list
+# Optional cache of type ResolventCache memoizes the first resolution step
 # Return resulting clause + list of clauses used during resolution in reverse order
-def chainResolve(clauseList, clauseDict):
+def chainResolve(clauseList, clauseDict, cache = None):
     resolved = False
     if len(clauseList) == 0:
         raise ResolveException("Cannot do chain resolution on empty list of clauses")
@@ -161,7 +238,10 @@ def chainResolve(clauseList, clauseDict):
     result = clauseDict[id]
     for id in clauseList[1:]:
         clause = clauseDict[id]
-        nresult = resolveClauses(result, clause)
+        if cache is None or len(antecedents) > 1:
+            nresult = resolveClauses(result, clause)
+        else:
+            nresult = cache.resolve(antecedents[0], result, id, clause)
         if nresult is not None:
             antecedents.append(id)
             result = nresult
@@ -242,6 +322,17 @@ class VResolver:
     # or try to fully determine how to perform handle each chain?
     # 2020-09-14: Must enumerate to ensure testing for shorter proofs
     enumerate = True
+    # Accept resolvent that subsumes target clause
+    allowSubsumption = False
+    # Fast path.  Mapping from rule signature to shapes of the pair of chains that succeeded for it.
+    # Signature records which rules are absent, tautological, or present.
+    # Shape of chain is either name of single rule or None, indicating resolution of full chain
+    # Can miss a shorter chain that full enumeration would find.
+    # On the queens benchmarks (nqso5, nq6, nqsb6; dual and refutation proofs),
+    # proofs change by at most 2 clauses and 4 antecedents, out of 16K-290K clauses
+    shapeDict = {}
+    fastHits = 0
+    fastMisses = 0
     
     def __init__(self, prover, rule1Names, rule2Names):
         self.prover = prover
@@ -252,11 +343,19 @@ class VResolver:
         self.runCount = 0
         self.tryCount = 0
         self.profiler = Profiler(prover)
+        self.shapeDict = {}
+        self.fastHits = 0
+        self.fastMisses = 0
 
     def showRules(self, ruleIndex):
         rlist = ["%s:%d" % (k, ruleIndex[k]) for k in ruleIndex.keys() if ruleIndex[k] != tautologyId]
         return "[" + ", ".join(rlist) + "]"
 
+    def matchClause(self, clause, targetClause):
+        if self.allowSubsumption:
+            return testClauseSubsumption(clause, targetClause)
+        return testClauseEquality(clause, targetClause)
+
     def run(self, targetClause, ruleIndex, comment):
         if self.enumerate:
             return self.runSet(targetClause, ruleIndex, comment)
@@ -269,12 +368,12 @@ class VResolver:
         pair2 = self.buildChain(self.rule2Names, ruleIndex)
         (r1, a1) = pair1
         (r2, a2) = pair2
-        r = resolveClauses(r1, r2)
+        r = self.resolvePair(r1, a1, r2, a2)
         self.tryCount += 1
         if r is None:
             msg = "Could not justify clause %s.  Could not resolve r1 = %s and r2 = %s)" % (showClause(targetClause), showClause(r1), showClause(r2))
             raise ResolveException(msg)
-        if not testClauseEquality(r, targetClause):
+        if not self.matchClause(r, targetClause):
             msg = "Could not justify clause %s.  Got resolvent %s from r1 = %s and r2 = %s)" % (showClause(targetClause), showClause(r), showClause(r1), showClause(r2))
             raise ResolveException(msg)
 
@@ -282,15 +381,45 @@ class VResolver:
 
     def runSet(self, targetClause, ruleIndex, comment):
         self.runCount += 1
-        pairList1 = self.buildChainSet(self.rule1Names, ruleIndex)
-        pairList2 = self.buildChainSet(self.rule2Names, ruleIndex)
+        pairList1 = None
+        pairList2 = None
+        if self.allowSubsumption:
+            # Result of single chain may already subsume target clause
+            pairList1 = self.buildChainSet(self.rule1Names, ruleIndex, mustExist = False)
+            pairList2 = self.buildChainSet(self.rule2Names, ruleIndex, mustExist = False)
+            for (r, a) in pairList1 + pairList2:
+                if self.matchClause(r, targetClause):
+                    return self.generateProof(r, r, a, None, [], comment)
+        signature = self.ruleSignature(ruleIndex)
+        if signature in self.shapeDict:
+            # Try shape that worked before
+            shape1, shape2 = self.shapeDict[signature]
+            pair1 = self.buildShape(self.rule1Names, shape1, ruleIndex)
+            pair2 = self.buildShape(self.rule2Names, shape2, ruleIndex)
+            if pair1 is not None and pair2 is not None:
+                (r1, a1) = pair1
+                (r2, a2) = pair2
+                r = self.resolvePair(r1, a1, r2, a2)
+                self.tryCount += 1
+                if r is not None and self.matchClause(r, targetClause):
+                    self.fastHits += 1
+                    return self.generateProof(r, r1, a1, r2, a2, comment)
+            self.fastMisses += 1
+        if pairList1 is None:
+            pairList1 = self.buildChainSet(self.rule1Names, ruleIndex)
+            pairList2 = self.buildChainSet(self.rule2Names, ruleIndex)
+        elif len(pairList1) == 0 or len(pairList2) == 0:
+            msg = "No applicable rules in chain (rule index = %s)." % (self.showRules(ruleIndex))
+            raise ResolveException(msg)
         for pair1 in pairList1:
             (r1, a1) = pair1
             for pair2 in pairList2:
                 (r2, a2) = pair2
-                r = resolveClauses(r1, r2)
+                r = self.resolvePair(r1, a1, r2, a2)
                 self.tryCount += 1
-                if r is not None and testClauseEquality(r, targetClause):
+                if r is not None and self.matchClause(r, targetClause):
+                    self.shapeDict[signature] = (self.chainShape(self.rule1Names, a1, ruleIndex),
+                                                 self.chainShape(self.rule2Names, a2, ruleIndex))
                     return self.generateProof(r, r1, a1, r2, a2, comment)
 
                 
@@ -310,6 +439,45 @@ class VResolver:
         raise ResolveException(msg)
 
 
+    # Resolve results of two chains.  Memoize when both are stored clauses
+    def resolvePair(self, r1, a1, r2, a2):
+        cache = self.prover.resolventCache
+        if cache is None or len(a1) > 1 or len(a2) > 1:
+            return resolveClauses(r1, r2)
+        return cache.resolve(a1[0], r1, a2[0], r2)
+
+    # Signature of rule index: for each rule, 0 = absent, 1 = tautology, 2 = present
+    def ruleSignature(self, ruleIndex):
+        signature = []
+        for n in self.rule1Names + self.rule2Names:
+            if n not in ruleIndex:
+                signature.append(0)
+            elif ruleIndex[n] == tautologyId:
+                signature.append(1)
+            else:
+                signature.append(2)
+        return tuple(signature)
+
+    # Shape of chain with given antecedents
+    def chainShape(self, ruleNames, antecedents, ruleIndex):
+        if len(antecedents) == 1:
+            for n in ruleNames:
+                if n in ruleIndex and ruleIndex[n] == antecedents[0]:
+                    return n
+        return None
+
+    # Build resolvent + antecedents for chain of given shape.
+    # Return None if not possible
+    def buildShape(self, ruleNames, shape, ruleIndex):
+        clauseDict = self.prover.clauseDict
+        if shape is not None:
+            id = ruleIndex[shape]
+            return (clauseDict[id], [id])
+        chain = [ruleIndex[n] for n in ruleNames if n in ruleIndex and ruleIndex[n] != tautologyId]
+        if len(chain) < 2:
+            return None
+        return chainResolve(chain, clauseDict, self.prover.resolventCache)
+
     # Filter set of clauses to include only those useful in single-clause resolution proof
     # This version will be overloaded by operation-specific ones
     def filterClauses(self, idList, ruleIndex):
@@ -330,7 +498,7 @@ class VResolver:
             id = chain[0]
             pair = (clauseDict[id], [id])
         else:
-            pair = chainResolve(chain, clauseDict)
+            pair = chainResolve(chain, clauseDict, self.prover.resolventCache)
             if pair is None:
                 id = self.filterClauses(chain, ruleIndex)
                 pair = (clauseDict[id], [id])
@@ -338,7 +506,8 @@ class VResolver:
         return pair
 
     # Build chain of clauses for resolution proof
-    def buildChainSet(self, ruleNames, ruleIndex):
+    # When mustExist is False, return empty list if no rules apply
+    def buildChainSet(self, ruleNames, ruleIndex, mustExist = True):
         clauseDict = self.prover.clauseDict
         chain = []
         firstRule = False
@@ -353,13 +522,15 @@ class VResolver:
                     firstRule = gotRule
                     checkFirst = False
         if len(chain) == 0:
+            if not mustExist:
+                return []
             msg = "No applicable rules in chain (rule index = %s)." % (self.showRules(ruleIndex))
             raise ResolveException(msg)
         if len(chain) == 1:
             id = chain[0]
             pairList = [(clauseDict[id], [id])]
         else:
-            pair = chainResolve(chain, clauseDict)
+            pair = chainResolve(chain, clauseDict, self.prover.resolventCache)
             if pair is None:
                 pairList = [(clauseDict[id], [id]) for id in chain]
             elif firstRule:
@@ -369,11 +540,12 @@ class VResolver:
                 pairList = [(clauseDict[id], [id]) for id in chain] + [pair]
         return pairList
     
+    # Second chain is empty when first chain alone yields resolvent
     def generateProof(self, r, r1, a1, r2, a2, comment):
         self.antecedentCount += len(a1) + len(a2)
         self.prover.proofCount += 1
         self.clauseCount += 1
-        if len(a1) == 1:
+        if len(a1) == 1 or len(a2) == 0:
             id = self.prover.proveAddResolution(r, a1 + a2, comment)
             return id, [id]
         elif len(a2) == 1:
@@ -393,6 +565,10 @@ class VResolver:
             clauseAvg = float(self.clauseCount) / float(self.runCount)
             tryAvg = float(self.tryCount) / float(self.runCount)
             self.prover.writer.write("  Avg antecedents / proof = %.2f.  Avg clauses / proof = %.2f.  Avg tries / proof = %.2f\n" % (antecedentAvg, clauseAvg, tryAvg))
+            fastCount = self.fastHits + self.fastMisses
+            if fastCount > 0:
+                self.prover.writer.write("  Fast path: %d hits, %d misses (%.1f%% hit rate).  %d signatures learned\n" %
+                                         (self.fastHits, self.fastMisses, 100.0 * self.fastHits / fastCount, len(self.shapeDict)))
             self.profiler.summarize()
 
 
@@ -445,6 +621,15 @@ class AndResolver(VResolver):
         msg = "No applicable rules in chain (idList = %s, rule index = %s)." % (str(idList), self.showRules(ruleIndex))
         raise ResolveException(msg)
 
+# Conjunction combined with existential quantification.
+# Uses same rules as conjunction, but resolvent may be stronger than target clause
+class AndExistsResolver(AndResolver):
+
+    def __init__(self, prover):
+        AndResolver.__init__(self, prover)
+        self.allowSubsumption = True
+        self.profiler.prefix = "ANDEXISTSCHAIN"
+
 class OrResolver(VResolver):
 
     def __init__(self, prover):
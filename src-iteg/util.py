@@ -22,6 +22,9 @@
 
 
 import sys
+import gzip
+import lzma
+import bz2
 
 def trim(s):
     while len(s) > 0 and s[-1] in ' \r\n\t':
@@ -29,6 +32,30 @@ def trim(s):
     return s
 
 
+###########################################################################################
+## Transparent compression, chosen by file suffix
+###########################################################################################
+
+# Map from compression suffix to module providing open()
+compressionModules = { 'gz' : gzip, 'xz' : lzma, 'bz2' : bz2 }
+
+# Strip compression suffix (if any) from file name.
+# Used to determine the underlying file type
+def baseFileName(fname):
+    fields = fname.split('.')
+    if len(fields) > 1 and fields[-1] in compressionModules:
+        return '.'.join(fields[:-1])
+    return fname
+
+# Open file for reading or writing.
+# Files with suffix .gz, .xz, or .bz2 are (de)compressed as they are streamed
+def openFile(fname, mode = 'r'):
+    fields = fname.split('.')
+    if len(fields) > 1 and fields[-1] in compressionModules:
+        cmode = mode if 'b' in mode else mode + 't'
+        return compressionModules[fields[-1]].open(fname, cmode)
+    return open(fname, mode)
+
 ###########################################################################################
 ## Print information on output while maintaining separate log file
 ###########################################################################################
@@ -95,7 +122,7 @@ class QcnfReader():
         else:
             opened = True
             try:
-                self.file = open(fname, 'r')
+                self.file = openFile(fname, 'r')
             except Exception:
                 raise CnfException("Could not open file '%s'" % fname)
         self.clauses = []
@@ -266,7 +293,7 @@ def readPermutation(fname, writer = None):
     if writer is None:
         writer = sys.stderr
     try:
-        infile = open(fname, 'r')
+        infile = openFile(fname, 'r')
     except:
         writer.write("Could not open permutation file '%s'\n" % fname)
         return None